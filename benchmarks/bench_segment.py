@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the run time and line counts of the segmentation engines.
+
+Usage:
+
+    python benchmarks/bench_segment.py [-n REPEAT] [IMAGE...]
+
+Images default to the bi-level test page shipped with the tests.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import time
+import click
+
+from PIL import Image
+
+from kraken import pageseg
+
+thisfile = os.path.abspath(os.path.dirname(__file__))
+default_image = os.path.join(thisfile, '..', 'tests', 'resources', 'bw.png')
+
+ENGINES = [('ocropus', pageseg.segment),
+           ('projection', pageseg.segment_projection)]
+
+
+@click.command()
+@click.option('-n', '--repeat', default=3, type=click.INT,
+              help='Number of runs per image and engine. The fastest is '
+              'reported.')
+@click.argument('images', nargs=-1, type=click.Path(exists=True))
+def cli(repeat, images):
+    if not images:
+        images = [default_image]
+    click.echo('{:<30} {:<12} {:>6} {:>10}'.format('image', 'engine', 'lines',
+                                                   'time [s]'))
+    for path in images:
+        im = Image.open(path)
+        im.load()
+        for name, fn in ENGINES:
+            best = None
+            for _ in range(repeat):
+                st_time = time.time()
+                lines = fn(im)
+                elapsed = time.time() - st_time
+                best = elapsed if best is None else min(best, elapsed)
+            click.echo('{:<30} {:<12} {:>6} {:>10.4f}'.format(os.path.basename(path),
+                                                              name, len(lines),
+                                                              best))
+
+
+if __name__ == '__main__':
+    cli()
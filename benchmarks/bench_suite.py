@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the throughput and peak memory use of the main processing steps on
+synthetic pages and compares them against a stored baseline.
+
+Usage:
+
+    python benchmarks/bench_suite.py [-o results.json] [--baseline old.json]
+
+Pages of 1 to 50 megapixels are composed of lines rendered with
+kraken.linegen.LineGenerator so no external data is needed. Every benchmark
+runs in a freshly spawned process to measure its peak resident set size,
+which includes the interpreter and the setup of the benchmark, e.g.
+binarizing the page before segmenting it. Benchmarks whose dependencies are
+missing and recognition benchmarks without a model are skipped. Benchmarks
+raising an error are reported and the exit status is 1.
+
+With --baseline the exit status is 1 if the throughput of any benchmark
+dropped or its peak memory use grew by more than the given fractions.
+baseline.json next to this script contains the results of a reference run
+on scaled versions of tests/resources/input.jpg.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import os
+import sys
+import json
+import time
+import click
+import random
+import shutil
+import platform
+import resource
+import tempfile
+import importlib
+import multiprocessing
+
+import numpy as np
+
+from PIL import Image
+from collections import namedtuple
+from multiprocessing import cpu_count
+
+
+WORDS = (u'the quick brown fox jumps over lazy dog kraken recognizes text '
+         u'lines pages columns of printed books newspapers letters with '
+         u'many different fonts and sizes').split()
+
+# stand-in for kraken.rpred.ocr_record which requires the recognizer
+# dependencies
+Record = namedtuple('Record', 'prediction cuts confidences')
+
+
+class SkipBenchmark(Exception):
+    """
+    Raised by benchmarks whose dependencies are missing.
+    """
+
+
+def _import(name):
+    """
+    Imports a module, raising SkipBenchmark if it or its native libraries are
+    missing. linegen fails with AttributeError or OSError without cairo and
+    pango.
+    """
+    try:
+        return importlib.import_module(name)
+    except (ImportError, AttributeError, OSError) as e:
+        raise SkipBenchmark(u'{}: {}'.format(name, e))
+
+
+def synthetic_page(megapixels, seed=0, font_size=32):
+    """
+    Composes a greyscale page of about `megapixels` million pixels with an
+    A4 aspect ratio from lines rendered by LineGenerator. Pages wider than
+    4000 pixels are set in multiple columns.
+
+    Returns:
+        A tuple (PIL.Image, lines) with lines being a list of (text, (x0, y0,
+        x1, y1)) tuples.
+    """
+    linegen = _import('kraken.linegen')
+
+    rng = random.Random(seed)
+    gen = linegen.LineGenerator(font_size=font_size)
+    h = int((megapixels * 1e6 * 2 ** 0.5) ** 0.5)
+    w = int(megapixels * 1e6 / h)
+    page = Image.new('L', (w, h), 255)
+
+    # lines are assembled from a pool of rendered word groups as rendering
+    # every line of a 50 megapixel page takes far longer than the benchmarks
+    pool = []
+    for _ in range(64):
+        text = u' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        pool.append((text, gen.render_line(text)))
+    line_height = max(im.size[1] for _, im in pool)
+
+    margin = w // 20
+    columns = 1 + w // 4000
+    gutter = margin // 2
+    col_width = (w - 2 * margin - (columns - 1) * gutter) // columns
+    lines = []
+    for col in range(columns):
+        x0 = margin + col * (col_width + gutter)
+        y = margin
+        while y + line_height < h - margin:
+            x = x0
+            words = []
+            while True:
+                text, im = rng.choice(pool)
+                if x + im.size[0] > x0 + col_width:
+                    break
+                page.paste(im, (x, y))
+                words.append(text)
+                x += im.size[0]
+            if words:
+                lines.append((u' '.join(words), (x0, y, x, y + line_height)))
+            y += int(line_height * 1.3)
+
+    # uneven illumination and sensor noise for the binarization
+    nrng = np.random.RandomState(seed)
+    a = np.asarray(page, dtype=np.float32)
+    a *= np.linspace(0.95, 0.75, w, dtype=np.float32)
+    a += nrng.normal(0, 4, a.shape).astype(np.float32)
+    page = Image.fromarray(np.clip(a, 0, 255).astype('B'))
+    return page, lines
+
+
+def scaled_page(path, megapixels):
+    """
+    Scales an existing page image to about `megapixels` million pixels.
+    """
+    im = Image.open(path).convert('L')
+    factor = (megapixels * 1e6 / (im.size[0] * im.size[1])) ** 0.5
+    return im.resize((int(im.size[0] * factor), int(im.size[1] * factor)),
+                     Image.LANCZOS)
+
+
+def records(lines):
+    """
+    Creates recognition records for lines with the characters evenly spaced
+    over the line.
+    """
+    res = []
+    for text, (x0, y0, x1, y1) in lines:
+        step = (x1 - x0) / max(len(text), 1)
+        cuts = [(int(x0 + i * step), y0, int(x0 + (i + 1) * step), y1)
+                for i in range(len(text))]
+        res.append(Record(text, cuts, [1.0] * len(text)))
+    return res
+
+
+def _load(path):
+    im = Image.open(path)
+    im.load()
+    return im
+
+
+def _page_lines(path, lines):
+    """
+    Returns the lines of a page, segmenting it if no lines are known.
+    """
+    if lines is not None:
+        return lines
+    from kraken import binarization, pageseg
+    bounds = pageseg.segment(binarization.nlbin(_load(path)))
+    return [(u' '.join(WORDS[:8]), box) for box in bounds]
+
+
+# Each benchmark takes a page, its lines (or None), and the options of the
+# suite and returns a function running the measured work, the amount of work,
+# and its unit.
+
+def bench_nlbin(path, lines, opts):
+    from kraken import binarization
+    im = _load(path)
+    mp = im.size[0] * im.size[1] / 1e6
+    return lambda: binarization.nlbin(im), mp, 'MP'
+
+
+def bench_nlbin_fast(path, lines, opts):
+    from kraken import binarization
+    im = _load(path)
+    mp = im.size[0] * im.size[1] / 1e6
+    return (lambda: binarization.nlbin(im, fast_background=True), mp, 'MP')
+
+
+def bench_segment(path, lines, opts):
+    from kraken import binarization, pageseg
+    im = binarization.nlbin(_load(path))
+    mp = im.size[0] * im.size[1] / 1e6
+    return lambda: pageseg.segment(im), mp, 'MP'
+
+
+def bench_hocr(path, lines, opts):
+    from kraken import html
+    recs = records(_page_lines(path, lines))
+    im = Image.open(path)
+    return (lambda: html.hocr(recs, u'page.png', im.size), len(recs),
+            'lines')
+
+
+def _bench_rpred(model, path, lines, opts):
+    from kraken import binarization
+    rpred = _import('kraken.rpred')
+    models = _import('kraken.lib.models')
+    net = models.load_any(model)
+    im = binarization.nlbin(_load(path))
+    bounds = [box for _, box in _page_lines(path, lines)][:opts['lines']]
+    return (lambda: [r for r in rpred.rpred(net, im, bounds)], len(bounds),
+            'lines')
+
+
+def bench_rpred_pronn(path, lines, opts):
+    if not opts['model']:
+        raise SkipBenchmark('no pronn model given')
+    return _bench_rpred(opts['model'], path, lines, opts)
+
+
+def bench_rpred_clstm(path, lines, opts):
+    if not opts['clstm_model']:
+        raise SkipBenchmark('no CLSTM model given')
+    return _bench_rpred(opts['clstm_model'], path, lines, opts)
+
+
+def bench_render_line(path, lines, opts):
+    linegen = _import('kraken.linegen')
+    gen = linegen.LineGenerator()
+    rng = random.Random(opts['seed'])
+    texts = [u' '.join(rng.choice(WORDS) for _ in range(8))
+             for _ in range(opts['lines'])]
+    return lambda: [gen.render_line(t) for t in texts], len(texts), 'lines'
+
+
+# benchmarks run on every page size and ones independent of the page size
+# run on the smallest page only.
+PAGE_BENCHMARKS = [('nlbin', bench_nlbin), ('nlbin_fast', bench_nlbin_fast),
+                   ('segment', bench_segment), ('hocr', bench_hocr)]
+LINE_BENCHMARKS = [('rpred.pronn', bench_rpred_pronn),
+                   ('rpred.clstm', bench_rpred_clstm),
+                   ('render_line', bench_render_line)]
+
+
+def _peak_rss():
+    """
+    Returns the peak resident set size of the process in MB.
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return rss / 2 ** 20
+    return rss / 2 ** 10
+
+
+def _measure(fn, path, lines, opts):
+    """
+    Runs a benchmark in a worker process and returns the fastest run time,
+    the amount of work, its unit, and the peak RSS of the process.
+    """
+    run, work, unit = fn(path, lines, opts)
+    best = None
+    for _ in range(opts['repeat']):
+        st_time = time.time()
+        run()
+        elapsed = time.time() - st_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best, work, unit, _peak_rss()
+
+
+def _pool():
+    """
+    Creates a single process pool. Spawned workers don't inherit the memory
+    of the suite, e.g. the composed pages, so their peak RSS only contains
+    the benchmark. Python 2 can only fork.
+    """
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('spawn').Pool(1)
+    return multiprocessing.Pool(1)
+
+
+def run_benchmark(name, fn, path, lines, size, opts):
+    """
+    Runs a benchmark in a fresh process.
+
+    Returns:
+        A dict describing the result. Benchmarks whose dependencies are
+        missing are described by their key and the reason in `skipped`,
+        failed ones by their key and the error in `error`.
+    """
+    key = name if size is None else u'{}@{:g}MP'.format(name, size)
+    pool = _pool()
+    try:
+        best, work, unit, rss = pool.apply(_measure, (fn, path, lines, opts))
+    except SkipBenchmark as e:
+        return {'key': key, 'skipped': u'{}'.format(e)}
+    except Exception as e:
+        return {'key': key, 'error': u'{}: {}'.format(type(e).__name__, e)}
+    finally:
+        pool.terminate()
+    return {'key': key, 'benchmark': name, 'size': size, 'time': best,
+            'work': work, 'unit': unit, 'throughput': work / best,
+            'peak_rss': rss}
+
+
+def compare(results, baseline, max_slowdown, max_rss_increase):
+    """
+    Compares results against a baseline.
+
+    Returns:
+        A list of (key, throughput ratio, RSS ratio, regressed) tuples for
+        all results contained in the baseline.
+    """
+    base = dict((r['key'], r) for r in baseline['results'])
+    res = []
+    for r in results:
+        if r['key'] not in base:
+            continue
+        b = base[r['key']]
+        speed = r['throughput'] / b['throughput']
+        rss = r['peak_rss'] / b['peak_rss']
+        res.append((r['key'], speed, rss, speed < 1 - max_slowdown or
+                    rss > 1 + max_rss_increase))
+    return res
+
+
+@click.command()
+@click.option('-o', '--output', type=click.Path(dir_okay=False),
+              help='Write the results as JSON to this file.')
+@click.option('--sizes', default='1,5,20,50',
+              help='Comma separated page sizes in megapixels.')
+@click.option('--only', multiple=True,
+              type=click.Choice([n for n, _ in PAGE_BENCHMARKS +
+                                 LINE_BENCHMARKS]),
+              help='Only run this benchmark. May be given multiple times.')
+@click.option('-n', '--repeat', default=3, type=click.IntRange(1, None),
+              help='Number of runs per benchmark. The fastest is reported.')
+@click.option('--lines', default=50, type=click.IntRange(1, None),
+              help='Number of lines recognized and rendered by the line '
+              'benchmarks.')
+@click.option('--model', default=None, type=click.Path(exists=True),
+              help='pronn model for rpred. Skipped if not given.')
+@click.option('--clstm-model', default=None, type=click.Path(exists=True),
+              help='CLSTM model for rpred. Skipped if not given.')
+@click.option('--image', default=None, type=click.Path(exists=True),
+              help='Scale this page image instead of composing synthetic '
+              'pages.')
+@click.option('--seed', default=0, type=click.INT)
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False),
+              help='JSON results of a previous run to compare against.')
+@click.option('--max-slowdown', default=0.1, type=click.FLOAT,
+              help='Maximum acceptable relative throughput loss.')
+@click.option('--max-rss-increase', default=0.1, type=click.FLOAT,
+              help='Maximum acceptable relative peak memory growth.')
+def cli(output, sizes, only, repeat, lines, model, clstm_model, image, seed,
+        baseline, max_slowdown, max_rss_increase):
+    sizes = sorted(float(x) for x in sizes.split(','))
+    opts = {'repeat': repeat, 'lines': lines, 'model': model,
+            'clstm_model': clstm_model, 'seed': seed}
+    tmpdir = tempfile.mkdtemp()
+    results = []
+    errors = []
+    click.echo(u'{:<24} {:>10} {:>14} {:>10}'.format('benchmark', 'time [s]',
+                                                     'throughput', 'RSS [MB]'))
+    try:
+        for idx, size in enumerate(sizes):
+            path = os.path.join(tmpdir, '{:g}.png'.format(size))
+            page_lines = None
+            if image:
+                scaled_page(image, size).save(path)
+            else:
+                try:
+                    page, page_lines = synthetic_page(size, seed)
+                except SkipBenchmark as e:
+                    raise click.ClickException(u'Synthetic pages require '
+                                               u'{}. Use --image '
+                                               u'instead.'.format(e))
+                page.save(path)
+                del page
+            benchmarks = [(n, fn, size) for n, fn in PAGE_BENCHMARKS]
+            if idx == 0:
+                benchmarks += [(n, fn, None) for n, fn in LINE_BENCHMARKS]
+            for name, fn, bsize in benchmarks:
+                if only and name not in only:
+                    continue
+                r = run_benchmark(name, fn, path, page_lines, bsize, opts)
+                if 'skipped' in r:
+                    click.echo(u'{:<24} skipped: {}'.format(r['key'],
+                                                            r['skipped']),
+                               err=True)
+                    continue
+                if 'error' in r:
+                    click.secho(u'{:<24} failed: {}'.format(r['key'],
+                                                            r['error']),
+                                fg='red', err=True)
+                    errors.append(r)
+                    continue
+                results.append(r)
+                click.echo(u'{:<24} {:>10.4f} {:>8.2f} {:<5} {:>10.1f}'.format(r['key'],
+                                                                             r['time'],
+                                                                             r['throughput'],
+                                                                             r['unit'] + '/s',
+                                                                             r['peak_rss']))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    report = {'meta': {'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'cpus': cpu_count(),
+                       'numpy': np.__version__,
+                       'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'repeat': repeat,
+                       'synthetic': image is None},
+              'results': results,
+              'errors': errors}
+    if output:
+        with io.open(output, 'w', encoding='utf-8') as fp:
+            fp.write(json.dumps(report, indent=2, sort_keys=True))
+
+    if baseline:
+        with io.open(baseline, 'r', encoding='utf-8') as fp:
+            base = json.load(fp)
+        click.echo(u'\n{:<24} {:>12} {:>10}'.format('benchmark', 'throughput',
+                                                    'RSS'))
+        failed = False
+        for key, speed, rss, regressed in compare(results, base,
+                                                  max_slowdown,
+                                                  max_rss_increase):
+            failed |= regressed
+            click.echo(u'{:<24} {:>11.1f}% {:>9.1f}% {}'.format(key,
+                                                               100 * (speed - 1),
+                                                               100 * (rss - 1),
+                                                               'REGRESSION' if regressed else ''))
+        if failed:
+            sys.exit(1)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli()
@@ -20,16 +20,252 @@ from __future__ import unicode_literals
 import warnings
 import numpy as np
 
+from functools import partial
+from multiprocessing import Pool
+
+from PIL import Image
+
 from kraken.lib.util import pil2array, array2pil
+from kraken.lib.profiling import span, timed
+from kraken.lib.bitpage import BitPage
 from kraken.lib.exceptions import KrakenInputException
 from scipy.ndimage import filters, interpolation, morphology
 
 
+def _block_mean(image, factor):
+    """
+    Decimates an image by an integer factor by averaging factor x factor
+    blocks. The image is padded with its edge values to a multiple of the
+    factor.
+    """
+    h, w = image.shape
+    ph, pw = -h % factor, -w % factor
+    if ph or pw:
+        image = np.pad(image, ((0, ph), (0, pw)), mode='edge')
+    return image.reshape(image.shape[0]//factor, factor,
+                         image.shape[1]//factor, factor).mean(axis=(1, 3),
+                                                              dtype=np.float32)
+
+
+def _running_percentile(image, perc, size):
+    """
+    Percentile filter with a (size, 2) window on a uint8 image.
+
+    Produces the same result as scipy.ndimage.percentile_filter with the
+    default reflecting border mode. Each column keeps a 256 bin histogram of
+    its window and the current percentile value which are updated for the
+    pixels entering and leaving the window when sliding down a row, so the
+    cost per pixel doesn't depend on the window size.
+
+    Args:
+        image (numpy.array): uint8 array
+        perc (int): Percentile
+        size (int): Window height
+
+    Returns:
+        uint8 numpy.array of the same shape as the input
+    """
+    n = 2 * size
+    rank = min(int(n * perc/100), n - 1)
+    h, w = image.shape
+    pad = np.pad(image, ((size//2, size - size//2 - 1), (1, 0)),
+                 mode='symmetric')
+    # indices into the flattened per-column histograms
+    base = np.arange(w) * 256
+    left = pad[:, :-1] + base
+    right = pad[:, 1:] + base
+    hist = np.zeros(w * 256, np.int32)
+    for i in range(size - 1):
+        hist[left[i]] += 1
+        hist[right[i]] += 1
+    # current percentile value and number of window pixels below it
+    t = base.copy()
+    below = np.zeros(w, np.int32)
+    out = np.empty_like(image)
+    for i in range(h):
+        a, b = left[i+size-1], right[i+size-1]
+        hist[a] += 1
+        hist[b] += 1
+        below += a < t
+        below += b < t
+        m = np.flatnonzero(below > rank)
+        while m.size:
+            t[m] -= 1
+            below[m] -= hist[t[m]]
+            m = m[below[m] > rank]
+        m = np.flatnonzero(below + hist[t] <= rank)
+        while m.size:
+            below[m] += hist[t[m]]
+            t[m] += 1
+            m = m[below[m] + hist[t[m]] <= rank]
+        out[i] = t - base
+        a, b = left[i], right[i]
+        hist[a] -= 1
+        hist[b] -= 1
+        below -= a < t
+        below -= b < t
+    return out
+
+
+def _upsample(image, factor, shape, stripe=256):
+    """
+    Bilinearly interpolates a decimated image back to `shape`. Output rows
+    are computed in stripes to avoid full size temporaries.
+    """
+    def coords(n, size):
+        c = np.clip((np.arange(n) + 0.5)/factor - 0.5, 0, size - 1)
+        i0 = np.minimum(c.astype(np.intp), max(size - 2, 0))
+        i1 = np.minimum(i0 + 1, size - 1)
+        return i0, i1, (c - i0).astype(np.float32)
+    y0, y1, a = coords(shape[0], image.shape[0])
+    x0, x1, b = coords(shape[1], image.shape[1])
+    out = np.empty(shape, np.float32)
+    for i in range(0, shape[0], stripe):
+        s = slice(i, i + stripe)
+        rows = image[y0[s]] * (1 - a[s])[:, None]
+        rows += image[y1[s]] * a[s][:, None]
+        o = out[s]
+        np.take(rows, x0, axis=1, out=o)
+        o *= 1 - b
+        o += rows[:, x1] * b
+    return out
+
+
+def estimate_background(image, zoom=0.5, perc=80, range=20):
+    """
+    Fast estimate of the page background of a normalized greyscale image.
+
+    Approximates the zoom/percentile filter/zoom sequence of nlbin with
+    block decimation by the integer factor closest to 1/zoom, histogram
+    based percentile filters on the image quantized to 8 bits, and bilinear
+    upsampling.
+
+    Args:
+        image (numpy.array): 2D array with values between 0 and 1
+        zoom (float): Zoom for background page estimation
+        perc (int): Percentage for filters
+        range (int): Range for filters
+
+    Returns:
+        float32 numpy.array of the same shape as the input
+    """
+    factor = max(1, int(round(1.0/zoom)))
+    m = _block_mean(image, factor)
+    m = np.array(np.round(m * 255), 'B')
+    m = _running_percentile(m, perc, range)
+    m = _running_percentile(m.T.copy(), perc, range).T
+    m = m.astype(np.float32)
+    m /= 255
+    return _upsample(m, factor, image.shape)
+
+
+def _to_gray(raw):
+    """
+    Averages the color channels of an image array into a float32 array.
+    """
+    if raw.ndim == 3:
+        image = np.empty(raw.shape[:2], np.float32)
+        np.mean(raw, 2, dtype=np.float32, out=image)
+        return image
+    return raw.astype(np.float32)
+
+
+def _background(image, zoom, perc, range, fast_background):
+    """
+    Estimates the page background of a normalized image. The result may be
+    slightly smaller than the input when using spline zooms.
+    """
+    if fast_background:
+        return estimate_background(image, zoom, perc, range)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        m = interpolation.zoom(image, zoom, output=np.float32)
+        m = filters.percentile_filter(m, perc, size=(range, 2))
+        m = filters.percentile_filter(m, perc, size=(2, range))
+        return interpolation.zoom(m, 1.0/zoom, output=np.float32)
+
+
+def _local_deviation(est, escale):
+    """
+    Computes the local standard deviation of a flattened image.
+    """
+    v = filters.gaussian_filter(est, escale*20.0, output=np.float32)
+    np.subtract(est, v, out=v)
+    np.square(v, out=v)
+    filters.gaussian_filter(v, escale*20.0, output=v)
+    np.sqrt(v, out=v)
+    return v
+
+
+def _dilate_mask(v, escale):
+    """
+    Dilates a mask of text regions with a box structuring element.
+    """
+    v = morphology.binary_dilation(v, structure=np.ones((int(escale * 50), 1)))
+    return morphology.binary_dilation(v, structure=np.ones((1, int(escale * 50))))
+
+
+def _flatten(im, zoom, perc, range, fast_background):
+    """
+    Normalizes a page and divides out its background.
+
+    Returns:
+        float32 numpy.array with values between 0 and 1.
+
+    Raises:
+        KrakenInputException if the image is empty.
+    """
+    with span('nlbin.normalize'):
+        raw = pil2array(im)
+        # average color channels and rescale image to between 0 and 1.
+        # Dividing by the maximum value of the input type is unnecessary as
+        # the image is normalized anyway.
+        image = _to_gray(raw)
+        del raw
+        lo, hi = np.amin(image), np.amax(image)
+        if lo == hi:
+            raise KrakenInputException('Image is empty')
+        image -= lo
+        image /= hi - lo
+
+    with span('nlbin.background'):
+        m = _background(image, zoom, perc, range, fast_background)
+    with span('nlbin.flatten'):
+        w, h = np.minimum(np.array(image.shape), np.array(m.shape))
+        flat = image[:w, :h]
+        flat -= m[:w, :h]
+        del m
+        flat += 1
+        np.clip(flat, 0, 1, out=flat)
+    return flat
+
+
+def _text_values(flat, escale, border):
+    """
+    Returns the values of a flattened page used for estimating black and
+    white levels.
+    """
+    d0, d1 = flat.shape
+    o0, o1 = int(border*d0), int(border*d1)
+    est = flat[o0:d0-o0, o1:d1-o1]
+    # by default, we use only regions that contain
+    # significant variance; this makes the percentile
+    # based low and high estimates more reliable
+    v = _local_deviation(est, escale)
+    v = _dilate_mask(v > 0.3*np.amax(v), escale)
+    return est[v]
+
+
+@timed('binarization.nlbin')
 def nlbin(im, threshold=0.5, zoom=0.5, escale=1.0, border=0.1, perc=80,
-          range=20, low=5, high=90):
+          range=20, low=5, high=90, fast_background=False, thresholds=None):
     """
     Performs binarization using non-linear processing.
 
+    All intermediate images are single precision and modified in place where
+    possible. Peak memory use is about 13 bytes per pixel, i.e. 13MB per
+    megapixel, in addition to the input image.
+
     Args:
         im (PIL.Image):
         threshold (float):
@@ -40,50 +276,461 @@ def nlbin(im, threshold=0.5, zoom=0.5, escale=1.0, border=0.1, perc=80,
         range (int): Range for filters
         low (int): Percentile for black estimation
         high (int): Percentile for white estimation
+        fast_background (bool): Estimate the page background with
+                                estimate_background() instead of spline
+                                zooms and scipy's percentile filters.
+        thresholds (tuple): Black and white levels (lo, hi) as returned by
+                            estimate_thresholds(). If given, `escale`,
+                            `border`, `low`, and `high` are ignored and only
+                            the background is estimated from the page.
 
     Returns:
         PIL.Image containing the binarized image
     """
     if im.mode == '1':
         return im
-    raw = pil2array(im)
-    # rescale image to between -1 or 0 and 1
-    raw = raw/np.float(np.iinfo(raw.dtype).max)
-    if raw.ndim == 3:
-        raw = np.mean(raw, 2)
-    # perform image normalization
-    if np.amax(raw) == np.amin(raw):
+    flat = _flatten(im, zoom, perc, range, fast_background)
+
+    # estimate low and high thresholds
+    if thresholds is None:
+        with span('nlbin.levels'):
+            est = _text_values(flat, escale, border)
+            lo, hi = np.percentile(est, [low, high], overwrite_input=True)
+            del est
+    else:
+        lo, hi = thresholds
+
+    with span('nlbin.threshold'):
+        flat -= lo
+        flat /= (hi-lo)
+        np.clip(flat, 0, 1, out=flat)
+        bin = np.greater(flat, threshold).view('B')
+        del flat
+        bin *= 255
+        return array2pil(bin)
+
+
+def _open(im):
+    """
+    Opens an image file or a (path, frame index) tuple referring to a frame
+    of a multi-page file unless `im` already is an image.
+    """
+    if isinstance(im, Image.Image):
+        return im
+    if isinstance(im, tuple):
+        path, idx = im
+        im = Image.open(path)
+        im.seek(idx)
+        return im
+    return Image.open(im)
+
+
+def _sample_values(im, samples, zoom, escale, border, perc, range,
+                   fast_background):
+    im = _open(im)
+    if im.mode == '1':
+        return np.empty(0, np.float32)
+    flat = _flatten(im, zoom, perc, range, fast_background)
+    # keep about a page's worth of values over all samples
+    return _text_values(flat, escale, border)[::samples]
+
+
+@timed('nlbin.estimate_thresholds')
+def estimate_thresholds(ims, samples=10, processes=1, zoom=0.5, escale=1.0,
+                        border=0.1, perc=80, range=20, low=5, high=90,
+                        fast_background=False):
+    """
+    Estimates black and white levels shared by a series of pages, e.g. all
+    pages of a volume, from a sample of evenly spaced pages.
+
+    Args:
+        ims (list): PIL.Image objects, paths to image files, or (path, frame
+                    index) tuples of pages of multi-page files
+        samples (int): Number of pages to sample
+        processes (int): Number of worker processes. None uses all CPUs.
+        zoom (float): Zoom for background page estimation
+        escale (float): Scale for estimating a mask over the text region
+        border (float): Ignore this much of the border
+        perc (int): Percentage for filters
+        range (int): Range for filters
+        low (int): Percentile for black estimation
+        high (int): Percentile for white estimation
+        fast_background (bool): Estimate the page background with
+                                estimate_background().
+
+    Returns:
+        (lo, hi) tuple to be passed to nlbin() as `thresholds`.
+
+    Raises:
+        KrakenInputException if all sampled pages are bi-level or empty.
+    """
+    if not len(ims):
+        raise KrakenInputException('No pages to estimate thresholds from')
+    idx = np.linspace(0, len(ims) - 1, min(samples, len(ims)))
+    idx = np.unique(idx.astype(int))
+    sampled = [ims[i] for i in idx]
+    fn = partial(_sample_values, samples=len(sampled), zoom=zoom,
+                 escale=escale, border=border, perc=perc, range=range,
+                 fast_background=fast_background)
+    if processes == 1:
+        est = [fn(im) for im in sampled]
+    else:
+        pool = Pool(processes)
+        try:
+            est = pool.map(fn, sampled)
+        finally:
+            pool.terminate()
+    est = np.concatenate(est)
+    if not est.size:
+        raise KrakenInputException('No pages to estimate thresholds from')
+    return tuple(np.percentile(est, [low, high], overwrite_input=True))
+
+
+def _nlbin_page(im, **kwargs):
+    return nlbin(_open(im), **kwargs)
+
+
+def nlbin_batch(ims, samples=10, processes=None, threshold=0.5, zoom=0.5,
+                escale=1.0, border=0.1, perc=80, range=20, low=5, high=90,
+                fast_background=False):
+    """
+    Binarizes a series of pages sharing paper and ink characteristics, e.g.
+    the pages of a book, with nlbin().
+
+    Black and white levels are estimated once with estimate_thresholds()
+    from a sample of pages so that only the background has to be estimated
+    for each page. Pages are binarized by a pool of worker processes and
+    returned in input order.
+
+    Args:
+        ims (list): PIL.Image objects, paths to image files, or (path, frame
+                    index) tuples of pages of multi-page files
+        samples (int): Number of pages to estimate black and white levels
+                       from
+        processes (int): Number of worker processes. None uses all CPUs.
+        threshold (float):
+        zoom (float): Zoom for background page estimation
+        escale (float): Scale for estimating a mask over the text region
+        border (float): Ignore this much of the border
+        perc (int): Percentage for filters
+        range (int): Range for filters
+        low (int): Percentile for black estimation
+        high (int): Percentile for white estimation
+        fast_background (bool): Estimate the page background with
+                                estimate_background().
+
+    Yields:
+        PIL.Image containing the binarized image of each page
+    """
+    thresholds = estimate_thresholds(ims, samples, processes, zoom, escale,
+                                     border, perc, range, low, high,
+                                     fast_background)
+    fn = partial(_nlbin_page, threshold=threshold, zoom=zoom, perc=perc,
+                 range=range, fast_background=fast_background,
+                 thresholds=thresholds)
+    if processes == 1:
+        for im in ims:
+            yield fn(im)
+        return
+    pool = Pool(processes)
+    try:
+        for res in pool.imap(fn, ims):
+            yield res
+    finally:
+        pool.terminate()
+
+
+def _tiles(shape, tile):
+    """
+    Splits a page into a grid of (y0, x0, y1, x1) boxes.
+    """
+    h, w = shape
+    return [(y, x, min(y + tile, h), min(x + tile, w))
+            for y in range(0, h, tile) for x in range(0, w, tile)]
+
+
+def _read_tile(im, box):
+    """
+    Reads a box of an image or array as a float32 greyscale array.
+    """
+    y0, x0, y1, x1 = box
+    if isinstance(im, Image.Image):
+        raw = pil2array(im.crop((x0, y0, x1, y1)))
+    else:
+        raw = np.asarray(im[y0:y1, x0:x1])
+    return _to_gray(raw)
+
+
+@timed('nlbin.tiled')
+def nlbin_tiled(im, tile=2048, samples=16, output=None, threshold=0.5,
+                zoom=0.5, escale=1.0, border=0.1, perc=80, range=20, low=5,
+                high=90, fast_background=False, thresholds=None):
+    """
+    Performs binarization using non-linear processing on overlapping tiles.
+
+    Memory use is bounded by the tile size instead of the page size. A first
+    pass determines the global intensity range of the page and estimates the
+    black and white percentiles from up to `samples` tiles spread over the
+    page; the second pass flattens and thresholds each tile. The input may be
+    an array mapped from disk, e.g. with numpy.load(..., mmap_mode='r'), and
+    the result can be written into a memory mapped output array, in which
+    case only one tile is held in memory at any time.
+
+    Differences to nlbin() are limited to pixels whose black and white
+    estimates change when computed from samples and to tile seams of the
+    spline zoomed background estimate.
+
+    Args:
+        im (PIL.Image or numpy.array): Input image or array of shape (h, w)
+                                       or (h, w, channels)
+        tile (int): Edge length of the tiles
+        samples (int): Number of tiles to estimate percentiles from
+        output (numpy.array): Optional uint8 array of shape (h, w) the
+                              result is written to
+        threshold (float):
+        zoom (float): Zoom for background page estimation
+        escale (float): Scale for estimating a mask over the text region
+        border (float): Ignore this much of the border
+        perc (int): Percentage for filters
+        range (int): Range for filters
+        low (int): Percentile for black estimation
+        high (int): Percentile for white estimation
+        fast_background (bool): Estimate the page background with
+                                estimate_background().
+        thresholds (tuple): Black and white levels (lo, hi) as returned by
+                            estimate_thresholds(). If given, no tiles are
+                            sampled.
+
+    Returns:
+        PIL.Image containing the binarized image or `output` if given.
+
+    Raises:
+        KrakenInputException if the image is empty.
+    """
+    if isinstance(im, Image.Image):
+        if im.mode == '1':
+            return im
+        shape = im.size[1], im.size[0]
+    else:
+        shape = im.shape[:2]
+    # align tiles to the decimation factor of the fast background estimate
+    factor = max(1, int(round(1.0/zoom)))
+    tile = max(factor, tile - tile % factor)
+    margin = int(np.ceil(2 * range / zoom / factor)) * factor
+    var_margin = margin + int(210 * escale)
+    boxes = _tiles(shape, tile)
+
+    def flatten(box, margin):
+        y0, x0, y1, x1 = box
+        ext = (max(y0 - margin, 0), max(x0 - margin, 0),
+               min(y1 + margin, shape[0]), min(x1 + margin, shape[1]))
+        image = _read_tile(im, ext)
+        image -= lo
+        image /= hi - lo
+        m = _background(image, zoom, perc, range, fast_background)
+        if m.shape != image.shape:
+            m = np.pad(m[:image.shape[0], :image.shape[1]],
+                       [(0, max(a - b, 0)) for a, b in zip(image.shape,
+                                                          m.shape)],
+                       mode='edge')
+        image -= m
+        del m
+        image += 1
+        np.clip(image, 0, 1, out=image)
+        return image, ext
+
+    # global intensity range
+    lo, hi = np.inf, -np.inf
+    for box in boxes:
+        t = _read_tile(im, box)
+        lo, hi = min(lo, np.amin(t)), max(hi, np.amax(t))
+    if lo == hi:
         raise KrakenInputException('Image is empty')
-    image = raw-np.amin(raw)
-    image /= np.amax(image)
 
-    with warnings.catch_warnings():
-        warnings.simplefilter('ignore', UserWarning)
-        m = interpolation.zoom(image, zoom)
-        m = filters.percentile_filter(m, perc, size=(range, 2))
-        m = filters.percentile_filter(m, perc, size=(2, range))
-        m = interpolation.zoom(m, 1.0/zoom)
-    w, h = np.minimum(np.array(image.shape), np.array(m.shape))
-    flat = np.clip(image[:w, :h]-m[:w, :h]+1, 0, 1)
+    def sample_thresholds():
+        # black and white estimates from the variance masked border region
+        # of sampled tiles. The local deviation is computed twice to avoid
+        # keeping sampled tiles in memory while determining its global
+        # maximum.
+        d0, d1 = shape
+        o0, o1 = int(border*d0), int(border*d1)
+        region = (o0, o1, d0-o0, d1-o1)
+        cand = [box for box in boxes
+                if box[0] < region[2] and box[1] < region[3] and
+                box[2] > region[0] and box[3] > region[1]]
+        idx = np.linspace(0, len(cand) - 1, min(samples, len(cand)))
+        idx = np.unique(idx.astype(int))
+        sampled = [cand[i] for i in idx]
 
-    # estimate low and high thresholds
-    d0, d1 = flat.shape
-    o0, o1 = int(border*d0), int(border*d1)
-    est = flat[o0:d0-o0, o1:d1-o1]
-    # by default, we use only regions that contain
-    # significant variance; this makes the percentile
-    # based low and high estimates more reliable
-    v = est-filters.gaussian_filter(est, escale*20.0)
-    v = filters.gaussian_filter(v**2, escale*20.0)**0.5
-    v = (v > 0.3*np.amax(v))
-    v = morphology.binary_dilation(v, structure=np.ones((int(escale * 50), 1)))
-    v = morphology.binary_dilation(v, structure=np.ones((1, int(escale * 50))))
-    est = est[v]
-    lo = np.percentile(est.ravel(), low)
-    hi = np.percentile(est.ravel(), high)
-
-    flat -= lo
-    flat /= (hi-lo)
-    flat = np.clip(flat, 0, 1)
-    bin = np.array(255*(flat > threshold), 'B')
-    return array2pil(bin)
+        def deviation(box):
+            flat, ext = flatten(box, var_margin)
+            ey0, ex0 = max(ext[0], region[0]), max(ext[1], region[1])
+            ey1, ex1 = min(ext[2], region[2]), min(ext[3], region[3])
+            est = flat[ey0-ext[0]:ey1-ext[0], ex0-ext[1]:ex1-ext[1]]
+            cy0 = max(box[0], region[0]) - ey0
+            cx0 = max(box[1], region[1]) - ex0
+            cy1 = min(box[2], region[2]) - ey0
+            cx1 = min(box[3], region[3]) - ex0
+            return est, _local_deviation(est, escale), (cy0, cx0, cy1, cx1)
+
+        vmax = 0
+        for box in sampled:
+            _, v, (cy0, cx0, cy1, cx1) = deviation(box)
+            vmax = max(vmax, np.amax(v[cy0:cy1, cx0:cx1]))
+        est = []
+        for box in sampled:
+            flat, v, (cy0, cx0, cy1, cx1) = deviation(box)
+            v = _dilate_mask(v > 0.3*vmax, escale)
+            # keep about a tile's worth of values over all samples
+            vals = flat[cy0:cy1, cx0:cx1][v[cy0:cy1, cx0:cx1]]
+            est.append(vals[::len(sampled)])
+        est = np.concatenate(est)
+        return np.percentile(est, [low, high], overwrite_input=True)
+
+    if thresholds is None:
+        flo, fhi = sample_thresholds()
+    else:
+        flo, fhi = thresholds
+
+    if output is None:
+        bin = np.empty(shape, 'B')
+    else:
+        bin = output
+    for box in boxes:
+        flat, ext = flatten(box, margin)
+        y0, x0, y1, x1 = box
+        flat = flat[y0-ext[0]:y1-ext[0], x0-ext[1]:x1-ext[1]]
+        flat -= flo
+        flat /= (fhi-flo)
+        np.clip(flat, 0, 1, out=flat)
+        core = np.greater(flat, threshold).view('B')
+        core *= 255
+        bin[y0:y1, x0:x1] = core
+    if output is None:
+        return array2pil(bin)
+    return output
+
+
+def _local_stats(image, window, stripe=256):
+    """
+    Computes the mean and standard deviation in a window x window
+    neighborhood of each pixel from integral images of the pixel values and
+    their squares. Windows are truncated at the image border.
+
+    The integral images are computed over horizontal stripes of `stripe`
+    rows, each extended by half a window above and below, so only stripe
+    sized float64 arrays are allocated besides the output.
+
+    Returns:
+        (mean, std) float32 arrays of the same shape as the input.
+    """
+    h, w = image.shape
+    r = window // 2
+    x0 = np.clip(np.arange(w) - r, 0, w)
+    x1 = np.clip(np.arange(w) + r + 1, 0, w)
+    mean = np.empty((h, w), np.float32)
+    std = np.empty((h, w), np.float32)
+
+    def window_sums(a, y0, y1):
+        ii = np.zeros((a.shape[0] + 1, w + 1), np.float64)
+        np.cumsum(a, 0, out=ii[1:, 1:])
+        np.cumsum(ii[1:, 1:], 1, out=ii[1:, 1:])
+        rows = ii[y1]
+        rows -= ii[y0]
+        del ii
+        sums = rows[:, x1]
+        sums -= rows[:, x0]
+        return sums
+
+    for s0 in range(0, h, stripe):
+        s1 = min(s0 + stripe, h)
+        w0, w1 = max(0, s0 - r), min(h, s1 + r)
+        y0 = np.clip(np.arange(s0, s1) - r, 0, h) - w0
+        y1 = np.clip(np.arange(s0, s1) + r + 1, 0, h) - w0
+        count = ((y1 - y0)[:, None] * (x1 - x0)[None, :]).astype(np.float32)
+        m = mean[s0:s1]
+        m[:] = window_sums(image[w0:w1], y0, y1)
+        m /= count
+        sq = std[s0:s1]
+        sq[:] = window_sums(np.square(image[w0:w1], dtype=np.float64), y0, y1)
+        sq /= count
+        sq -= m * m
+        np.maximum(sq, 0, out=sq)
+        np.sqrt(sq, out=sq)
+    return mean, std
+
+
+def _load_gray(im):
+    """
+    Converts an image to a float32 greyscale array with values between 0 and
+    255.
+    """
+    raw = pil2array(im)
+    image = _to_gray(raw)
+    if raw.dtype.kind in 'ui' and raw.dtype.itemsize > 1:
+        image *= 255.0 / np.iinfo(raw.dtype).max
+    return image
+
+
+def _threshold(image, thresh):
+    """
+    Returns a bi-level image with ink wherever the image is at or below the
+    threshold.
+    """
+    return BitPage.from_array(image <= thresh).to_pil()
+
+
+@timed('binarization.sauvola')
+def sauvola(im, window=15, k=0.2, r=128):
+    """
+    Performs binarization with Sauvola's local thresholding method.
+
+    The threshold of each pixel is m * (1 + k * (s / r - 1)) with m and s
+    the mean and standard deviation of the window around it. Local
+    statistics are computed with integral images so the cost doesn't depend
+    on the window size.
+
+    Args:
+        im (PIL.Image): Input image
+        window (int): Edge length of the neighborhood
+        k (float): Weight of the standard deviation
+        r (float): Dynamic range of the standard deviation
+
+    Returns:
+        PIL.Image of mode '1' containing the binarized image
+    """
+    if im.mode == '1':
+        return im
+    image = _load_gray(im)
+    mean, std = _local_stats(image, window)
+    std /= r
+    std -= 1
+    std *= k
+    std += 1
+    mean *= std
+    return _threshold(image, mean)
+
+
+@timed('binarization.niblack')
+def niblack(im, window=15, k=-0.2):
+    """
+    Performs binarization with Niblack's local thresholding method.
+
+    The threshold of each pixel is m + k * s with m and s the mean and
+    standard deviation of the window around it.
+
+    Args:
+        im (PIL.Image): Input image
+        window (int): Edge length of the neighborhood
+        k (float): Weight of the standard deviation
+
+    Returns:
+        PIL.Image of mode '1' containing the binarized image
+    """
+    if im.mode == '1':
+        return im
+    image = _load_gray(im)
+    mean, std = _local_stats(image, window)
+    std *= k
+    mean += std
+    return _threshold(image, mean)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Benjamin Kiessling
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Cheap detection of pages without text, e.g. blank versos, separator sheets,
+or color targets, on a downsampled copy of the page.
+"""
+
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+import numpy as np
+
+from PIL import Image
+from scipy.ndimage import filters
+
+from kraken.lib import morph
+from kraken.lib.util import pil2array
+
+
+def _downsample(im, max_size):
+    """
+    Shrinks an image by an integer factor so its longer side is at most
+    `max_size` pixels and converts it to greyscale. Only the shrunk copy is
+    converted, except for bi-level and palette images which can't be
+    averaged.
+    """
+    if im.mode in ('1', 'P'):
+        im = im.convert('L')
+    factor = -(-max(im.size) // max_size)
+    if factor > 1:
+        im = im.resize((max(im.size[0] // factor, 1),
+                        max(im.size[1] // factor, 1)), Image.BOX)
+    return pil2array(im.convert('L')).astype(np.float32) / 255
+
+
+def page_statistics(im, max_size=1024, min_ink=0.05, max_component=0.1):
+    """
+    Computes the statistics blank page detection is based on.
+
+    Args:
+        im (PIL.Image): Input image
+        max_size (int): Maximum length of the longer side of the downsampled
+                        page.
+        min_ink (float): Minimum difference between a pixel and the mean of
+                         its neighborhood to be counted as ink.
+        max_component (float): Maximum height and width of a connected
+                               component counted as text as a fraction of
+                               the page size.
+
+    Returns:
+        A dict with the intensity range (`contrast`) and standard deviation
+        of intensities (`std`), both relative to the full intensity range,
+        and the number of connected ink components small enough to be text
+        (`components`).
+    """
+    a = _downsample(im, max_size)
+    lo, hi = np.amin(a), np.amax(a)
+    stats = {'contrast': float(hi - lo), 'std': float(np.std(a)),
+             'components': 0}
+    if hi - lo < min_ink:
+        return stats
+    # ink is darker than its surroundings which suppresses uneven lighting
+    bg = filters.uniform_filter(a, max(max_size // 32, 3))
+    bg -= min_ink
+    labels, n = morph.label(a < bg)
+    if not n:
+        return stats
+    sizes = np.bincount(labels.ravel())[1:]
+    h, w = a.shape
+    text = 0
+    for o, size in zip(morph.find_objects(labels), sizes):
+        # ignore speckles and large objects like photographs or color
+        # patches
+        if size < 3:
+            continue
+        if o[0].stop - o[0].start > max_component * h or \
+           o[1].stop - o[1].start > max_component * w:
+            continue
+        text += 1
+    stats['components'] = text
+    return stats
+
+
+def is_blank(im, max_size=1024, min_contrast=0.1, min_std=0.01,
+             min_components=10, min_ink=0.05, max_component=0.1):
+    """
+    Determines if a page contains no text and can be skipped.
+
+    A page is considered blank if its intensity range or standard deviation
+    is too low or if it has too few dark connected components of the size of
+    characters. All statistics are computed on a downsampled greyscale copy
+    of the page.
+
+    Args:
+        im (PIL.Image): Input image
+        max_size (int): Maximum length of the longer side of the downsampled
+                        page.
+        min_contrast (float): Minimum intensity range.
+        min_std (float): Minimum standard deviation of intensities.
+        min_components (int): Minimum number of text-sized connected
+                              components.
+        min_ink (float): Minimum difference between a pixel and the mean of
+                         its neighborhood to be counted as ink.
+        max_component (float): Maximum height and width of a connected
+                               component counted as text as a fraction of
+                               the page size.
+
+    Returns:
+        True if the page is blank, False otherwise.
+    """
+    stats = page_statistics(im, max_size, min_ink, max_component)
+    return (stats['contrast'] < min_contrast or stats['std'] < min_std or
+            stats['components'] < min_components)
@@ -23,7 +23,6 @@ from builtins import str
 from builtins import object
 
 from jinja2 import Environment, PackageLoader
-from itertools import izip_longest
 import logging
 import regex
 
@@ -68,17 +67,11 @@ def delta(root=(0, 0, 0, 0), coordinates=None):
         root = box
 
 
-def hocr(records, image_name=u'', image_size=(0, 0)):
+def _hocr_lines(records):
     """
-    Merges a list of predictions and their corresponding character positions
-    into an hOCR document.
-
-    Args:
-        records (iterable): List of kraken.rpred.ocr_record
-        image_name (unicode): Name of the source image
-        image_size (tuple): Dimensions of the source image
+    Converts records into the line dictionaries of the hOCR template one at a
+    time.
     """
-    page = {'lines': [], 'size': image_size, 'name': image_name}
     seg_idx = 0
     for idx, record in enumerate(records):
         line = {'index': idx,
@@ -100,7 +93,46 @@ def hocr(records, image_name=u'', image_size=(0, 0)):
                                         'index': seg_idx})
             seg_idx += 1
             line_offset += len(segment)
-        page['lines'].append(line)
+        yield line
+
+
+def _hocr_template():
     env = Environment(loader=PackageLoader('kraken', 'templates'))
-    tmpl = env.get_template('hocr.html')
-    return tmpl.render(page=page)
+    return env.get_template('hocr.html')
+
+
+def hocr(records, image_name=u'', image_size=(0, 0)):
+    """
+    Merges a list of predictions and their corresponding character positions
+    into an hOCR document.
+
+    Args:
+        records (iterable): List of kraken.rpred.ocr_record
+        image_name (unicode): Name of the source image
+        image_size (tuple): Dimensions of the source image
+    """
+    page = {'lines': list(_hocr_lines(records)), 'size': image_size,
+            'name': image_name}
+    return _hocr_template().render(page=page)
+
+
+def hocr_stream(records, image_name=u'', image_size=(0, 0)):
+    """
+    Renders an hOCR document incrementally.
+
+    Records are only consumed when the markup of the preceding lines has been
+    produced, so lines can be written out while later lines are still being
+    recognized.
+
+    Args:
+        records (iterable): Iterable of kraken.rpred.ocr_record, e.g. the
+                            generator returned by kraken.rpred.rpred
+        image_name (unicode): Name of the source image
+        image_size (tuple): Dimensions of the source image
+
+    Yields:
+        Consecutive fragments of the hOCR document.
+    """
+    page = {'lines': _hocr_lines(records), 'size': image_size,
+            'name': image_name}
+    return _hocr_template().generate(page=page)
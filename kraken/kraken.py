@@ -18,6 +18,7 @@ from __future__ import absolute_import, division, print_function
 from future import standard_library
 standard_library.install_aliases()
 
+import io
 import os
 import csv
 import click
@@ -28,16 +29,26 @@ import unicodedata
 
 from PIL import Image
 from click import open_file
-from itertools import cycle
+from click.globals import push_context, pop_context
+from itertools import cycle, chain
 from collections import namedtuple, defaultdict
 from functools import partial
 from multiprocessing import Queue, Pool, cpu_count
 from kraken import binarization
+from kraken import blank
 from kraken import pageseg
 from kraken import rpred
-from kraken import html
+from kraken import writers
 from kraken import repo
 from kraken.lib import models
+from kraken.lib import pages
+from kraken.lib import util
+from kraken.lib import pipeline
+from kraken.lib import profiling
+from kraken.lib import metrics
+from kraken.lib import watchdog
+from kraken.lib.bitpage import BitPage
+from kraken.lib.exceptions import KrakenBudgetException, KrakenWorkerException
 
 APP_NAME = 'kraken'
 MODEL_URL = 'http://l.unchti.me/'
@@ -50,30 +61,54 @@ def spin(msg):
     click.echo(u'\r\033[?25l{}\t{}'.format(msg, next(spinner)), nl=False)
 
 
-def binarizer(threshold, zoom, escale, border, perc, range, low, high, base_image, input, output):
+def binarizer(method, threshold, zoom, escale, border, perc, range, low, high,
+              fast_background, tile_size, window, k, thresholds, base_image,
+              input, output, blank=False, image_name=None):
+    im = open_image(input)
+    click.echo(u'Binarizing {}\t'.format(image_name or input), nl=False)
     try:
-        im = Image.open(input)
-    except IOError as e:
-        raise click.BadParameter(str(e))
-    click.echo('Binarizing\t', nl=False)
-    try:
-        res = binarization.nlbin(im, threshold, zoom, escale, border, perc, range,
-                                 low, high)
-        res.save(output, format='png')
+        if blank:
+            res = Image.new('1', im.size, 1)
+        elif method != 'nlbin':
+            kwargs = {'window': window}
+            if k is not None:
+                kwargs['k'] = k
+            res = getattr(binarization, method)(im, **kwargs)
+        elif tile_size:
+            res = binarization.nlbin_tiled(im, tile_size, threshold=threshold,
+                                           zoom=zoom, escale=escale,
+                                           border=border, perc=perc,
+                                           range=range, low=low, high=high,
+                                           fast_background=fast_background,
+                                           thresholds=thresholds)
+        else:
+            res = binarization.nlbin(im, threshold, zoom, escale, border,
+                                     perc, range, low, high, fast_background,
+                                     thresholds)
+        # pages binarized for another subcommand stay in memory
+        if output is None:
+            res = BitPage.from_pil(res)
+        else:
+            res.save(output, format='png')
     except:
         click.secho(u'\u2717', fg='red')
         raise
     click.secho(u'\u2713', fg='green')
+    return res
 
 
-def segmenter(scale, black_colseps, base_image, input, output):
-    try:
-        im = Image.open(input)
-    except IOError as e:
-        raise click.BadParameter(str(e))
-    click.echo('Segmenting\t', nl=False)
+def segmenter(engine, scale, black_colseps, base_image, input, output,
+              blank=False, image_name=None):
+    # the segmenters work on packed pages directly
+    im = input if isinstance(input, BitPage) else open_image(input)
+    click.echo(u'Segmenting {}\t'.format(image_name or input), nl=False)
     try:
-        res = pageseg.segment(im, scale, black_colseps)
+        if blank:
+            res = []
+        elif engine == 'projection':
+            res = pageseg.segment_projection(im)
+        else:
+            res = pageseg.segment(im, scale, black_colseps)
     except:
         click.secho(u'\u2717', fg='red')
         raise
@@ -83,71 +118,625 @@ def segmenter(scale, black_colseps, base_image, input, output):
     click.secho(u'\u2713', fg='green')
 
 
-def recognizer(model, pad, base_image, input, output, lines):
-    try:
-        im = Image.open(base_image)
-    except IOError as e:
-        raise click.BadParameter(str(e))
+def recognizer(model, pad, max_space, bucket_lines, base_image, input,
+               output, lines, blank=False, image_name=None):
+    im = open_image(base_image)
 
     ctx = click.get_current_context()
 
     if not lines:
         lines = input
-    with open_file(lines, 'r') as fp:
-        bounds = [(int(x1), int(y1), int(x2), int(y2)) for x1, y1, x2, y2
-                  in csv.reader(fp)]
-        it = rpred.rpred(model, im, bounds, pad)
-    preds = []
-
-    st_time = time.time()
-    for pred in it:
+    if blank:
+        it = []
+    else:
+        with open_file(lines, 'r') as fp:
+            bounds = [(int(x1), int(y1), int(x2), int(y2)) for x1, y1, x2, y2
+                      in csv.reader(fp)]
+        it = rpred.rpred(model, im, bounds, pad, max_space=max_space,
+                         bucket_lines=bucket_lines)
+
+    def progress(it):
+        st_time = time.time()
+        for pred in it:
+            if ctx.meta['verbose'] > 0:
+                click.echo(u'[{:2.4f}] {}'.format(time.time() - st_time, pred.prediction))
+            else:
+                spin('Processing')
+            yield pred
         if ctx.meta['verbose'] > 0:
-            click.echo(u'[{:2.4f}] {}'.format(time.time() - st_time, pred.prediction))
+            click.echo(u'Execution time: {}s'.format(time.time() - st_time))
         else:
-            spin('Processing')
-        preds.append(pred)
-    if ctx.meta['verbose'] > 0:
-        click.echo(u'Execution time: {}s'.format(time.time() - st_time))
-    else:
-        click.secho(u'\b\u2713', fg='green', nl=False)
-        click.echo('\033[?25h\n', nl=False)
-    
-    ctx = click.get_current_context()
+            click.secho(u'\b\u2713', fg='green', nl=False)
+            click.echo('\033[?25h\n', nl=False)
+
+    # lines are written as soon as they are recognized
+    name = image_name or base_image
     with open_file(output, 'w', encoding='utf-8') as fp:
-        click.echo('Writing recognition results for {}\t'.format(base_image), nl=False)
         if ctx.meta['mode'] == 'hocr':
-            fp.write(unicode(html.hocr(preds, base_image)))
+            writers.write_hocr(progress(it), fp, name, flush=ctx.meta['flush'])
+        elif ctx.meta['mode'] == 'jsonl':
+            writers.write_jsonl(progress(it), fp, name, flush=ctx.meta['flush'])
         else:
-            fp.write(u'\n'.join(s.prediction for s in preds))
-        click.secho(u'\u2713', fg='green')
+            writers.write_text(progress(it), fp, flush=ctx.meta['flush'])
+    click.echo('Wrote recognition results for {}\t'.format(name), nl=False)
+    click.secho(u'\u2713', fg='green')
 
 
+# names of the subcommands used for stage budgets
+STAGE_NAMES = {binarizer: 'binarize', segmenter: 'segment', recognizer: 'ocr'}
+
 
 @click.group(chain=True)
 @click.option('-i', '--input', type=(click.Path(exists=True),
                                      click.Path(writable=True)), multiple=True)
 @click.option('-c', '--concurrency', default=cpu_count(), type=click.INT)
+@click.option('--manifest', type=click.Path(exists=True, dir_okay=False),
+              help='File containing tab separated input and output paths, '
+              'one pair per line, to process in addition to -i.')
+@click.option('--journal', type=click.Path(dir_okay=False),
+              help='Completion journal of a manifest. Inputs recorded in it '
+              'are skipped. Defaults to the manifest path with a .journal '
+              'suffix.')
 @click.option('-v', '--verbose', default=0, count=True)
-def cli(input, concurrency, verbose):
+@click.option('--skip-blank/--no-skip-blank', default=False,
+              help='Detect pages without text before processing them and '
+              'produce empty results for them.')
+@click.option('--blank-contrast', default=0.1, type=click.FLOAT,
+              help='Minimum intensity range of non-blank pages.')
+@click.option('--blank-components', default=10, type=click.INT,
+              help='Minimum number of character sized connected components '
+              'of non-blank pages.')
+@click.option('--pipeline/--no-pipeline', 'pipeline_stages', default=False,
+              help='Run the subcommands in separate threads so that the '
+              'processing of consecutive pages overlaps.')
+@click.option('--queue-size', default=2, type=click.IntRange(1, None),
+              help='Maximum number of pages waiting in front of each '
+              'pipeline stage.')
+@click.option('--stage-workers', default=None,
+              help='Comma separated number of worker threads of each '
+              'subcommand in the pipeline, e.g. 1,1,2. Defaults to 1.')
+@click.option('--prefetch', default=0, type=click.IntRange(0, None),
+              help='Number of pages decoded ahead in background threads. 0 '
+              'decodes each page when it is processed.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True),
+              help='Write the time spent in each processing step as a JSON '
+              'trace to this file.')
+@click.option('--metrics-port', default=None, type=click.IntRange(0, 65535),
+              help='Serve metrics in the Prometheus text format on this port '
+              'of localhost.')
+@click.option('--metrics-file', type=click.Path(dir_okay=False, writable=True),
+              help='Write metrics in the Prometheus text format to this file '
+              'periodically.')
+@click.option('--metrics-interval', default=10.0, type=click.FLOAT,
+              help='Seconds between writes of the metrics file.')
+@click.option('--page-timeout', default=None, type=click.FLOAT,
+              help='Maximum seconds spent on a page. Pages exceeding it are '
+              'marked as failed and the batch continues.')
+@click.option('--page-memory', default=None, type=click.FLOAT,
+              help='Maximum memory in MB allocated while processing a page. '
+              'Memory shared with the main process, e.g. the loaded model, '
+              'is not counted.')
+@click.option('--stage-timeout', default=None,
+              help='Maximum seconds spent in each subcommand on a page, '
+              'either a single number or comma separated budgets of single '
+              'stages, e.g. segment=30,ocr=120.')
+@click.option('--stage-memory', default=None,
+              help='Maximum memory in MB allocated for a page while each '
+              'subcommand runs in the same format as --stage-timeout.')
+def cli(input, concurrency, manifest, journal, verbose, skip_blank,
+        blank_contrast, blank_components, pipeline_stages, queue_size,
+        stage_workers, prefetch, profile, metrics_port, metrics_file,
+        metrics_interval, page_timeout, page_memory, stage_timeout,
+        stage_memory):
     ctx = click.get_current_context()
     ctx.meta['verbose'] = verbose
+    if metrics_port is not None or metrics_file:
+        metrics.enable()
+        ctx.call_on_close(metrics.disable)
+    if metrics_port is not None:
+        server = metrics.serve(metrics_port)
+        ctx.call_on_close(server.shutdown)
+    if metrics_file:
+        dumper = metrics.Dumper(metrics_file, metrics_interval)
+        dumper.start()
+        ctx.call_on_close(dumper.stop)
+    if profile:
+        prof = profiling.Profile()
+        profiling.add_collector(prof)
+
+        def dump():
+            profiling.remove_collector(prof)
+            with io.open(profile, 'w', encoding='utf-8') as fp:
+                prof.dump(fp)
+        # also covers model loading in the subcommands and failed runs
+        ctx.call_on_close(dump)
+
+
+def open_image(im):
+    """
+    Opens an image file unless `im` already is an image, e.g. a frame of a
+    multi-page input. BitPages are unpacked into mode '1' images.
+    """
+    if isinstance(im, Image.Image):
+        return im
+    if isinstance(im, BitPage):
+        return im.to_pil()
+    try:
+        return Image.open(im)
+    except IOError as e:
+        raise click.BadParameter(str(e))
 
 
-@cli.resultcallback()
-def process_pipeline(subcommands, input, concurrency, verbose):
-    for io_pair in input:
+def blank_check(im, min_contrast, min_components):
+    """
+    Checks if an input image is blank, decoding JPEGs at reduced size.
+    """
+    if not isinstance(im, Image.Image):
+        im = open_image(im)
+        w, h = im.size
+        factor = max(w, h) // 1024
+        if factor > 1:
+            im = pages.load(im, ('L', (w // factor, h // factor)))
+    return blank.is_blank(im, min_contrast=min_contrast,
+                          min_components=min_components)
+
+
+def mktemp():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    return path
+
+
+def output_tmp(path):
+    """
+    Creates a temporary file in the directory of `path`. Renaming it to
+    `path` once it is complete ensures outputs are either complete or
+    missing.
+    """
+    path = os.path.abspath(path)
+    fd, tmp = util.mkstemp(os.path.dirname(path),
+                           prefix='.' + os.path.basename(path))
+    os.close(fd)
+    return tmp
+
+
+def in_context(ctx, fn):
+    """
+    Wraps a function to run with `ctx` as the current click context, e.g. in
+    a worker thread.
+    """
+    def wrapper(*args, **kwargs):
+        push_context(ctx)
         try:
-            base_image = io_pair[0]
-            fc = [io_pair[0]] + [tempfile.mkstemp()[1] for cmd in subcommands[1:]] + [io_pair[1]]
-            for task, input, output in zip(subcommands, fc, fc[1:]):
-                task(base_image=base_image, input=input, output=output)
-                base_image = input
+            return fn(*args, **kwargs)
         finally:
-            for f in fc[1:-1]:
-                os.unlink(f)
+            pop_context()
+    return wrapper
+
+
+def parse_budget(value, param, scale=1):
+    """
+    Parses a stage budget option into a number or a dict mapping stage names
+    to numbers.
+    """
+    if not value:
+        return None
+    try:
+        if '=' not in value:
+            return float(value) * scale
+        budget = {}
+        for item in value.split(','):
+            stage, limit = item.split('=')
+            budget[stage.strip()] = float(limit) * scale
+        return budget
+    except ValueError:
+        raise click.BadParameter('Expected a number or comma separated '
+                                 'stage=number pairs', param_hint=param)
+
+
+def read_manifest(path):
+    """
+    Reads the tab separated input/output pairs of a manifest file.
+    """
+    with io.open(path, 'r', encoding='utf-8') as fp:
+        for line in fp:
+            line = line.rstrip(u'\r\n')
+            if not line or line.startswith(u'#'):
+                continue
+            try:
+                in_path, out_path = line.split(u'\t')
+            except ValueError:
+                raise click.BadParameter(u'Invalid manifest line: {}'.format(line),
+                                         param_hint='manifest')
+            yield in_path, out_path
+
+
+def read_journal(path):
+    """
+    Returns the set of input/output pairs recorded as complete in a journal.
+    """
+    if not os.path.exists(path):
+        return set()
+    with io.open(path, 'r', encoding='utf-8') as fp:
+        # a crash can leave an incomplete last line without line break
+        return set(tuple(l[:-1].split(u'\t')) for l in fp if l.endswith(u'\n'))
+
+
+class PageJob(object):
+    """
+    A single page on its way through the subcommands.
+
+    Attributes:
+        in_path (unicode): Input file the page belongs to
+        out_path (unicode): Output path of the input as given by the user
+        target (unicode): File the output of the page is written to
+        image: Path or PIL.Image of the page
+        name (unicode): Name of the page used in outputs and messages
+        idx (int): Index of the page in a multi-page input
+        last (bool): True for the last page of an input
+        combined (bool): True if the page is appended to a combined output
+        blank (bool): True if the page has been found to be blank
+        files (list): The input of each subcommand followed by the output of
+                      the last one. Pages binarized for another subcommand
+                      are BitPages instead of files.
+        failed (unicode): Reason the page failed, e.g. an exceeded budget
+    """
+    def __init__(self, in_path, out_path, target, image, name, idx=0,
+                 last=True, combined=False):
+        self.in_path = in_path
+        self.out_path = out_path
+        self.target = target
+        self.image = image
+        self.name = name
+        self.idx = idx
+        self.last = last
+        self.combined = combined
+        self.blank = False
+        self.files = []
+        self.failed = None
+
+
+def input_frames(path):
+    """
+    Returns the number of pages of an input file. Files that can't be opened
+    count as a single page and fail when it is processed.
+    """
+    try:
+        return pages.frame_count(path)
+    except IOError:
+        return 1
+
+
+def page_refs(inputs):
+    """
+    Returns a (path, frame index) tuple for each page of a sequence of
+    input/output pairs without decoding any of them.
+    """
+    return [(in_path, idx) for in_path, _ in inputs for idx in
+            range(input_frames(in_path))]
+
+
+def page_jobs(inputs, mode=None):
+    """
+    Yields a PageJob for each page of a sequence of input/output pairs.
+    Multi-page inputs are written to one file per page if the output name
+    contains a {} placeholder for the page index and combined otherwise.
+    """
+    for in_path, out_path in inputs:
+        nframes = input_frames(in_path)
+        if nframes == 1:
+            yield PageJob(in_path, out_path, out_path, in_path, in_path)
+            continue
+        combined = '{' not in out_path
+        if combined and mode == 'hocr':
+            raise click.UsageError('Multi-page hOCR output requires a {} '
+                                   'placeholder for the page index in the '
+                                   'output file name.')
+        for _, idx, frame in pages.frames(in_path):
+            target = out_path if combined else out_path.format(idx)
+            yield PageJob(in_path, out_path, target, frame,
+                          u'{}[{}]'.format(in_path, idx), idx,
+                          idx == nframes - 1, combined)
+
+
+def create_files(tasks, job, atomic=True):
+    """
+    Creates the intermediate files of the subcommands of a page and the
+    temporary file its output is written to. Without `atomic` the output of a
+    single page is written to its target directly, so partial results can be
+    read while the page is processed.
+
+    Binarized pages are passed to the next subcommand in memory as packed
+    BitPages and get no file.
+    """
+    job.files = [job.image]
+    job.files.extend(None if task.func is binarizer else mktemp() for task in
+                     tasks[:-1])
+    if job.combined:
+        job.files.append(mktemp())
+    else:
+        job.files.append(output_tmp(job.target) if atomic else job.target)
+    return job
+
+
+def start_page(tasks, skip_blank, blank_contrast, blank_components, job,
+               atomic=True):
+    """
+    Checks if a page is blank, decodes it, and creates the intermediate files
+    of its subcommands unless they already exist.
+    """
+    if skip_blank:
+        with profiling.span('blank_check'):
+            job.blank = blank_check(job.image, blank_contrast,
+                                    blank_components)
+    if job.blank:
+        metrics.inc('kraken_pages_blank_total')
+        click.echo(u'Skipping blank page {}'.format(job.name))
+    else:
+        # decoding here instead of lazily in the first subcommand allows it
+        # to run ahead in background threads.
+        with profiling.span('decode'):
+            job.image = pages.load(open_image(job.image))
+    if job.files:
+        job.files[0] = job.image
+        return job
+    return create_files(tasks, job, atomic)
+
+
+def run_task(task, idx, job):
+    """
+    Runs the idx-th subcommand on a page.
+    """
+    with profiling.span(task.func.__name__):
+        res = task(base_image=job.files[max(idx - 1, 0)],
+                   input=job.files[idx], output=job.files[idx + 1],
+                   blank=job.blank, image_name=job.name)
+    if job.files[idx + 1] is None:
+        job.files[idx + 1] = res
+    return job
+
+
+def remove_files(job):
+    """
+    Removes all files created for a page.
+    """
+    for f in job.files[1:]:
+        if f is not None and not isinstance(f, BitPage) and os.path.exists(f):
+            os.unlink(f)
+    job.files = job.files[:1]
+
+
+def append_page(page, output, idx, image, separator=b'\f'):
+    """
+    Appends the output of a single page to a combined output file, as a
+    frame of a multi-page TIFF for images and separated from the previous
+    page by `separator` otherwise.
+    """
+    if image:
+        with Image.open(page) as im:
+            im.save(output, format='tiff', save_all=True, append=idx > 0)
+        return
+    with open(page, 'rb') as src, open(output, 'ab' if idx else 'wb') as dst:
+        if idx:
+            dst.write(separator)
+        dst.write(src.read())
+
+
+def process_pipeline_jobs(subcommands, inputs, skip_blank, blank_contrast,
+                          blank_components, pipeline_stages, queue_size,
+                          stage_workers, prefetch, budgets=None,
+                          failures=None, atomic=True):
+    """
+    Runs all pages of the inputs through the subcommands and yields the
+    input/output pairs whose outputs are complete.
+
+    If `pipeline_stages` is set the blank check and each subcommand run in
+    their own worker threads so the stages of consecutive pages overlap.
+    With `prefetch` up to that many pages are decoded ahead by the same
+    number of threads.
+
+    With `budgets`, a dict of keyword arguments of watchdog.supervise, each
+    page is processed in a worker process that is killed when it exceeds a
+    budget. The input/output pairs of failed pages are appended to
+    `failures` and the remaining inputs are processed.
+
+    With `atomic` outputs are written to temporary files renamed once they
+    are complete. Otherwise they are written in place.
+    """
+    ctx = click.get_current_context()
+    image = subcommands[-1].func is binarizer
+    # JSON lines identify their page by the image name
+    if subcommands[-1].func is recognizer and ctx.meta.get('mode') == 'jsonl':
+        separator = b''
+    else:
+        separator = b'\f'
+
+    live = set()
+
+    def start(job):
+        live.add(job)
+        return start_page(subcommands, skip_blank, blank_contrast,
+                          blank_components, job, atomic)
+
+    stages = [start] + [partial(run_task, task, idx) for idx, task in
+                        enumerate(subcommands)]
+    jobs = page_jobs(inputs, ctx.meta.get('mode'))
+    if pipeline_stages:
+        stages = [in_context(ctx, stage) for stage in stages]
+        workers = [max(prefetch, 1)] + (stage_workers or [])
+        workers += [1] * (len(stages) - len(workers))
+        done = pipeline.run(jobs, [(stage, n) for stage, n in
+                                   zip(stages, workers)], queue_size, 'pages')
+    else:
+        if prefetch:
+            jobs = pipeline.run(jobs, [(in_context(ctx, stages[0]), prefetch)],
+                                prefetch, 'prefetch')
+            stages = stages[1:]
+
+        def sequential(job):
+            for stage in stages:
+                job = stage(job)
+            return job
+
+        def supervised(job):
+            if (job.in_path, job.out_path) in failed:
+                job.failed = u'previous page failed'
+                return job
+            live.add(job)
+            create_files(subcommands, job, atomic)
+
+            def work(checkpoint, job=job):
+                checkpoint('decode')
+                job = stages[0](job)
+                for stage, task in zip(stages[1:], subcommands):
+                    checkpoint(STAGE_NAMES[task.func])
+                    job = stage(job)
+                return job.blank
+            try:
+                job.blank = watchdog.supervise(work, **budgets)
+            except (KrakenBudgetException, KrakenWorkerException) as e:
+                job.failed = str(e)
+            except Exception as e:
+                job.failed = u'{}: {}'.format(type(e).__name__, e)
+            return job
+        done = ((supervised if budgets else sequential)(job) for job in jobs)
+
+    failed = set()
+    combined = None
+    try:
+        for job in done:
+            if job.failed:
+                pair = (job.in_path, job.out_path)
+                remove_files(job)
+                live.discard(job)
+                if job.combined and combined:
+                    os.unlink(combined)
+                    combined = None
+                if pair not in failed:
+                    failed.add(pair)
+                    if failures is not None:
+                        failures.append(pair)
+                    click.secho(u'\nFailed {}: {}'.format(job.name, job.failed),
+                                fg='red')
+                    metrics.inc('kraken_pages_failed_total')
+                continue
+            if job.combined:
+                if job.idx == 0:
+                    combined = output_tmp(job.target) if atomic else job.target
+                append_page(job.files[-1], combined, job.idx, image, separator)
+                os.unlink(job.files[-1])
+                if job.last:
+                    if atomic:
+                        os.rename(combined, job.target)
+                    combined = None
+            elif atomic:
+                os.rename(job.files[-1], job.target)
+            job.files.pop()
+            remove_files(job)
+            live.discard(job)
+            metrics.inc('kraken_pages_total')
+            if job.last:
+                yield job.in_path, job.out_path
+    except Exception:
+        metrics.inc('kraken_pages_failed_total')
+        raise
+    finally:
+        for job in live:
+            remove_files(job)
+        if combined:
+            os.unlink(combined)
+
+
+@cli.resultcallback()
+def process_pipeline(subcommands, input, concurrency, manifest, journal,
+                     verbose, skip_blank, blank_contrast, blank_components,
+                     pipeline_stages, queue_size, stage_workers, prefetch,
+                     profile, metrics_port, metrics_file, metrics_interval,
+                     page_timeout, page_memory, stage_timeout, stage_memory):
+    if stage_workers:
+        try:
+            stage_workers = [int(x) for x in stage_workers.split(',')]
+        except ValueError:
+            raise click.BadParameter('Expected comma separated integers',
+                                     param_hint='stage-workers')
+        # recognition models keep state between calls and can't be shared
+        # between threads.
+        for task, n in zip(subcommands, stage_workers):
+            if task.func is recognizer and n > 1:
+                raise click.BadParameter('ocr can only be run by a single '
+                                         'worker', param_hint='stage-workers')
+    budgets = None
+    if page_timeout or page_memory or stage_timeout or stage_memory:
+        # threads can't be killed so budgets require running each page in a
+        # worker process.
+        if pipeline_stages or prefetch:
+            raise click.UsageError('Budgets can not be combined with '
+                                   '--pipeline or --prefetch.')
+        budgets = {'timeout': page_timeout,
+                   'memory': page_memory and page_memory * 2**20,
+                   'stage_timeout': parse_budget(stage_timeout,
+                                                 'stage-timeout'),
+                   'stage_memory': parse_budget(stage_memory, 'stage-memory',
+                                                2**20)}
+    failures = []
+    run = partial(process_pipeline_jobs, subcommands,
+                  skip_blank=skip_blank, blank_contrast=blank_contrast,
+                  blank_components=blank_components,
+                  pipeline_stages=pipeline_stages, queue_size=queue_size,
+                  stage_workers=stage_workers, prefetch=prefetch,
+                  budgets=budgets, failures=failures,
+                  # only manifest runs rely on complete outputs to resume
+                  atomic=bool(manifest))
+    process_inputs(run, input, manifest, journal)
+    if failures:
+        click.secho(u'{} input(s) failed:'.format(len(failures)), fg='red')
+        for in_path, _ in failures:
+            click.echo(u'\t{}'.format(in_path))
+        click.get_current_context().exit(1)
+
+
+def pending_inputs(input, manifest, journal):
+    """
+    Yields the input/output pairs given with -i and in the manifest that are
+    not recorded as complete in the journal.
+    """
+    if not manifest:
+        for pair in input:
+            yield pair
+        return
+    done = read_journal(journal or manifest + '.journal')
+    for pair in chain(input, read_manifest(manifest)):
+        if pair not in done:
+            yield pair
+
+
+def process_inputs(run, input, manifest, journal):
+    """
+    Runs the input/output pairs given with -i and in the manifest and records
+    finished pairs in the journal.
+    """
+    inputs = pending_inputs(input, manifest, journal)
+    if not manifest:
+        for _ in run(inputs):
+            pass
+        return
+    if not journal:
+        journal = manifest + '.journal'
+    with io.open(journal, 'a', encoding='utf-8') as jf:
+        for in_path, out_path in run(inputs):
+            # outputs are complete once they have been renamed so an entry
+            # in the journal always refers to finished work.
+            jf.write(u'{}\t{}\n'.format(in_path, out_path))
+            jf.flush()
+            os.fsync(jf.fileno())
 
 
 @cli.command('binarize')
+@click.option('-m', '--method', default='nlbin',
+              type=click.Choice(['nlbin', 'sauvola', 'niblack']),
+              help='Binarization method. sauvola and niblack are local '
+              'threshold methods for clean documents that are much faster '
+              'than nlbin.')
 @click.option('--threshold', default=0.5, type=click.FLOAT)
 @click.option('--zoom', default=0.5, type=click.FLOAT)
 @click.option('--escale', default=1.0, type=click.FLOAT)
@@ -156,21 +745,61 @@ def process_pipeline(subcommands, input, concurrency, verbose):
 @click.option('--range', default=20, type=click.INT)
 @click.option('--low', default=5, type=click.IntRange(1, 100))
 @click.option('--high', default=90, type=click.IntRange(1, 100))
-def binarize(threshold, zoom, escale, border, perc, range, low, high):
+@click.option('--fast-background/--exact-background', default=False,
+              help='Approximate the page background estimation for speed.')
+@click.option('--tile-size', default=0, type=click.IntRange(0, None),
+              help='Binarize large images in tiles of this size to bound '
+              'memory use. 0 processes the whole page at once.')
+@click.option('--window', default=15, type=click.IntRange(1, None),
+              help='Window size of the local threshold methods.')
+@click.option('-k', default=None, type=click.FLOAT,
+              help='Standard deviation weight of the local threshold '
+              'methods. Defaults to 0.2 for sauvola and -0.2 for niblack.')
+@click.option('--sample-pages', default=0, type=click.IntRange(0, None),
+              help='Estimate black and white levels once from this many '
+              'input pages and use them for all pages. 0 estimates them for '
+              'each page.')
+def binarize(method, threshold, zoom, escale, border, perc, range, low, high,
+             fast_background, tile_size, window, k, sample_pages):
     """
     Binarizes page images.
     """
-    return partial(binarizer, threshold, zoom, escale, border, perc, range, low, high)
+    thresholds = None
+    if sample_pages and method == 'nlbin':
+        params = click.get_current_context().parent.params
+        click.echo('Estimating thresholds\t', nl=False)
+        try:
+            # the same pages the run processes, including the manifest and
+            # all frames of multi-page files
+            inputs = page_refs(pending_inputs(params['input'],
+                                              params['manifest'],
+                                              params['journal']))
+            thresholds = binarization.estimate_thresholds(inputs, sample_pages,
+                                                          params['concurrency'],
+                                                          zoom, escale, border,
+                                                          perc, range, low,
+                                                          high, fast_background)
+        except:
+            click.secho(u'\u2717', fg='red')
+            raise
+        click.secho(u'\u2713', fg='green')
+    return partial(binarizer, method, threshold, zoom, escale, border, perc,
+                   range, low, high, fast_background, tile_size, window, k,
+                   thresholds)
 
 
 @cli.command('segment')
+@click.option('-e', '--engine', default='ocropus',
+              type=click.Choice(['ocropus', 'projection']),
+              help='Segmentation engine. projection is a fast segmenter for '
+              'simple single column pages.')
 @click.option('--scale', default=None, type=click.FLOAT)
 @click.option('-b/-w', '--black_colseps/--white_colseps', default=False)
-def segment(scale=None, black_colseps=False):
+def segment(engine='ocropus', scale=None, black_colseps=False):
     """
     Segments page images into text lines.
     """
-    return partial(segmenter, scale, black_colseps)
+    return partial(segmenter, engine, scale, black_colseps)
 
 
 @cli.command('ocr')
@@ -179,13 +808,28 @@ def segment(scale=None, black_colseps=False):
               'recognition model')
 @click.option('-p', '--pad', type=click.INT, default=16, help='Left and right '
               'padding around lines')
-@click.option('-h/-t', '--hocr/--text', default=False, help='Switch between '
-              'hOCR and plain text output')
+@click.option('--max-space', type=click.IntRange(0, None), default=0,
+              help='Trim blank columns at both ends of each line and shorten '
+              'blank runs between words to this many columns of the '
+              'normalized line. 0 disables it.')
+@click.option('--bucket-lines/--no-bucket-lines', default=False,
+              help='Recognize the lines of a page grouped by width to reuse '
+              'network buffers. Results are written in reading order once '
+              'all lines have been normalized.')
+@click.option('-h', '--hocr', 'mode', flag_value='hocr', help='Write hOCR '
+              'output')
+@click.option('-t', '--text', 'mode', flag_value='text', default=True,
+              help='Write plain text output (default)')
+@click.option('-j', '--jsonl', 'mode', flag_value='jsonl', help='Write one '
+              'JSON object per line')
+@click.option('--flush', default=1, type=click.IntRange(0, None),
+              help='Flush output after this many lines. 0 flushes only when '
+              'a page is complete.')
 @click.option('-l', '--lines', type=click.Path(exists=True),
               help='JSON file containing line coordinates')
 @click.option('--enable-autoconversion/--disable-autoconversion', 'conv',
               default=True, help='Automatically convert pyrnn models zu HDF5')
-def ocr(ctx, model, pad, hocr, lines, conv):
+def ocr(ctx, model, pad, max_space, bucket_lines, mode, flush, lines, conv):
     """
     Recognizes text in line images.
     """
@@ -211,7 +855,10 @@ def ocr(ctx, model, pad, hocr, lines, conv):
         raise click.BadParameter('No model found')
     click.echo('Loading RNN\t', nl=False)
     try:
-        rnn = models.load_any(location)
+        st_time = time.time()
+        with profiling.span('load_model'):
+            rnn = models.load_any(location)
+        metrics.set_gauge('kraken_model_load_seconds', time.time() - st_time)
     except:
         click.secho(u'\u2717', fg='red')
         raise
@@ -229,11 +876,10 @@ def ocr(ctx, model, pad, hocr, lines, conv):
         models.pyrnn_to_pronn(rnn, op)
 
     # set output mode
-    if hocr:
-        ctx.meta['mode'] = 'hocr'
-    else:
-        ctx.meta['mode'] = 'text'
-    return partial(recognizer, model=rnn, pad=pad, lines=lines)
+    ctx.meta['mode'] = mode
+    ctx.meta['flush'] = flush
+    return partial(recognizer, model=rnn, pad=pad, max_space=max_space,
+                   bucket_lines=bucket_lines, lines=lines)
 
 
 
@@ -0,0 +1,184 @@
+"""
+kraken.lib.bitpage
+~~~~~~~~~~~~~~~~~~
+
+A bi-level page packed to one bit per pixel. Cheap whole page operations
+(emptiness checks, projections, cropping) run directly on the packed data
+which is also 8 times smaller than a byte per pixel array when storing or
+transferring binarized pages.
+"""
+
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+from builtins import range
+from builtins import object
+
+import numpy as np
+
+from PIL import Image
+
+from kraken.lib import morph
+from kraken.lib.util import pil2array
+
+# number of set bits for each byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], 'B')
+
+
+class BitPage(object):
+    """
+    A bi-level page with ink pixels packed as set bits along rows, most
+    significant bit first, as produced by numpy.packbits(axis=1). Padding
+    bits at the end of each row are always zero.
+
+    Attributes:
+        bits (numpy.array): uint8 array of shape (height, ceil(width/8))
+        shape (tuple): (height, width) of the page
+    """
+    def __init__(self, bits, shape):
+        self.bits = bits
+        self.shape = tuple(shape)
+
+    @classmethod
+    def from_array(cls, binary):
+        """
+        Packs a 2D array with non-zero values for ink.
+        """
+        return cls(np.packbits(np.asarray(binary) != 0, axis=1), binary.shape)
+
+    @classmethod
+    def from_pil(cls, im):
+        """
+        Packs a bi-level PIL image with black ink.
+
+        Mode '1' images are packed straight from their raw data without
+        creating a byte per pixel array.
+        """
+        w, h = im.size
+        if im.mode == '1':
+            bits = np.frombuffer(im.tobytes(), 'B').reshape(h, -1)
+            page = cls(np.invert(bits), (h, w))
+            page._clear_padding()
+            return page
+        a = pil2array(im)
+        return cls.from_array(a <= 0.5*(np.amin(a) + np.amax(a)))
+
+    @classmethod
+    def frombytes(cls, data, shape):
+        """
+        Creates a page from the packed data returned by tobytes().
+        """
+        h, w = shape
+        return cls(np.frombuffer(data, 'B').reshape(h, (w + 7)//8), shape)
+
+    def tobytes(self):
+        """
+        Returns the packed bits of the page as a byte string.
+        """
+        return self.bits.tobytes()
+
+    def _clear_padding(self):
+        pad = 8*self.bits.shape[1] - self.shape[1]
+        if pad:
+            self.bits[:, -1] &= (0xff << pad) & 0xff
+
+    def to_array(self):
+        """
+        Unpacks the page into a uint8 array with 1 for ink.
+        """
+        return np.unpackbits(self.bits, axis=1)[:, :self.shape[1]]
+
+    def to_pil(self):
+        """
+        Returns the page as a PIL image of mode '1' with black ink.
+        """
+        h, w = self.shape
+        return Image.frombytes('1', (w, h), np.invert(self.bits).tobytes())
+
+    def is_empty(self):
+        """
+        True if the page contains no ink.
+        """
+        return not self.bits.any()
+
+    def row_projection(self):
+        """
+        Number of ink pixels in each row.
+        """
+        return _POPCOUNT[self.bits].sum(axis=1, dtype=np.int32)
+
+    def column_projection(self):
+        """
+        Number of ink pixels in each column.
+        """
+        proj = np.zeros(self.bits.shape[1] * 8, np.int32)
+        for k in range(8):
+            proj[k::8] = ((self.bits >> (7 - k)) & 1).sum(axis=0,
+                                                           dtype=np.int32)
+        return proj[:self.shape[1]]
+
+    def crop(self, box):
+        """
+        Crops a box (x0, y0, x1, y1) out of the page. Only the bytes covering
+        the box are unpacked.
+
+        Returns:
+            BitPage of the box
+        """
+        x0, y0, x1, y1 = box
+        b0, b1 = x0//8, (x1 + 7)//8
+        if x0 % 8 == 0:
+            bits = self.bits[y0:y1, b0:b1].copy()
+            page = BitPage(bits, (bits.shape[0], x1 - x0))
+            page._clear_padding()
+            return page
+        region = np.unpackbits(self.bits[y0:y1, b0:b1], axis=1)
+        return BitPage.from_array(region[:, x0 - 8*b0:x1 - 8*b0])
+
+    def hline_candidates(self, minwidth):
+        """
+        Finds rows which may contain a horizontal run of at least `minwidth`
+        ink pixels.
+
+        A run of `minwidth` pixels starting anywhere in a byte covers at
+        least (minwidth - 7)//8 fully inked bytes, so rows are found by run
+        lengths of 0xff bytes without unpacking. The result is a superset of
+        the rows containing such runs. Runs too short to be guaranteed a full
+        byte are searched for on the unpacked rows.
+
+        Returns:
+            numpy.array of row indices.
+        """
+        nbytes = (minwidth - 7)//8
+        if nbytes > 0:
+            full = (self.bits == 0xff).view('b')
+        else:
+            full, nbytes = self.to_array().view('b'), minwidth
+        edges = np.diff(full, axis=1, prepend=0, append=0)
+        ys, starts = np.nonzero(edges == 1)
+        _, stops = np.nonzero(edges == -1)
+        return np.unique(ys[stops - starts >= nbytes])
+
+    def label(self, **kw):
+        """
+        Labels the connected components of the page.
+
+        Returns:
+            (labels, n) as returned by kraken.lib.morph.label
+        """
+        return morph.label(self.to_array(), **kw)
+
+    def find_objects(self):
+        """
+        Returns the bounding slices of the connected components of the page.
+        Only the bytes within the bounding box of the ink are unpacked.
+        """
+        ys = np.flatnonzero(self.bits.any(axis=1))
+        if not len(ys):
+            return []
+        xs = np.flatnonzero(self.bits.any(axis=0))
+        y0, b0 = ys[0], xs[0]
+        region = np.unpackbits(self.bits[y0:ys[-1] + 1, b0:xs[-1] + 1], axis=1)
+        x0 = 8*b0
+        return [(slice(sy.start + y0, sy.stop + y0),
+                 slice(sx.start + x0, sx.stop + x0))
+                for sy, sx in morph.find_objects(morph.label(region)[0])]
@@ -51,3 +51,20 @@ class KrakenCairoSurfaceException(Exception):
 
     def __repr__(self):
         return repr(self.message)
+
+
+class KrakenBudgetException(Exception):
+    """
+    Raised when a supervised task exceeds its time or memory budget.
+    """
+    def __init__(self, message=None):
+        Exception.__init__(self, message)
+
+
+class KrakenWorkerException(Exception):
+    """
+    Raised when a supervised worker process terminates without a result,
+    e.g. because it was killed by the operating system.
+    """
+    def __init__(self, message=None):
+        Exception.__init__(self, message)
@@ -136,10 +136,23 @@ def translate_back_locations(outputs, threshold=0.5):
     return x
 
 
+def bucket_size(n,minimum=64):
+    """Return the capacity of the width bucket of a sequence of length `n`,
+    the smallest power of two that is at least `n` and `minimum`."""
+    size = minimum
+    while size < n:
+        size *= 2
+    return size
+
+
 class Network:
     def predict(self,xs):
         """Prediction is the same as forward propagation."""
         return self.forward(xs)
+    def preallocate(self,sizes):
+        """Preallocate internal buffers for sequences of the given bucket
+        sizes. Networks without such buffers ignore it."""
+        pass
 
 class Softmax(Network):
     """A logistic regression network."""
@@ -203,28 +216,55 @@ class LSTM(Network):
         for w in "WIP WFP WOP".split():
             setattr(self,w,randu(ns)*initial)
             setattr(self,"D"+w,np.zeros(ns))
-    def allocate(self,n):
-        """Allocate space for the internal state variables.
-        `n` is the maximum sequence length that can be processed."""
+    def buffers(self,n):
+        """Create the internal state variables for sequences of up to `n`
+        steps as a dict."""
         ni,ns,na = self.dims
         vars = "cix ci gix gi gox go gfx gf"
         vars += " state output gierr gferr goerr cierr stateerr outerr"
-        for v in vars.split():
-            setattr(self,v,np.nan*np.ones((n,ns)))
-        self.source = np.nan*np.ones((n,na))
-        self.sourceerr = np.nan*np.ones((n,na))
+        buffers = dict((v,np.nan*np.ones((n,ns))) for v in vars.split())
+        buffers["source"] = np.nan*np.ones((n,na))
+        buffers["sourceerr"] = np.nan*np.ones((n,na))
+        return buffers
+    def allocate(self,n):
+        """Allocate space for the internal state variables.
+        `n` is the maximum sequence length that can be processed."""
+        for v,a in self.buffers(n).items():
+            setattr(self,v,a)
+    def preallocate(self,sizes):
+        """Allocate a pool of internal state variables with one set per
+        bucket size. Sequences then use the smallest set fitting them
+        instead of growing a single one, so short sequences touch little
+        memory and nothing is reallocated for long ones."""
+        pool = getattr(self,"pool",None)
+        if pool is None:
+            pool = self.pool = {}
+        for n in sizes:
+            if n not in pool:
+                pool[n] = self.buffers(n)
+        # release the default buffers
+        for v,a in pool[max(pool)].items():
+            setattr(self,v,a)
     def reset(self,n):
-        """Reset the contents of the internal state variables to `nan`"""
+        """Reset the contents of the internal state variables of the first
+        `n` steps to `nan`"""
         vars = "cix ci gix gi gox go gfx gf"
         vars += " state output gierr gferr goerr cierr stateerr outerr"
         vars += " source sourceerr"
         for v in vars.split():
-            getattr(self,v)[:,:] = np.nan
+            getattr(self,v)[:n] = np.nan
     def forward(self,xs):
         """Perform forward propagation of activations."""
         ni,ns,na = self.dims
         assert len(xs[0])==ni
         n = len(xs)
+        pool = getattr(self,"pool",None)
+        if pool:
+            size = bucket_size(n)
+            if size not in pool:
+                pool[size] = self.buffers(size)
+            for v,a in pool[size].items():
+                setattr(self,v,a)
         # grow internal state arrays if len(xs) > maxlen
         if n > self.gi.shape[0]:
             self.allocate(n)
@@ -267,6 +307,9 @@ class Stacked(Network):
         for i,net in enumerate(self.nets):
             xs = net.forward(xs)
         return xs
+    def preallocate(self,sizes):
+        for net in self.nets:
+            net.preallocate(sizes)
 
 class Reversed(Network):
     """Run a network on the time-reversed input."""
@@ -274,6 +317,8 @@ class Reversed(Network):
         self.net = net
     def forward(self,xs):
         return self.net.forward(xs[::-1])[::-1]
+    def preallocate(self,sizes):
+        self.net.preallocate(sizes)
 
 class Parallel(Network):
     """Run multiple networks in parallel on the same input."""
@@ -284,6 +329,9 @@ class Parallel(Network):
         outputs = list(zip(*outputs))
         outputs = [np.concatenate(l) for l in outputs]
         return outputs
+    def preallocate(self,sizes):
+        for net in self.nets:
+            net.preallocate(sizes)
 
 def BIDILSTM(Ni,Ns,No):
     """A bidirectional LSTM, constructed from regular and reversed LSTMs."""
@@ -311,6 +359,8 @@ class SeqRecognizer(Network):
         assert xs.shape[1]==self.Ni,"wrong image height (image: %d, expected: %d)"%(xs.shape[1],self.Ni)
         self.outputs = np.array(self.lstm.forward(xs))
         return translate_back(self.outputs)
+    def preallocate(self,sizes):
+        self.lstm.preallocate(sizes)
     def l2s(self,l):
         "Convert a code sequence into a unicode string after recognition."
         l = self.codec.decode(l)
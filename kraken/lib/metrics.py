@@ -0,0 +1,369 @@
+"""
+kraken.lib.metrics
+~~~~~~~~~~~~~~~~~~
+
+An optional registry of counters, gauges, and histograms for monitoring
+long-running batch and server processes, exported in the Prometheus text
+format over HTTP or to a file.
+
+Metrics are disabled by default and the update functions of this module
+return immediately until enable() has been called. Once enabled, the
+durations of all profiling spans are recorded in the ``kraken_span_seconds``
+histogram in addition to the counters fed by the recognizer, the segmenter,
+and the command line pipeline::
+
+    registry = metrics.enable()
+    server = metrics.serve(9100)
+"""
+
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+from future import standard_library
+standard_library.install_aliases()
+
+import io
+import os
+import threading
+
+from collections import OrderedDict
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from kraken.lib import profiling
+from kraken.lib import util
+
+__all__ = ['Counter', 'Gauge', 'Histogram', 'Registry', 'enable', 'disable',
+           'inc', 'set_gauge', 'observe', 'serve', 'dump', 'Dumper']
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0, 60.0, 300.0)
+
+registry = None
+
+
+def _format_value(v):
+    if v == float('inf'):
+        return '+Inf'
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15:
+        return '{:.1f}'.format(v)
+    return repr(v)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v.replace('\\', '\\\\')
+                                                .replace('"', '\\"')
+                                                .replace('\n', '\\n'))
+                          for k, v in labels) + '}'
+
+
+class _Metric(object):
+    """
+    Base class of metrics holding one value per combination of labels.
+    """
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = OrderedDict()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('Expected labels {} for {}'.format(self.labelnames,
+                                                               self.name))
+        return tuple((k, '{}'.format(labels[k])) for k in self.labelnames)
+
+    def samples(self):
+        """
+        Returns a list of (name, labels, value) tuples of the metric.
+        """
+        with self.lock:
+            return [(self.name, key, v) for key, v in self.values.items()]
+
+    def exposition(self):
+        """
+        Returns the metric in the Prometheus text format.
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.help),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        for name, labels, v in self.samples():
+            lines.append('{}{} {}'.format(name, _format_labels(labels),
+                                          _format_value(v)))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing count, e.g. of processed lines.
+    """
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        super(Counter, self).__init__(name, help, labelnames)
+        if not self.labelnames:
+            self.values[()] = 0
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def value(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    """
+    A value that can go up and down, e.g. a queue length.
+    """
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values, e.g. latencies, in cumulative buckets.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts, _, _ = h = self.values[key]
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[idx] += 1
+                    break
+            h[1] += value
+            h[2] += 1
+
+    def samples(self):
+        res = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                acc = 0
+                for bound, c in zip(self.buckets, counts):
+                    acc += c
+                    res.append((self.name + '_bucket',
+                                key + (('le', _format_value(float(bound))),),
+                                acc))
+                res.append((self.name + '_sum', key, total))
+                res.append((self.name + '_count', key, count))
+        return res
+
+
+class Registry(object):
+    """
+    A collection of metrics.
+    """
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _add(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError('Duplicate metric {}'.format(metric.name))
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def get(self, name):
+        return self.metrics[name]
+
+    def exposition(self):
+        """
+        Returns all metrics in the Prometheus text format.
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return ''.join(m.exposition() for m in metrics)
+
+
+def _kraken_registry():
+    """
+    Creates a registry containing the metrics fed by kraken.
+    """
+    r = Registry()
+    r.counter('kraken_pages_total', 'Pages processed completely')
+    r.counter('kraken_pages_blank_total', 'Pages skipped as blank')
+    r.counter('kraken_pages_failed_total', 'Pages whose processing failed')
+    r.counter('kraken_segment_pages_total', 'Pages segmented')
+    r.counter('kraken_segment_lines_total', 'Lines found by the segmenter')
+    r.counter('kraken_lines_total', 'Lines recognized')
+    r.counter('kraken_lines_empty_total', 'Lines without any content')
+    r.counter('kraken_lines_failed_total', 'Lines that could not be '
+              'normalized')
+    r.gauge('kraken_queue_depth', 'Items waiting in front of a pipeline '
+            'stage', ('pipeline', 'stage'))
+    r.gauge('kraken_model_load_seconds', 'Time spent loading the last '
+            'recognition model')
+    r.histogram('kraken_span_seconds', 'Duration of processing steps',
+                ('span',))
+    return r
+
+
+def _span_collector(name, start, duration):
+    if registry is not None:
+        registry.get('kraken_span_seconds').observe(duration, span=name)
+
+
+def enable(reg=None):
+    """
+    Enables metrics collection.
+
+    Args:
+        reg (Registry): Registry to collect into. It has to contain the
+                        metrics of the default registry. A new one is created
+                        if not given.
+
+    Returns:
+        The active registry.
+    """
+    global registry
+    if registry is None:
+        profiling.add_collector(_span_collector)
+    registry = reg or _kraken_registry()
+    return registry
+
+
+def disable():
+    """
+    Disables metrics collection.
+    """
+    global registry
+    if registry is not None:
+        profiling.remove_collector(_span_collector)
+    registry = None
+
+
+def inc(name, value=1, **labels):
+    """
+    Increments a counter if metrics are enabled.
+    """
+    if registry is not None:
+        registry.get(name).inc(value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    """
+    Sets a gauge if metrics are enabled.
+    """
+    if registry is not None:
+        registry.get(name).set(value, **labels)
+
+
+def observe(name, value, **labels):
+    """
+    Adds an observation to a histogram if metrics are enabled.
+    """
+    if registry is not None:
+        registry.get(name).observe(value, **labels)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        reg = self.server.registry or registry
+        body = (reg.exposition() if reg else '').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, address='127.0.0.1', reg=None):
+    """
+    Serves the metrics in the Prometheus text format over HTTP from a
+    background thread.
+
+    Args:
+        port (int): Port to listen on. 0 selects a free port.
+        address (unicode): Address to bind to
+        reg (Registry): Registry to serve. Defaults to the active one.
+
+    Returns:
+        The HTTPServer. Its server_address attribute contains the port
+        actually bound and shutdown() stops it.
+    """
+    server = HTTPServer((address, port), _Handler)
+    server.registry = reg
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server
+
+
+def dump(path, reg=None):
+    """
+    Writes the metrics in the Prometheus text format to a file. The file is
+    replaced atomically so readers never see partial contents.
+
+    Args:
+        path (unicode): Output file
+        reg (Registry): Registry to write. Defaults to the active one.
+    """
+    reg = reg or registry
+    path = os.path.abspath(path)
+    fd, tmp = util.mkstemp(os.path.dirname(path))
+    try:
+        with io.open(fd, 'w', encoding='utf-8') as fp:
+            fp.write(reg.exposition() if reg else '')
+        os.rename(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Dumper(threading.Thread):
+    """
+    A background thread writing the metrics to a file periodically, e.g.
+    for the textfile collector of the Prometheus node exporter.
+    """
+    def __init__(self, path, interval=10.0, reg=None):
+        super(Dumper, self).__init__()
+        self.daemon = True
+        self.path = path
+        self.interval = interval
+        self.reg = reg
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            dump(self.path, self.reg)
+
+    def stop(self):
+        """
+        Stops the thread and writes the metrics a last time.
+        """
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        dump(self.path, self.reg)
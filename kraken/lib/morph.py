@@ -83,32 +83,44 @@ def r_closing(image, size, origin=0):
     return r_erosion(image, size, origin=0)
 
 
-def rb_dilation(image, size, origin=0):
-    """Binary dilation using linear filters."""
-    output = np.zeros(image.shape, 'f')
+def rb_dilation(image, size, origin=0, output=None):
+    """Binary dilation using linear filters.
+
+    The filter response is accumulated in a float32 buffer which may be
+    passed in as `output` to be reused across calls. Returns a uint8 mask.
+    """
+    if output is None:
+        output = np.empty(image.shape, 'f')
     filters.uniform_filter(image, size, output=output, origin=origin,
                            mode='constant', cval=0)
-    return np.array(output > 0, 'i')
+    return (output > 0).view('B')
+
 
+def rb_erosion(image, size, origin=0, output=None):
+    """Binary erosion using linear filters.
 
-def rb_erosion(image, size, origin=0):
-    """Binary erosion using linear filters."""
-    output = np.zeros(image.shape, 'f')
+    The filter response is accumulated in a float32 buffer which may be
+    passed in as `output` to be reused across calls. Returns a uint8 mask.
+    """
+    if output is None:
+        output = np.empty(image.shape, 'f')
     filters.uniform_filter(image, size, output=output, origin=origin,
                            mode='constant', cval=1)
-    return np.array(output == 1, 'i')
+    return (output == 1).view('B')
 
 
 def rb_opening(image, size, origin=0):
     """Binary opening using linear filters."""
-    image = rb_erosion(image, size, origin=origin)
-    return rb_dilation(image, size, origin=origin)
+    output = np.empty(image.shape, 'f')
+    image = rb_erosion(image, size, origin=origin, output=output)
+    return rb_dilation(image, size, origin=origin, output=output)
 
 
 def rb_closing(image, size, origin=0):
     """Binary closing using linear filters."""
-    image = rb_dilation(image, size, origin=origin)
-    return rb_erosion(image, size, origin=origin)
+    output = np.empty(image.shape, 'f')
+    image = rb_dilation(image, size, origin=origin, output=output)
+    return rb_erosion(image, size, origin=origin, output=output)
 
 
 def rg_dilation(image, size, origin=0):
@@ -133,14 +145,34 @@ def rg_closing(image, size, origin=0):
     return r_erosion(image, size, origin=0)
 
 
-def spread_labels(labels, maxdist=9999999):
-    """Spread the given labels to the background"""
-    distances, features = morphology.distance_transform_edt(labels == 0,
-                                                            return_distances=1,
-                                                            return_indices=1)
-    indexes = features[0] * labels.shape[1] + features[1]
-    spread = labels.ravel()[indexes.ravel()].reshape(*labels.shape)
-    spread *= (distances < maxdist)
+def spread_labels(labels, maxdist=9999999, stripe=256):
+    """Spread the given labels to the background up to a distance of
+    `maxdist`.
+
+    The distance transform is computed over horizontal stripes of `stripe`
+    rows, each extended by `maxdist` rows above and below. As every label
+    closer than `maxdist` to a pixel lies inside the extended stripe the
+    result is identical to a transform over the whole image while only
+    stripe sized distance and index arrays are allocated."""
+    h = labels.shape[0]
+    margin = int(np.ceil(maxdist))
+    if stripe + 2 * margin >= h:
+        stripe = h
+    spread = np.zeros_like(labels)
+    for y0 in range(0, h, stripe):
+        y1 = min(y0 + stripe, h)
+        w0, w1 = max(0, y0 - margin), min(h, y1 + margin)
+        window = labels[w0:w1]
+        # no labels within reach of this stripe
+        if not window.any():
+            continue
+        distances, features = morphology.distance_transform_edt(window == 0,
+                                                                return_distances=1,
+                                                                return_indices=1)
+        core = slice(y0 - w0, y1 - w0)
+        out = window[features[0][core], features[1][core]]
+        out *= (distances[core] < maxdist)
+        spread[y0:y1] = out
     return spread
 
 
@@ -194,7 +226,7 @@ def select_regions(binary, f, min=0, nbest=100000):
     objects = find_objects(labels)
     scores = [f(o) for o in objects]
     best = np.argsort(scores)
-    keep = np.zeros(len(objects) + 1, 'i')
+    keep = np.zeros(len(objects) + 1, 'B')
     for i in best[-nbest:]:
         if scores[i] <= min:
             continue
@@ -0,0 +1,102 @@
+"""
+kraken.lib.pages
+~~~~~~~~~~~~~~~~
+
+Lazy iteration over the pages of multi-page image files, e.g. TIFFs with
+hundreds of frames, and sequences of image files. Only a single frame is
+decoded at any time so memory use doesn't depend on the number of pages.
+Images can also be decoded ahead of their use in background threads.
+"""
+
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+from functools import partial
+
+from PIL import Image
+
+from kraken.lib import pipeline
+
+
+def frame_count(im):
+    """
+    Returns the number of frames of an image or image file.
+    """
+    if not isinstance(im, Image.Image):
+        with Image.open(im) as im:
+            return getattr(im, 'n_frames', 1)
+    return getattr(im, 'n_frames', 1)
+
+
+def frames(*ims):
+    """
+    Iterates over the frames of images or image files with Image.seek.
+
+    Files are opened only when their first frame is requested and closed
+    after their last one.
+
+    Args:
+        *ims: PIL.Image objects or paths to image files
+
+    Yields:
+        (source, index, PIL.Image) tuples of the image or path each frame
+        belongs to, the index of the frame in it, and a copy of the frame.
+    """
+    for source in ims:
+        if isinstance(source, Image.Image):
+            im = source
+        else:
+            im = Image.open(source)
+        try:
+            idx = 0
+            while True:
+                try:
+                    im.seek(idx)
+                except EOFError:
+                    break
+                yield source, idx, im.copy()
+                idx += 1
+        finally:
+            if im is not source:
+                im.close()
+
+
+def load(im, draft=None):
+    """
+    Opens an image file and decodes it completely. PIL otherwise decodes
+    images lazily on first access to their pixels.
+
+    Args:
+        im: PIL.Image or path to an image file
+        draft (tuple): (mode, size) tuple passed to Image.draft to decode
+                       JPEGs at the smallest reduced resolution not smaller
+                       than size, e.g. for thumbnails.
+
+    Returns:
+        The loaded PIL.Image.
+    """
+    if not isinstance(im, Image.Image):
+        im = Image.open(im)
+    if draft:
+        im.draft(*draft)
+    im.load()
+    return im
+
+
+def prefetch(ims, count=2, threads=None, draft=None):
+    """
+    Decodes images ahead of their use in background threads so decoding,
+    e.g. of large TIFFs on network file systems, overlaps with processing of
+    the previous images.
+
+    Args:
+        ims (iterable): PIL.Image objects or paths to image files
+        count (int): Maximum number of decoded images waiting to be consumed
+        threads (int): Number of decoding threads. Defaults to `count`.
+        draft (tuple): (mode, size) tuple passed to Image.draft
+
+    Yields:
+        Loaded PIL.Image objects in the order of `ims`.
+    """
+    return pipeline.run(ims, [(partial(load, draft=draft), threads or count)],
+                        count, 'prefetch')
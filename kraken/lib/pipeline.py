@@ -0,0 +1,153 @@
+"""
+kraken.lib.pipeline
+~~~~~~~~~~~~~~~~~~~
+
+A pipelined scheduler running a sequence of stages over a stream of items,
+e.g. pages, with each stage in its own worker threads. Stages are connected
+by bounded queues so that the stages of different items overlap while the
+number of items in flight, and thereby memory use, stays limited.
+"""
+
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+from future import standard_library
+standard_library.install_aliases()
+
+import threading
+
+from queue import Queue, Empty, Full
+
+from kraken.lib import metrics
+
+__all__ = ['run']
+
+# marks the end of the items in a queue
+_DONE = object()
+
+
+def run(items, stages, queue_size=2, name=None):
+    """
+    Runs items through a sequence of stages.
+
+    Every stage is a function taking the output of the previous stage (or an
+    item for the first stage) that is run by its own worker threads. Stages
+    of different items run concurrently, e.g. the first stage of item N+2
+    while the last one of item N is running. Outputs are yielded in input
+    order.
+
+    Args:
+        items (iterable): Inputs of the first stage. It is consumed by a
+                          separate thread.
+        stages (list): List of (function, workers) tuples.
+        queue_size (int): Maximum number of items waiting in front of each
+                          stage.
+        name (unicode): Name of the pipeline under which the queue lengths
+                        are reported as the kraken_queue_depth metric.
+
+    Yields:
+        The outputs of the last stage in the order of `items`.
+
+    Raises:
+        The first exception raised by `items` or any stage. All other stages
+        are stopped without processing further items.
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [Queue(queue_size) for _ in range(len(stages) + 1)]
+    # bounds the items held back for reordering behind a slow item
+    in_flight = threading.Semaphore(queue_size * (len(stages) + 1) +
+                                    sum(workers for _, workers in stages))
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def fail(e):
+        errors.append(e)
+        stop.set()
+
+    def feed():
+        try:
+            for idx, item in enumerate(items):
+                while not in_flight.acquire(False):
+                    if stop.wait(0.01):
+                        return
+                if not put(queues[0], (idx, item)):
+                    return
+        except Exception as e:
+            fail(e)
+        else:
+            put(queues[0], _DONE)
+
+    def work(fn, inq, outq, remaining, lock):
+        try:
+            while not stop.is_set():
+                try:
+                    item = inq.get(timeout=0.1)
+                except Empty:
+                    continue
+                if item is _DONE:
+                    # leave the marker for the other workers of the stage
+                    put(inq, _DONE)
+                    break
+                idx, value = item
+                if not put(outq, (idx, fn(value))):
+                    break
+        except Exception as e:
+            fail(e)
+        finally:
+            with lock:
+                remaining[0] -= 1
+                last = not remaining[0]
+            if last:
+                put(outq, _DONE)
+
+    threads = [threading.Thread(target=feed)]
+    for (fn, workers), inq, outq in zip(stages, queues, queues[1:]):
+        remaining = [max(workers, 1)]
+        lock = threading.Lock()
+        threads.extend(threading.Thread(target=work,
+                                        args=(fn, inq, outq, remaining, lock))
+                       for _ in range(remaining[0]))
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    pending = {}
+    idx = 0
+    try:
+        while True:
+            if errors:
+                raise errors[0]
+            if name:
+                # the last queue holds finished items
+                for stage, q in enumerate(queues):
+                    metrics.set_gauge('kraken_queue_depth', q.qsize(),
+                                      pipeline=name, stage=stage)
+            try:
+                item = queues[-1].get(timeout=0.1)
+            except Empty:
+                continue
+            if item is _DONE:
+                break
+            pending[item[0]] = item[1]
+            while idx in pending:
+                value = pending.pop(idx)
+                idx += 1
+                in_flight.release()
+                yield value
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+        if name:
+            for stage in range(len(queues)):
+                metrics.set_gauge('kraken_queue_depth', 0, pipeline=name,
+                                  stage=stage)
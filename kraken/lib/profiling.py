@@ -0,0 +1,204 @@
+"""
+kraken.lib.profiling
+~~~~~~~~~~~~~~~~~~~~
+
+Lightweight instrumentation of the processing steps of kraken with named
+spans. Spans are passed to collectors, callables taking the name, start time,
+and duration of a span in seconds. While no collector is registered spans are
+shared no-op objects so instrumentation costs little more than a function
+call::
+
+    with profiling.profile() as prof:
+        binarization.nlbin(im)
+    print(prof.summary()['nlbin.background']['total'])
+"""
+
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+import time
+import json
+import threading
+
+from functools import wraps
+from contextlib import contextmanager
+
+__all__ = ['span', 'timed', 'add_collector', 'remove_collector', 'enabled',
+           'record', 'Profile', 'profile']
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+_collectors = []
+
+
+class _NullSpan(object):
+    """
+    Span used while no collector is registered.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class _Span(object):
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = _clock()
+        return self
+
+    def __exit__(self, *args):
+        record(self.name, self.start, _clock() - self.start)
+        return False
+
+
+def span(name):
+    """
+    Returns a context manager measuring the time spent in its body.
+
+    Args:
+        name (unicode): Name of the span, e.g. 'nlbin.background'
+
+    Returns:
+        A context manager passing the span to all registered collectors on
+        exit.
+    """
+    if not _collectors:
+        return _null_span
+    return _Span(name)
+
+
+def timed(name):
+    """
+    Decorator measuring each call of a function as a span.
+
+    Args:
+        name (unicode): Name of the span
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _collectors:
+                return fn(*args, **kwargs)
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_collector(collector):
+    """
+    Registers a collector receiving all spans until it is removed.
+
+    Args:
+        collector (callable): Function taking the name, start time, and
+                              duration of a span.
+    """
+    _collectors.append(collector)
+
+
+def remove_collector(collector):
+    """
+    Removes a registered collector.
+    """
+    _collectors.remove(collector)
+
+
+def enabled():
+    """
+    Returns True if any collector is registered.
+    """
+    return bool(_collectors)
+
+
+def record(name, start, duration):
+    """
+    Passes a span measured elsewhere, e.g. in a worker process, to all
+    registered collectors.
+
+    Args:
+        name (unicode): Name of the span
+        start (float): Start time of the span on the clock of this module
+        duration (float): Duration of the span in seconds
+    """
+    for collector in _collectors:
+        collector(name, start, duration)
+
+
+class Profile(object):
+    """
+    A collector recording all spans with the thread they ran in.
+    """
+    def __init__(self):
+        self.origin = _clock()
+        self.events = []
+
+    def __call__(self, name, start, duration):
+        self.events.append((name, start - self.origin, duration,
+                            threading.current_thread().ident))
+
+    def summary(self):
+        """
+        Aggregates spans by name.
+
+        Returns:
+            A dict mapping span names to dicts containing the number of spans
+            (count) and the total, minimum, and maximum duration in seconds.
+        """
+        res = {}
+        for name, _, duration, _ in self.events:
+            if name not in res:
+                res[name] = {'count': 0, 'total': 0.0, 'min': duration,
+                             'max': duration}
+            s = res[name]
+            s['count'] += 1
+            s['total'] += duration
+            s['min'] = min(s['min'], duration)
+            s['max'] = max(s['max'], duration)
+        return res
+
+    def trace(self):
+        """
+        Returns the spans as a list of events of the trace event format read
+        by chrome://tracing and Perfetto.
+        """
+        return [{'name': name, 'ph': 'X', 'pid': 0, 'tid': tid,
+                 'ts': start * 1e6, 'dur': duration * 1e6}
+                for name, start, duration, tid in self.events]
+
+    def dump(self, fp):
+        """
+        Writes the trace events and the summary as a JSON object to a file.
+
+        Args:
+            fp (file): File object opened in text mode
+        """
+        fp.write(json.dumps({'traceEvents': self.trace(),
+                             'summary': self.summary()},
+                            sort_keys=True))
+
+
+@contextmanager
+def profile():
+    """
+    Records all spans in the body of the context manager.
+
+    Yields:
+        A Profile object.
+    """
+    prof = Profile()
+    add_collector(prof)
+    try:
+        yield prof
+    finally:
+        remove_collector(prof)
@@ -8,6 +8,10 @@ mysterious.
 from __future__ import absolute_import, division, print_function
 from __future__ import unicode_literals
 
+import os
+import errno
+import binascii
+
 import numpy as np
 
 from PIL import Image
@@ -45,3 +49,27 @@ def array2pil(a):
         return Image.frombytes("F", (a.shape[1], a.shape[0]), a.tostring())
     else:
         raise Exception("unknown image type")
+
+
+def mkstemp(dir, prefix='', suffix='.tmp'):
+    """
+    Creates a new temporary file like tempfile.mkstemp() but with the
+    permissions of files created by open(), i.e. readable by everyone the
+    umask allows, so it can be renamed to an output file. The umask is applied
+    by the kernel instead of being read with os.umask() which changes it for
+    all threads.
+
+    Returns:
+        A tuple (fd, path) of an open file descriptor and the absolute path
+        of the file.
+    """
+    for _ in range(100):
+        path = os.path.join(os.path.abspath(dir), '{}{}{}'.format(
+            prefix, binascii.hexlify(os.urandom(6)).decode('ascii'), suffix))
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o666)
+            return fd, path
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    raise IOError(errno.EEXIST, 'No usable temporary file name found')
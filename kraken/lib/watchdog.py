@@ -0,0 +1,212 @@
+"""
+kraken.lib.watchdog
+~~~~~~~~~~~~~~~~~~~
+
+Supervised execution of tasks in worker processes with time and memory
+budgets. A worker exceeding its budget is killed so pathological inputs,
+e.g. halftone images segmented into thousands of bogus lines, can't block a
+batch job.
+"""
+
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+import os
+import time
+import signal
+import multiprocessing
+
+from kraken.lib import metrics
+from kraken.lib import profiling
+from kraken.lib.exceptions import KrakenBudgetException, KrakenWorkerException
+
+__all__ = ['supervise']
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+def _rss(pid):
+    """
+    Returns the resident set size of a process in bytes or 0 if it can't be
+    determined, i.e. on systems without /proc.
+    """
+    try:
+        with open('/proc/{}/status'.format(pid)) as fp:
+            for line in fp:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return 0
+
+
+def _private(pid):
+    """
+    Returns the memory of a process not shared with other processes in bytes.
+    Pages a forked worker inherits from its parent, e.g. a loaded model, only
+    count once the worker writes to them. Falls back to the resident set size
+    on kernels without smaps_rollup.
+    """
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid)) as fp:
+            return sum(int(line.split()[1]) * 1024 for line in fp
+                       if line.startswith(('Private_Clean:', 'Private_Dirty:',
+                                           'Private_Hugetlb:')))
+    except (IOError, OSError, ValueError):
+        return _rss(pid)
+
+
+def _budget(budget, stage):
+    """
+    Returns the budget of a stage from a number or a dict mapping stage names
+    to numbers.
+    """
+    if isinstance(budget, dict):
+        return budget.get(stage)
+    return budget
+
+
+def _counts():
+    """
+    Returns a dict mapping (name, labels) tuples of all counters of the
+    active metrics registry to their values.
+    """
+    if metrics.registry is None:
+        return {}
+    return {(m.name, labels): v for m in metrics.registry.metrics.values()
+            if m.kind == 'counter' for _, labels, v in m.samples()}
+
+
+def _replay(kind, value):
+    """
+    Passes a span or the counter increments of a worker to the collectors
+    and the metrics registry of this process.
+    """
+    if kind == 'span':
+        profiling.record(*value)
+    else:
+        for (name, labels), v in value.items():
+            metrics.inc(name, v, **dict(labels))
+
+
+def _context():
+    # forking allows running closures over unpicklable objects such as
+    # loaded models
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork')
+    return multiprocessing
+
+
+def supervise(fn, timeout=None, memory=None, stage_timeout=None,
+              stage_memory=None, interval=0.05):
+    """
+    Runs a function in a forked worker process enforcing time and memory
+    budgets.
+
+    The function is called with a single argument, a checkpoint function
+    taking the name of the stage the function is about to start. Stage
+    budgets are enforced from one checkpoint to the next.
+
+    Memory budgets are checked every `interval` seconds against the growth
+    of the private memory of the worker since it started, so memory shared
+    with the parent isn't counted. They are only enforced on systems
+    providing /proc.
+
+    Profiling spans and counter increments of the worker are passed to the
+    collectors and the metrics registry of the calling process. Counter
+    increments of killed workers are lost.
+
+    Args:
+        fn (callable): Function to run. Its return value has to be picklable.
+        timeout (float): Maximum run time of the function in seconds
+        memory (int): Maximum memory allocated by the worker in bytes
+        stage_timeout (float or dict): Maximum run time of each stage or a
+                                       dict mapping stage names to it.
+        stage_memory (int or dict): Maximum memory allocated by the worker
+                                    during each stage or a dict mapping
+                                    stage names to it.
+        interval (float): Seconds between budget checks
+
+    Returns:
+        The return value of fn.
+
+    Raises:
+        KrakenBudgetException if a budget is exceeded.
+        KrakenWorkerException if the worker terminated without a result.
+        Any exception raised by fn.
+    """
+    mp = _context()
+    reader, writer = mp.Pipe(duplex=False)
+
+    def target():
+        reader.close()
+        writer.send(('baseline', _private(os.getpid())))
+        # the collectors of the worker are copies whose spans would be lost
+        if profiling.enabled():
+            profiling.add_collector(lambda *span: writer.send(('span', span)))
+        before = _counts()
+        try:
+            res = ('result', fn(lambda name: writer.send(('stage', name))))
+        except Exception as e:
+            res = ('error', e)
+        after = _counts()
+        writer.send(('counters', {key: v - before.get(key, 0) for key, v in
+                                  after.items() if v != before.get(key, 0)}))
+        try:
+            writer.send(res)
+        except Exception:
+            # unpicklable results or exceptions
+            writer.send(('error', KrakenWorkerException(repr(res[1]))))
+
+    worker = mp.Process(target=target)
+    worker.start()
+    writer.close()
+    start = stage_start = _clock()
+    stage = None
+    baseline = None
+    finished = False
+    try:
+        while True:
+            if reader.poll(interval):
+                try:
+                    kind, value = reader.recv()
+                except EOFError:
+                    worker.join()
+                    raise KrakenWorkerException('Worker terminated with exit '
+                                                'code {}'.format(worker.exitcode))
+                if kind == 'stage':
+                    stage, stage_start = value, _clock()
+                    continue
+                if kind == 'baseline':
+                    baseline = value
+                    continue
+                if kind in ('span', 'counters'):
+                    _replay(kind, value)
+                    continue
+                finished = True
+                if kind == 'result':
+                    return value
+                raise value
+            now = _clock()
+            if timeout and now - start > timeout:
+                raise KrakenBudgetException('Time budget of {}s exceeded in '
+                                            'stage {}'.format(timeout, stage))
+            limit = _budget(stage_timeout, stage)
+            if limit and now - stage_start > limit:
+                raise KrakenBudgetException('Time budget of {}s of stage {} '
+                                            'exceeded'.format(limit, stage))
+            limit = min(x for x in (memory, _budget(stage_memory, stage),
+                                    float('inf')) if x)
+            if limit < float('inf') and baseline is not None:
+                used = _private(worker.pid) - baseline
+                if used > limit:
+                    raise KrakenBudgetException('Memory budget of {} bytes '
+                                                'exceeded in stage {}: {} '
+                                                'bytes'.format(int(limit),
+                                                               stage, used))
+    finally:
+        reader.close()
+        # workers exit on their own after sending their result
+        if not finished and worker.is_alive():
+            os.kill(worker.pid, signal.SIGKILL)
+        worker.join()
@@ -22,18 +22,116 @@ from builtins import object
 
 import numpy as np
 
+from functools import partial
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from scipy.ndimage.filters import (gaussian_filter, uniform_filter,
-                                   maximum_filter)
-from kraken.lib import morph, sl
+                                   maximum_filter, gaussian_filter1d,
+                                   uniform_filter1d, maximum_filter1d)
+from kraken import blank
+from kraken.lib import morph, sl, metrics
 from kraken.lib.util import pil2array
+from kraken.lib.profiling import timed
+from kraken.lib.bitpage import BitPage
 from kraken.lib.exceptions import KrakenInputException
 
 
+# number of stripes each separable filter pass is split into when running on
+# a thread pool.
+FILTER_STRIPES = 16
+
+
 class record(object):
     def __init__(self, **kw):
         self.__dict__.update(kw)
 
 
+def _separable(passes, input, output, pool=None):
+    """
+    Runs a separable filter as a sequence of 1D passes.
+
+    Each pass filters along a single axis so the image can be cut into
+    stripes along the other axis which are filtered independently on a
+    thread pool. Stripes write disjoint parts of the output, so the result is
+    identical to running the pass on the whole image.
+
+    Args:
+        passes (list): List of (filter1d, axis) tuples where filter1d is a
+                       scipy.ndimage 1D filter with all parameters but input,
+                       axis, and output bound.
+        input (numpy.array): Input image
+        output (numpy.array): Output array. May be the same array as input.
+        pool (multiprocessing.pool.ThreadPool): Pool to run stripes on.
+
+    Returns:
+        output
+    """
+    if not passes:
+        output[...] = input
+        return output
+    for filter1d, axis in passes:
+        if pool is None:
+            filter1d(input, axis=axis, output=output)
+        else:
+            other = 1 - axis
+            n = input.shape[other]
+            step = max(1, -(-n // FILTER_STRIPES))
+
+            def run(start, input=input, filter1d=filter1d, axis=axis):
+                stripe = [slice(None), slice(None)]
+                stripe[other] = slice(start, start + step)
+                stripe = tuple(stripe)
+                filter1d(input[stripe], axis=axis, output=output[stripe])
+            pool.map(run, range(0, n, step))
+        input = output
+    return output
+
+
+def _gaussian_filter(input, sigma, order=(0, 0), output=np.float32,
+                     pool=None):
+    """
+    Equivalent of scipy's gaussian_filter with a float32 output by default
+    and separable passes optionally run on a thread pool.
+    """
+    if pool is None:
+        return gaussian_filter(input, sigma, order=order, output=output)
+    if not isinstance(output, np.ndarray):
+        output = np.empty(input.shape, output)
+    passes = [(partial(gaussian_filter1d, sigma=s, order=o), axis) for
+              axis, (s, o) in enumerate(zip(sigma, order)) if s > 1e-15]
+    return _separable(passes, input, output, pool)
+
+
+def _uniform_filter(input, size, output=np.float32, pool=None):
+    """
+    Equivalent of scipy's uniform_filter with a float32 output by default
+    and separable passes optionally run on a thread pool.
+    """
+    if pool is None:
+        if not isinstance(output, np.ndarray):
+            return uniform_filter(input, size, output=output)
+        uniform_filter(input, size, output=output)
+        return output
+    if not isinstance(output, np.ndarray):
+        output = np.empty(input.shape, output)
+    passes = [(partial(uniform_filter1d, size=int(s)), axis) for axis, s in
+              enumerate(size) if s > 1]
+    return _separable(passes, input, output, pool)
+
+
+def _maximum_filter(input, size, pool=None):
+    """
+    Equivalent of scipy's maximum_filter with a rectangular structuring
+    element and separable passes optionally run on a thread pool.
+    """
+    if pool is None:
+        return maximum_filter(input, size)
+    output = np.empty(input.shape, input.dtype)
+    passes = [(partial(maximum_filter1d, size=int(s)), axis) for axis, s in
+              enumerate(size) if s > 1]
+    return _separable(passes, input, output, pool)
+
+
 def find(condition):
     "Return the indices where ravel(condition) is true"
     res, = np.nonzero(np.ravel(condition))
@@ -46,19 +144,20 @@ def binary_objects(binary):
     return objects
 
 
+@timed('pageseg.estimate_scale')
 def estimate_scale(binary):
     objects = binary_objects(binary)
     bysize = sorted(objects, key=sl.area)
-    scalemap = np.zeros(binary.shape)
+    scalemap = np.zeros(binary.shape, 'f')
     for o in bysize:
         if np.amax(scalemap[o]) > 0:
             continue
         scalemap[o] = sl.area(o)**0.5
     scale = np.median(scalemap[(scalemap > 3) & (scalemap < 100)])
-    return scale
+    return float(scale)
 
 
-def compute_boxmap(binary, scale, threshold=(.5, 4), dtype='i'):
+def compute_boxmap(binary, scale, threshold=(.5, 4), dtype='B'):
     objects = binary_objects(binary)
     bysize = sorted(objects, key=sl.area)
     boxmap = np.zeros(binary.shape, dtype)
@@ -71,27 +170,60 @@ def compute_boxmap(binary, scale, threshold=(.5, 4), dtype='i'):
     return boxmap
 
 
+class line_record(object):
+    """
+    A single line of a segmentation map.
+
+    Only the label and bounding slices are stored. The boolean mask of the
+    line is computed from the segmentation map each time it is accessed so
+    the common bounding box path never allocates it.
+    """
+    def __init__(self, label, bounds, segmentation):
+        self.label = label
+        self.bounds = bounds
+        self._segmentation = segmentation
+
+    @property
+    def mask(self):
+        """Boolean mask of the line inside its bounding box."""
+        return self._segmentation[self.bounds] == self.label
+
+    def runs(self):
+        """
+        Run-length encodes the line mask.
+
+        Returns:
+            A numpy.array of shape (n, 3) containing the absolute row, first
+            column, and one past the last column of each horizontal run of
+            the line.
+        """
+        mask = self.mask.view('b')
+        edges = np.diff(mask, axis=1, prepend=0, append=0)
+        ys, starts = np.nonzero(edges == 1)
+        _, stops = np.nonzero(edges == -1)
+        return np.column_stack((ys + self.bounds[0].start,
+                                starts + self.bounds[1].start,
+                                stops + self.bounds[1].start))
+
+
+@timed('pageseg.compute_lines')
 def compute_lines(segmentation, scale):
-    """Given a line segmentation map, computes a list
-    of tuples consisting of 2D slices and masked images."""
+    """Given a line segmentation map, computes a list of line_records
+    consisting of a label and 2D slices. Masks are computed on access."""
     lobjects = morph.find_objects(segmentation)
     lines = []
     for i, o in enumerate(lobjects):
+        # find_objects returns None for labels absent from the map so every
+        # other slice contains at least one pixel of its label.
         if o is None:
             continue
         if sl.dim1(o) < 2*scale or sl.dim0(o) < scale:
             continue
-        mask = (segmentation[o] == i+1)
-        if np.amax(mask) == 0:
-            continue
-        result = record()
-        result.label = i+1
-        result.bounds = o
-        result.mask = mask
-        lines.append(result)
+        lines.append(line_record(i+1, o, segmentation))
     return lines
 
 
+@timed('pageseg.reading_order')
 def reading_order(lines):
     """Given the list of lines (a list of 2D slices), computes
     the partial reading order.  The output is a binary 2D array
@@ -162,7 +294,8 @@ def compute_separators_morph(binary, scale, sepwiden=10, maxcolseps=2):
     return vert
 
 
-def compute_colseps_conv(binary, scale=1.0, minheight=10, maxcolseps=2):
+def compute_colseps_conv(binary, scale=1.0, minheight=10, maxcolseps=2,
+                         pool=None):
     """Find column separators by convolution and thresholding.
 
     Args:
@@ -170,6 +303,7 @@ def compute_colseps_conv(binary, scale=1.0, minheight=10, maxcolseps=2):
         scale (float):
         minheight (int):
         maxcolseps (int):
+        pool (multiprocessing.pool.ThreadPool): Pool to run filter stripes on
 
     Returns:
         Separators
@@ -177,58 +311,145 @@ def compute_colseps_conv(binary, scale=1.0, minheight=10, maxcolseps=2):
 
     h, w = binary.shape
     # find vertical whitespace by thresholding
-    smoothed = gaussian_filter(1.0*binary, (scale, scale*0.5))
-    smoothed = uniform_filter(smoothed, (5.0*scale, 1))
+    smoothed = _gaussian_filter(binary, (scale, scale*0.5), pool=pool)
+    _uniform_filter(smoothed, (5.0*scale, 1), output=smoothed, pool=pool)
     thresh = (smoothed < np.amax(smoothed)*0.1)
     # find column edges by filtering
-    grad = gaussian_filter(1.0*binary, (scale, scale*0.5), order=(0, 1))
-    grad = uniform_filter(grad, (10.0*scale, 1))
+    grad = _gaussian_filter(binary, (scale, scale*0.5), order=(0, 1),
+                            pool=pool)
+    _uniform_filter(grad, (10.0*scale, 1), output=grad, pool=pool)
     grad = (grad > 0.5*np.amax(grad))
     # combine edges and whitespace
-    seps = np.minimum(thresh, maximum_filter(grad, (int(scale), int(5*scale))))
-    seps = maximum_filter(seps, (int(2*scale), 1))
+    seps = np.minimum(thresh, _maximum_filter(grad, (int(scale), int(5*scale)),
+                                              pool=pool))
+    seps = _maximum_filter(seps, (int(2*scale), 1), pool=pool)
     # select only the biggest column separators
     seps = morph.select_regions(seps, sl.dim0, min=minheight*scale,
                                 nbest=maxcolseps+1)
     return seps
 
 
-def compute_black_colseps(binary, scale):
+def _box_mean(integral, top, bottom, left, right):
+    """
+    Computes the mean over a box around each pixel from an integral image.
+
+    The box around pixel (y, x) covers rows y-top to y+bottom and columns
+    x-left to x+right (exclusive). Boxes are clipped at the image border.
+
+    Args:
+        integral (numpy.array): Integral image with an additional leading
+                                row and column of zeros.
+        top, bottom, left, right (int): Extent of the box
+
+    Returns:
+        A float32 numpy.array of box means.
+    """
+    h, w = integral.shape[0] - 1, integral.shape[1] - 1
+    ys, xs = np.arange(h), np.arange(w)
+    r0, r1 = np.clip(ys - top, 0, h), np.clip(ys + bottom, 0, h)
+    c0, c1 = np.clip(xs - left, 0, w), np.clip(xs + right, 0, w)
+    sums = (integral[np.ix_(r1, c1)] - integral[np.ix_(r0, c1)] -
+            integral[np.ix_(r1, c0)] + integral[np.ix_(r0, c0)])
+    area = np.maximum(np.outer(r1 - r0, c1 - c0), 1)
+    return np.divide(sums, area, dtype=np.float32)
+
+
+def compute_colseps_fast(binary, scale=1.0, minheight=10, maxcolseps=2):
+    """Find column separators on a vertically decimated page.
+
+    An approximation of compute_colseps_conv. As columns are tall structures
+    the page is summed over blocks of scale/2 rows and the gaussian and
+    uniform filters are replaced by box means from an integral image with
+    the same extent, making the cost independent of the scale.
+
+    Args:
+        binary (numpy.array):
+        scale (float):
+        minheight (int):
+        maxcolseps (int):
+
+    Returns:
+        Separators
+    """
+    h, w = binary.shape
+    factor = max(1, int(scale/2))
+    proj = np.add.reduceat(binary, np.arange(0, h, factor), axis=0,
+                           dtype=np.int32)
+    integral = np.zeros((proj.shape[0] + 1, w + 1), np.int64)
+    np.cumsum(proj, axis=0, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+    # scale in decimated rows
+    dscale = scale/factor
+    # find vertical whitespace by thresholding. The boxes have roughly the
+    # variance of the gaussian and uniform filters in compute_colseps_conv.
+    v = max(1, int(3*dscale))
+    hw = max(1, int(0.87*scale))
+    smoothed = _box_mean(integral, v, v, hw, hw)
+    thresh = (smoothed < np.amax(smoothed)*0.1)
+    # find column edges as difference of the boxes right and left of a pixel
+    v = max(1, int(5.3*dscale))
+    hw = max(1, int(scale))
+    grad = _box_mean(integral, v, v, 0, hw) - _box_mean(integral, v, v, hw, 0)
+    grad = (grad > 0.5*np.amax(grad))
+    # combine edges and whitespace
+    seps = np.minimum(thresh, maximum_filter(grad, (max(1, int(dscale)),
+                                                    int(5*scale))))
+    seps = maximum_filter(seps, (max(1, int(2*dscale)), 1))
+    # select only the biggest column separators
+    seps = morph.select_regions(seps, sl.dim0, min=minheight*dscale,
+                                nbest=maxcolseps+1)
+    return np.repeat(seps, factor, axis=0)[:h]
+
+
+@timed('pageseg.compute_black_colseps')
+def compute_black_colseps(binary, scale, pool=None, fast=False):
     """
     Computes column separators from vertical black lines.
 
     Args:
         binary (numpy.array): Numpy array of the binary image
         scale (float):
+        pool (multiprocessing.pool.ThreadPool): Pool to run filter stripes on
+        fast (bool): Use compute_colseps_fast instead of compute_colseps_conv
 
     Returns:
         (colseps, binary):
     """
     seps = compute_separators_morph(binary, scale)
-    colseps = np.maximum(compute_colseps_conv(binary, scale), seps)
+    if fast:
+        colseps = compute_colseps_fast(binary, scale)
+    else:
+        colseps = compute_colseps_conv(binary, scale, pool=pool)
+    colseps = np.maximum(colseps, seps)
     binary = np.minimum(binary, 1-seps)
     return colseps, binary
 
 
-def compute_white_colseps(binary, scale):
+@timed('pageseg.compute_white_colseps')
+def compute_white_colseps(binary, scale, pool=None, fast=False):
     """
     Computes column separators either from vertical black lines or whitespace.
 
     Args:
         binary (numpy.array): Numpy array of the binary image
         scale (float):
+        pool (multiprocessing.pool.ThreadPool): Pool to run filter stripes on
+        fast (bool): Use compute_colseps_fast instead of compute_colseps_conv
 
     Returns:
         colseps:
     """
-    return compute_colseps_conv(binary, scale)
+    if fast:
+        return compute_colseps_fast(binary, scale)
+    return compute_colseps_conv(binary, scale, pool=pool)
 
 
 def norm_max(v):
     return v/np.amax(v)
 
 
-def compute_gradmaps(binary, scale, gauss=False):
+@timed('pageseg.compute_gradmaps')
+def compute_gradmaps(binary, scale, gauss=False, pool=None):
     """
     Use gradient filtering to find baselines
 
@@ -236,6 +457,7 @@ def compute_gradmaps(binary, scale, gauss=False):
         binary (numpy.array):
         scale (float):
         gauss (bool): Use gaussian instead of uniform filtering
+        pool (multiprocessing.pool.ThreadPool): Pool to run filter stripes on
 
     Returns:
         (bottom, top, boxmap)
@@ -244,29 +466,38 @@ def compute_gradmaps(binary, scale, gauss=False):
     boxmap = compute_boxmap(binary, scale)
     cleaned = boxmap*binary
     if gauss:
-        grad = gaussian_filter(1.0*cleaned, (0.3*scale, 6*scale), order=(1, 0))
+        grad = _gaussian_filter(cleaned, (0.3*scale, 6*scale), order=(1, 0),
+                                pool=pool)
     else:
-        grad = gaussian_filter(1.0*cleaned, (max(4, 0.3*scale),
-                                             scale), order=(1, 0))
-        grad = uniform_filter(grad, (1, 6*scale))
+        grad = _gaussian_filter(cleaned, (max(4, 0.3*scale), scale),
+                                order=(1, 0), pool=pool)
+        _uniform_filter(grad, (1, 6*scale), output=grad, pool=pool)
     bottom = norm_max((grad < 0)*(-grad))
     top = norm_max((grad > 0)*grad)
     return bottom, top, boxmap
 
 
-def compute_line_seeds(binary, bottom, top, colseps, scale, threshold=0.2):
+@timed('pageseg.compute_line_seeds')
+def compute_line_seeds(binary, bottom, top, colseps, scale, threshold=0.2,
+                       maxima=None):
     """
     Base on gradient maps, computes candidates for baselines and xheights.
     Then, it marks the regions between the two as a line seed.
+
+    The thresholds are relative to the maxima of the gradient maps or to
+    `maxima`, a (bottom, top) tuple, e.g. of the whole page when seeds are
+    computed for a part of it.
     """
     vrange = int(scale)
+    if maxima is None:
+        maxima = np.amax(bottom), np.amax(top)
     bmarked = maximum_filter(bottom == maximum_filter(bottom, (vrange, 0)),
                              (2, 2))
-    bmarked = bmarked * (bottom > threshold*np.amax(bottom)*threshold)*(1-colseps)
+    bmarked = bmarked * (bottom > threshold*maxima[0]*threshold)*(1-colseps)
     tmarked = maximum_filter(top == maximum_filter(top, (vrange, 0)), (2, 2))
-    tmarked = tmarked * (top > threshold*np.amax(top)*threshold/2)*(1-colseps)
+    tmarked = tmarked * (top > threshold*maxima[1]*threshold/2)*(1-colseps)
     tmarked = maximum_filter(tmarked, (1, 20))
-    seeds = np.zeros(binary.shape, 'i')
+    seeds = np.zeros(binary.shape, 'B')
     delta = max(3, int(scale/2))
     for x in range(bmarked.shape[1]):
         transitions = sorted([(y, 1) for y in find(bmarked[:, x])] +
@@ -286,6 +517,7 @@ def compute_line_seeds(binary, bottom, top, colseps, scale, threshold=0.2):
     return seeds
 
 
+@timed('pageseg.remove_hlines')
 def remove_hlines(binary, scale, maxsize=10):
     """
     Removes horizontal black lines that only interfere with page segmentation.
@@ -307,7 +539,229 @@ def remove_hlines(binary, scale, maxsize=10):
     return np.array(labels != 0, 'B')
 
 
-def segment(im, scale=None, black_colseps=False):
+@timed('pageseg.compute_column_regions')
+def compute_column_regions(binary, colseps, scale):
+    """
+    Splits a page into regions along column separators.
+
+    The rows spanned by the separators are cut into vertical strips at
+    separators running through the whole band without any ink crossing them,
+    so no line is split. The rows above and below are kept as full width
+    regions. Horizontal cuts are moved to the sparsest row within `scale` to
+    avoid splitting lines. Pages without such separators are returned as a
+    single region.
+
+    Args:
+        binary (numpy.array): Numpy array of the binary image
+        colseps (numpy.array): Column separator mask
+        scale (float):
+
+    Returns:
+        A list of 2D slices in reading order.
+    """
+    h, w = binary.shape
+    labels, _ = morph.label(colseps)
+    objects = [o for o in morph.find_objects(labels) if o is not None]
+    if not objects:
+        return [(slice(0, h), slice(0, w))]
+    # smooth the row profile so gaps between lines win over gaps between
+    # diacritics and the x-height
+    profile = uniform_filter1d(binary.sum(axis=1, dtype=np.int32),
+                               int(scale/2) + 1, output=np.float32)
+
+    def snap(y):
+        y0, y1 = max(0, int(y - scale)), min(h, int(y + scale) + 1)
+        return y0 + int(np.argmin(profile[y0:y1]))
+
+    y0 = snap(min(o[0].start for o in objects))
+    y1 = snap(max(o[0].stop for o in objects))
+    # separators stacked on top of each other form a single group
+    groups = []
+    for o in sorted(objects, key=lambda o: o[1].start):
+        if groups and o[1].start - groups[-1][1] <= scale:
+            groups[-1][1] = max(groups[-1][1], o[1].stop)
+        else:
+            groups.append([o[1].start, o[1].stop])
+    # a group is only cut at a column without ink in the whole band, i.e. a
+    # gutter no line crosses.
+    ink = binary[y0:y1].any(axis=0)
+    xs = [0]
+    for lo, hi in groups:
+        clean = np.flatnonzero(~ink[lo:hi])
+        if len(clean):
+            center = (hi - lo)//2
+            xs.append(lo + int(clean[np.argmin(np.abs(clean - center))]))
+    if len(xs) == 1:
+        return [(slice(0, h), slice(0, w))]
+    xs.append(w)
+    regions = []
+    if y0 > 0:
+        regions.append((slice(0, y0), slice(0, w)))
+    for x0, x1 in zip(xs, xs[1:]):
+        if x1 > x0:
+            regions.append((slice(y0, y1), slice(x0, x1)))
+    if y1 < h:
+        regions.append((slice(y1, h), slice(0, w)))
+    return regions
+
+
+def _find_lines(binary, colseps, scale, bottom, top, boxmap, order=True,
+                seeds=None):
+    """
+    Computes line seeds from the gradient maps unless they are given,
+    propagates them to the connected components, and returns the line
+    bounding boxes, in reading order if `order` is set.
+    """
+    if seeds is None:
+        seeds = compute_line_seeds(binary, bottom, top, colseps, scale)
+    llabels = morph.propagate_labels(boxmap, seeds, conflict=0)
+    spread = morph.spread_labels(seeds, maxdist=scale)
+    llabels = np.where(llabels > 0, llabels, spread*binary)
+    segmentation = llabels*binary
+
+    lines = [l.bounds for l in compute_lines(segmentation, scale)]
+    if order:
+        lsort = topsort(reading_order(lines))
+        lines = [lines[i] for i in lsort]
+    return [(s2.start, s1.start, s2.stop, s1.stop) for s1, s2 in lines]
+
+
+def _region_seeds(args):
+    """
+    Computes the line seeds of a single region. Takes a tuple (binary,
+    colseps, bottom, top, maxima, scale, core) to be usable with Pool.map
+    where binary, colseps, and the gradient maps cover the region plus a
+    margin, maxima are the page-wide maxima of the gradient maps, and core is
+    the region as (y0, x0, y1, x1) relative to the margin. Returns the seed
+    mask of the core.
+    """
+    binary, colseps, bottom, top, maxima, scale, (y0, x0, y1, x1) = args
+    if not binary[y0:y1, x0:x1].any():
+        return np.zeros((y1 - y0, x1 - x0), 'B')
+    seeds = compute_line_seeds(binary, bottom, top, colseps, scale,
+                               maxima=maxima)
+    return np.array(seeds[y0:y1, x0:x1] > 0, 'B')
+
+
+def _load_page(im):
+    """
+    Converts a bi-level image into a packed BitPage. BitPages are passed
+    through unchanged.
+
+    Raises:
+        KrakenInputException if the input image is not binarized
+    """
+    if isinstance(im, BitPage):
+        return im
+    if im.mode != '1' and im.histogram().count(0) != 254:
+        raise KrakenInputException('Image is not bi-level')
+    return BitPage.from_pil(im)
+
+
+def _load_binary(im):
+    """
+    Converts a bi-level image or BitPage into a uint8 array with 1 for ink.
+
+    Raises:
+        KrakenInputException if the input image is not binarized
+    """
+    if isinstance(im, BitPage) or im.mode == '1':
+        return _load_page(im).to_array()
+    if im.histogram().count(0) != 254:
+        raise KrakenInputException('Image is not bi-level')
+    # honestly I've got no idea what's going on here. In theory a simple
+    # np.array(im, 'i') should suffice here but for some reason the
+    # tostring/fromstring magic in pil2array alters the array in a way that is
+    # needed for the algorithm to work correctly.
+    a = pil2array(im)
+    return np.array(a <= 0.5*(np.amin(a) + np.amax(a)), 'B')
+
+
+def _runs(profile):
+    """
+    Returns the (start, stop) pairs of the runs of non-zero values of a 1D
+    profile as an array of shape (n, 2).
+    """
+    edges = np.diff(np.asarray(profile > 0).view('b'), prepend=0, append=0)
+    return np.column_stack((find(edges == 1), find(edges == -1)))
+
+
+@timed('pageseg.projection')
+def segment_projection(im, gap=0.5, minheight=0.5):
+    """
+    Segments a page into text lines using horizontal projection profiles.
+
+    A fast alternative to segment() for simple single column layouts, e.g.
+    typed forms, books, or already cropped text blocks. Runs of rows
+    containing ink are taken as line candidates. Candidates considerably
+    higher than the median candidate height (lines touching through
+    ascenders and descenders) are split at the sparsest row between their
+    dense x-height bands. Candidates lower than a
+    fraction of the median candidate height (diacritics, dots, specks) are
+    merged into the closest neighboring line if it is near enough and
+    dropped otherwise. The horizontal extent of each line is the run of
+    columns containing ink inside the line.
+
+    Args:
+        im (PIL.Image): A bi-level page of mode '1' or 'L' or a
+                        kraken.lib.bitpage.BitPage
+        gap (float): Largest distance of a low candidate to the line it is
+                     merged into as a fraction of the median height.
+        minheight (float): Height below which candidates are merged or
+                           dropped as a fraction of the median height.
+
+    Returns:
+        [(x1, y1, x2, y2),...]: A list of tuples containing the bounding boxes
+                                of the segmented lines in reading order.
+
+    Raises:
+        KrakenInputException if the input image is not binarized
+    """
+    metrics.inc('kraken_segment_pages_total')
+    page = _load_page(im)
+    profile = page.row_projection()
+    rows = _runs(profile)
+    if not len(rows):
+        return []
+    heights = rows[:, 1] - rows[:, 0]
+    height = np.median(heights)
+    low = heights < minheight*height
+    lines = []
+    for start, stop in rows[~low]:
+        if stop - start > 1.5*height:
+            run = profile[start:stop]
+            cores = _runs(run > 0.3*np.amax(run))
+            for (_, c0), (c1, _) in zip(cores, cores[1:]):
+                cut = start + c0 + int(np.argmin(run[c0:c1]))
+                lines.append([start, cut])
+                start = cut
+        lines.append([start, stop])
+    if not lines:
+        return []
+    starts = np.array([l[0] for l in lines])
+    for start, stop in rows[low]:
+        # closest line above and below the candidate
+        idx = np.searchsorted(starts, start)
+        above = lines[idx-1] if idx > 0 else None
+        below = lines[idx] if idx < len(lines) else None
+        dists = [(start - above[1], above) if above else None,
+                 (below[0] - stop, below) if below else None]
+        dists = [d for d in dists if d and d[0] < gap*height]
+        if dists:
+            line = min(dists, key=lambda x: x[0])[1]
+            line[0] = min(line[0], start)
+            line[1] = max(line[1], stop)
+    res = []
+    for y1, y2 in lines:
+        cols = find(page.crop((0, y1, page.shape[1], y2)).column_projection())
+        res.append((int(cols[0]), int(y1), int(cols[-1]) + 1, int(y2)))
+    metrics.inc('kraken_segment_lines_total', len(res))
+    return res
+
+
+@timed('pageseg.segment')
+def segment(im, scale=None, black_colseps=False, threads=1,
+            fast_colseps=False, column_regions=0, skip_blank=False):
     """
     Segments a page into text lines.
 
@@ -315,10 +769,27 @@ def segment(im, scale=None, black_colseps=False):
     each line in reading order.
 
     Args:
-        im (PIL.Image): A bi-level page of mode '1' or 'L'
+        im (PIL.Image): A bi-level page of mode '1' or 'L' or a
+                        kraken.lib.bitpage.BitPage
         scale (float): Scale of the image
         black_colseps (bool): Whether column separators are assumed to be
                               vertical black lines or not
+        threads (int): Number of threads used to filter image stripes.
+                       Column separator detection on whitespace and the
+                       gradient maps are also computed concurrently if
+                       larger than 1. The output is independent of the
+                       number of threads.
+        fast_colseps (bool): Detect column separators on a vertically
+                             decimated page using integral images instead of
+                             full resolution convolutions.
+        column_regions (int): If larger than 0 the page is split along the
+                              detected column separators and the line seeds
+                              of the regions are computed independently on
+                              this many worker processes before finding the
+                              lines of the whole page. The output is the same
+                              as without regions.
+        skip_blank (bool): Return no lines for pages found blank by
+                           kraken.blank.is_blank() without segmenting them.
 
     Returns:
         [(x1, y1, x2, y2),...]: A list of tuples containing the bounding boxes
@@ -327,34 +798,87 @@ def segment(im, scale=None, black_colseps=False):
     Raises:
         KrakenInputException if the input image is not binarized
     """
-
-    if im.mode != '1' and im.histogram().count(0) != 254:
-        raise KrakenInputException('Image is not bi-level')
-    # honestly I've got no idea what's going on here. In theory a simple
-    # np.array(im, 'i') should suffice here but for some reason the
-    # tostring/fromstring magic in pil2array alters the array in a way that is
-    # needed for the algorithm to work correctly.
-    a = pil2array(im)
-    binary = np.array(a > 0.5*(np.amin(a) + np.amax(a)), 'i')
-    binary = 1 - binary
+    metrics.inc('kraken_segment_pages_total')
+    if skip_blank and blank.is_blank(im.to_pil() if isinstance(im, BitPage)
+                                      else im):
+        return []
+    # cheap emptiness check on the packed page before unpacking it
+    if isinstance(im, BitPage) or im.mode == '1':
+        page = _load_page(im)
+        if page.is_empty():
+            return []
+        binary = page.to_array()
+    else:
+        binary = _load_binary(im)
+        if not binary.any():
+            return []
 
     if not scale:
         scale = estimate_scale(binary)
 
     binary = remove_hlines(binary, scale)
-    if black_colseps:
-        colseps, binary = compute_black_colseps(binary, scale)
+    pool = stages = None
+    gradmaps = None
+    if threads > 1:
+        pool = ThreadPool(threads)
+        stages = ThreadPool(1)
+    try:
+        if black_colseps:
+            # gradient maps are computed on the image with separators removed
+            colseps, binary = compute_black_colseps(binary, scale, pool,
+                                                    fast_colseps)
+        elif stages:
+            # both stages only depend on binary and scale
+            colseps = stages.apply_async(compute_white_colseps,
+                                         (binary, scale, pool, fast_colseps))
+            gradmaps = compute_gradmaps(binary, scale, pool=pool)
+            colseps = colseps.get()
+        else:
+            colseps = compute_white_colseps(binary, scale, pool, fast_colseps)
+        if gradmaps is None:
+            gradmaps = compute_gradmaps(binary, scale, pool=pool)
+    finally:
+        if pool:
+            pool.terminate()
+            stages.terminate()
+
+    if not column_regions:
+        lines = _find_lines(binary, colseps, scale, *gradmaps)
+        metrics.inc('kraken_segment_lines_total', len(lines))
+        return lines
+
+    # only computing the line seeds, the slowest step, is split into
+    # regions. The gradient maps are computed on the whole page as the seed
+    # thresholds are relative to their page-wide maxima, and the merged seeds
+    # are propagated on the whole page so lines crossing region boundaries
+    # are neither split nor duplicated. Regions are extended by a margin
+    # covering the neighborhood seeds are computed from.
+    h, w = binary.shape
+    margin = int(6*scale)
+    bottom, top, boxmap = gradmaps
+    maxima = np.amax(bottom), np.amax(top)
+    regions = []
+    cores = compute_column_regions(binary, colseps, scale)
+    for r in cores:
+        y0, y1 = max(0, r[0].start - margin), min(h, r[0].stop + margin)
+        x0, x1 = max(0, r[1].start - margin), min(w, r[1].stop + margin)
+        crop = (slice(y0, y1), slice(x0, x1))
+        regions.append((binary[crop], colseps[crop], bottom[crop], top[crop],
+                        maxima, scale, (r[0].start - y0, r[1].start - x0,
+                                        r[0].stop - y0, r[1].stop - x0)))
+    if column_regions > 1 and len(regions) > 1:
+        workers = Pool(min(column_regions, len(regions)))
+        try:
+            masks = workers.map(_region_seeds, regions)
+        finally:
+            workers.terminate()
     else:
-        colseps = compute_white_colseps(binary, scale)
-    bottom, top, boxmap = compute_gradmaps(binary, scale)
-    seeds = compute_line_seeds(binary, bottom, top, colseps, scale)
-    llabels = morph.propagate_labels(boxmap, seeds, conflict=0)
-    spread = morph.spread_labels(seeds, maxdist=scale)
-    llabels = np.where(llabels > 0, llabels, spread*binary)
-    segmentation = llabels*binary
-
-    lines = compute_lines(segmentation, scale)
-    order = reading_order([l.bounds for l in lines])
-    lsort = topsort(order)
-    lines = [lines[i].bounds for i in lsort]
-    return [(s2.start, s1.start, s2.stop, s1.stop) for s1, s2 in lines]
+        masks = [_region_seeds(r) for r in regions]
+    seeds = np.zeros(binary.shape, 'B')
+    for r, mask in zip(cores, masks):
+        seeds[r] = mask
+    seeds, _ = morph.label(seeds)
+    lines = _find_lines(binary, colseps, scale, bottom, top, boxmap,
+                        seeds=seeds)
+    metrics.inc('kraken_segment_lines_total', len(lines))
+    return lines
@@ -23,10 +23,15 @@ from builtins import object
 
 import numpy as np
 import bidi.algorithm as bd
+
+from collections import namedtuple, defaultdict
 from PIL import ImageOps
 
+from kraken import blank
 from kraken.lib import lstm
 from kraken.lib.util import pil2array, array2pil
+from kraken.lib import metrics
+from kraken.lib.profiling import span, timed
 from kraken.lib.lineest import CenterNormalizer
 from kraken.lib.models import ClstmSeqRecognizer
 from kraken.lib.exceptions import KrakenInputException
@@ -73,6 +78,7 @@ class ocr_record(object):
             raise TypeError('Invalid argument type')
 
 
+@timed('rpred.bidi')
 def bidi_record(record):
     """
     Reorders a record using the Unicode BiDi algorithm. 
@@ -126,9 +132,12 @@ def extract_boxes(im, bounds):
         if (box < (0, 0, 0, 0) or box[::2] > (im.size[0], im.size[0]) or
            box[1::2] > (im.size[1], im.size[1])):
             raise KrakenInputException('Line outside of image bounds')
-        yield im.crop(box), box
+        with span('rpred.extract'):
+            line = im.crop(box)
+        yield line, box
 
 
+@timed('rpred.dewarp')
 def dewarp(normalizer, im):
     """
     Dewarps an image of a line using a kraken.lib.lineest.CenterNormalizer
@@ -150,7 +159,63 @@ def dewarp(normalizer, im):
     return array2pil(line)
 
 
-def rpred(network, im, bounds, pad=16, line_normalization=True, bidi_reordering=True):
+def compress_whitespace(line, max_space, threshold=0.1):
+    """
+    Removes leading and trailing blank columns of a line image and shortens
+    runs of blank columns between words to at most `max_space` columns.
+
+    As the run time of the network is linear in the width of a line this
+    speeds up recognition of sparse lines, e.g. tables, considerably.
+
+    Args:
+        line (numpy.array): Grayscale line image with dark text on a light
+                            background
+        max_space (int): Maximum number of consecutive blank columns kept
+        threshold (float): Maximum ink of a blank column relative to the
+                           intensity range of the line
+
+    Returns:
+        A tuple (line, columns) of the compressed line and an array of the
+        original index of each of its columns. The line is returned
+        unchanged if it doesn't contain any ink.
+    """
+    lo, hi = np.amin(line), np.amax(line)
+    columns = np.arange(line.shape[1])
+    if hi == lo:
+        return line, columns
+    blank = np.amin(line, axis=0) > hi - threshold * (hi - lo)
+    ink = np.flatnonzero(~blank)
+    if not len(ink):
+        return line, columns
+    keep = np.zeros(len(blank), dtype=bool)
+    keep[ink[0]:ink[-1] + 1] = True
+    # blank runs between two ink columns
+    gaps = np.flatnonzero(np.diff(ink) > max_space + 1)
+    for start, end in zip(ink[gaps] + 1, ink[gaps + 1]):
+        # keep the margins on both sides of the run
+        left = max_space // 2
+        keep[start + left:end - (max_space - left)] = False
+    columns = columns[keep]
+    return line[:, columns], columns
+
+
+def _uncompress(columns, x):
+    """
+    Maps a possibly fractional column of a compressed line back to the
+    original line.
+    """
+    if columns is None:
+        return x
+    if x <= 0:
+        return columns[0] + x
+    if x >= len(columns) - 1:
+        return columns[-1] + x - (len(columns) - 1)
+    return np.interp(x, np.arange(len(columns)), columns)
+
+
+def rpred(network, im, bounds, pad=16, line_normalization=True,
+          bidi_reordering=True, max_space=0, bucket_lines=False,
+          skip_blank=False):
     """
     Uses a RNN to recognize text
 
@@ -170,65 +235,137 @@ def rpred(network, im, bounds, pad=16, line_normalization=True, bidi_reordering=
         bidi_reordering (bool): Reorder classes in the ocr_record according to
                                 the Unicode bidirectional algorithm for correct
                                 display.
+        max_space (int): Trim blank columns at both ends of each line and
+                         shorten blank runs inside it to this many columns of
+                         the normalized line before recognition. 0 disables
+                         it. Not supported by CLSTM models.
+        bucket_lines (bool): Recognize the lines of the page grouped by width
+                             so that the network reuses a preallocated set of
+                             buffers for each width bucket. Records are still
+                             yielded in reading order but only after all
+                             lines have been normalized. Not supported by
+                             CLSTM models.
+        skip_blank (bool): Yield nothing for pages found blank by
+                           kraken.blank.is_blank() without recognizing any
+                           line.
     Yields:
         An ocr_record containing the recognized text, absolute character
         positions, and confidence values for each character. 
     """
+    if skip_blank and blank.is_blank(im):
+        return
     if isinstance(network, ClstmSeqRecognizer):
         for out in _rpred_clstm(network, im, bounds, pad, bidi_reordering):
             yield out
         raise StopIteration
 
+    lines = _prepare_lines(network, im, bounds, pad, line_normalization,
+                           max_space)
+    if not bucket_lines:
+        for line in lines:
+            yield _recognize(network, line, pad, bidi_reordering)
+        return
+
+    # group lines by the capacity of the network buffers they need
+    lines = list(lines)
+    buckets = defaultdict(list)
+    for idx, line in enumerate(lines):
+        size = lstm.bucket_size(len(line.line)) if line.line is not None else 0
+        buckets[size].append(idx)
+    network.preallocate([size for size in buckets if size])
+    results = {}
+    idx = 0
+    for size in sorted(buckets):
+        for i in buckets[size]:
+            results[i] = _recognize(network, lines[i], pad, bidi_reordering)
+            lines[i] = None
+        while idx in results:
+            yield results.pop(idx)
+            idx += 1
+
+
+# a line prepared for the network: line is the input of the network or None
+# for lines without content, scale the factor from the normalized to the
+# original line width, and columns the original columns of a compressed line.
+_line = namedtuple('_line', 'line coords scale columns')
+
+
+def _prepare_lines(network, im, bounds, pad, line_normalization, max_space):
+    """
+    Extracts, normalizes, and compresses the lines of a page for recognition.
+    """
     lnorm = getattr(network, 'lnorm', CenterNormalizer())
 
     for box, coords in extract_boxes(im, bounds):
+        metrics.inc('kraken_lines_total')
         # check if boxes are non-zero in any dimension
         if sum(coords[::2]) == False or coords[3] - coords[1] == False:
-            yield ocr_record('', [], [])
+            metrics.inc('kraken_lines_empty_total')
+            yield _line(None, coords, 1, None)
+            continue
+        raw_line = pil2array(box)
+        # check if line is non-zero
+        if np.amax(raw_line) == np.amin(raw_line):
+            metrics.inc('kraken_lines_empty_total')
+            yield _line(None, coords, 1, None)
             continue
-        if not isinstance(network, ClstmSeqRecognizer):
-            raw_line = pil2array(box)
-            # check if line is non-zero
-            if np.amax(raw_line) == np.amin(raw_line):
-                yield ocr_record('', [], [])
+        if line_normalization:
+            # fail gracefully and return no recognition result in case the
+            # input line can not be normalized.
+            try:
+                box = dewarp(lnorm, box)
+            except:
+                metrics.inc('kraken_lines_failed_total')
+                yield _line(None, coords, 1, None)
                 continue
-            if line_normalization:
-                # fail gracefully and return no recognition result in case the
-                # input line can not be normalized.
-                try:
-                    box = dewarp(lnorm, box)
-                except:
-                    yield ocr_record('', [], [])
-                    continue
-            line = pil2array(box)
-            line = lstm.prepare_line(line, pad)
-        else:
-            line = box
-        pred = network.predictString(line)
+        line = pil2array(box)
+        scale = len(raw_line.T)/line.shape[1]
+        columns = None
+        if max_space:
+            with span('rpred.compress'):
+                line, columns = compress_whitespace(line, max_space)
+        yield _line(lstm.prepare_line(line, pad), coords, scale, columns)
 
-        # calculate recognized LSTM locations of characters
-        scale = len(raw_line.T)/(len(network.outputs)-2 * pad)
+
+def _recognize(network, line, pad, bidi_reordering):
+    """
+    Recognizes a line prepared by _prepare_lines.
+    """
+    if line.line is None:
+        return ocr_record('', [], [])
+    with span('rpred.forward'):
+        pred = network.predictString(line.line)
+
+    # calculate recognized LSTM locations of characters
+    with span('rpred.decode'):
+        coords, scale = line.coords, line.scale
         result = lstm.translate_back_locations(network.outputs)
         pos = []
         conf = []
 
         for _, start, end, c in result:
-            pos.append((coords[0] + int((start-pad)*scale), coords[1], coords[0] + int((end-pad/2)*scale), coords[3]))
+            # network locations are columns of the compressed line. The
+            # last column of a character is mapped as the one following
+            # it may have been removed.
+            start = _uncompress(line.columns, start-pad)
+            end = _uncompress(line.columns, end-pad-1) + 1 + pad/2
+            pos.append((coords[0] + int(start*scale), coords[1], coords[0] + int(end*scale), coords[3]))
             conf.append(c)
-        if bidi_reordering:
-            yield bidi_record(ocr_record(pred, pos, conf))
-        else:
-            yield ocr_record(pred, pos, conf)
+    if bidi_reordering:
+        return bidi_record(ocr_record(pred, pos, conf))
+    return ocr_record(pred, pos, conf)
 
 
 def _rpred_clstm(net, im, bounds, pad, bidi_reordering):
     for box, coords in extract_boxes(im, bounds):
+        metrics.inc('kraken_lines_total')
         if pad:
             colors = box.histogram()
             box = ImageOps.expand(
                 box, border=(16, 0),
                 fill=max(range(len(colors)), key=lambda x: colors[x]))
-        char_infos = list(net.model.recognize_chars(box))
+        with span('rpred.forward'):
+            char_infos = list(net.model.recognize_chars(box))
         pred = "".join(c.char for c in char_infos)
         pos = []
         conf = []
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Benjamin Kiessling
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Streaming writers for recognition results.
+
+Each writer consumes an iterable of kraken.rpred.ocr_record, e.g. the
+generator returned by kraken.rpred.rpred, and writes every line as soon as it
+is recognized instead of collecting the whole page first.
+"""
+
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+import json
+
+from kraken import html
+from kraken.lib.profiling import span
+
+
+def _flushing(records, fp, flush):
+    """
+    Yields records, flushing `fp` after every `flush` records. Flushing
+    happens before the next record is requested so written lines are visible
+    while the next line is being recognized.
+    """
+    it = iter(records)
+    idx = 0
+    while True:
+        if flush and idx and not idx % flush:
+            fp.flush()
+        try:
+            record = next(it)
+        except StopIteration:
+            break
+        yield record
+        idx += 1
+    fp.flush()
+
+
+def write_text(records, fp, flush=1):
+    """
+    Writes the predictions of records as lines of plain text.
+
+    Args:
+        records (iterable): Iterable of kraken.rpred.ocr_record
+        fp (file): File object opened in text mode
+        flush (int): Flush the file after this many lines. 0 flushes only at
+                     the end.
+
+    Returns:
+        Number of lines written.
+    """
+    idx = 0
+    for idx, record in enumerate(_flushing(records, fp, flush), 1):
+        with span('write.text'):
+            if idx > 1:
+                fp.write(u'\n')
+            fp.write(record.prediction)
+    return idx
+
+
+def write_hocr(records, fp, image_name=u'', image_size=(0, 0), flush=1):
+    """
+    Writes records as an hOCR document.
+
+    Args:
+        records (iterable): Iterable of kraken.rpred.ocr_record
+        fp (file): File object opened in text mode
+        image_name (unicode): Name of the source image
+        image_size (tuple): Dimensions of the source image
+        flush (int): Flush the file after this many lines. 0 flushes only at
+                     the end.
+
+    Returns:
+        Number of lines written.
+    """
+    count = [0]
+
+    def counted(records):
+        for record in records:
+            count[0] += 1
+            yield record
+
+    records = counted(_flushing(records, fp, flush))
+    # rendering the template pulls the records so only writing is measured
+    for chunk in html.hocr_stream(records, image_name, image_size):
+        with span('write.hocr'):
+            fp.write(chunk)
+    return count[0]
+
+
+def write_jsonl(records, fp, image_name=None, flush=1):
+    """
+    Writes records as JSON lines, one object per line containing the text,
+    bounding box, character cuts, and character confidences of the line.
+
+    Args:
+        records (iterable): Iterable of kraken.rpred.ocr_record
+        fp (file): File object opened in text mode
+        image_name (unicode): Name of the source image added to each object
+                              if given
+        flush (int): Flush the file after this many lines. 0 flushes only at
+                     the end.
+
+    Returns:
+        Number of lines written.
+    """
+    idx = 0
+    for idx, record in enumerate(_flushing(records, fp, flush), 1):
+        with span('write.jsonl'):
+            cuts = [[int(x) for x in cut] for cut in record.cuts]
+            obj = {'text': record.prediction,
+                   'bbox': list(html.max_bbox(cuts)) if cuts else None,
+                   'cuts': cuts,
+                   'confidences': [float(x) for x in record.confidences]}
+            if image_name is not None:
+                obj['image'] = image_name
+            fp.write(u'{}\n'.format(json.dumps(obj, sort_keys=True)))
+    return idx
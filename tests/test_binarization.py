@@ -4,9 +4,25 @@ from __future__ import absolute_import, division, print_function
 
 import unittest
 import os
+import warnings
+
+import numpy as np
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
 
 from PIL import Image
-from kraken.binarization import nlbin
+from nose.tools import raises
+from scipy.ndimage import filters, interpolation
+
+from kraken import binarization
+from kraken.binarization import (nlbin, nlbin_tiled, nlbin_batch, sauvola,
+                                 niblack, estimate_background,
+                                 estimate_thresholds)
+from kraken.lib.util import pil2array
+from kraken.lib.exceptions import KrakenInputException
 
 thisfile = os.path.abspath(os.path.dirname(__file__))
 resources = os.path.abspath(os.path.join(thisfile, 'resources'))
@@ -53,3 +69,161 @@ class TestBinarization(unittest.TestCase):
             self.assertEqual(254, res.histogram().count(0), msg='Output not '
                              'binarized')
        
+
+    def test_running_percentile(self):
+        """
+        Test that the histogram percentile filter matches scipy's.
+        """
+        im = np.random.RandomState(0).randint(0, 256, (60, 50)).astype('B')
+        for perc in (10, 50, 80, 100):
+            ref = filters.percentile_filter(im, perc, size=(20, 2))
+            res = binarization._running_percentile(im, perc, 20)
+            self.assertTrue((res == ref).all())
+
+    def test_estimate_background(self):
+        """
+        Test that the fast background estimate is close to the exact one.
+        """
+        with Image.open(os.path.join(resources, 'input.jpg')) as im:
+            image = pil2array(im.convert('L')) / 255.0
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            m = interpolation.zoom(image, 0.5)
+            m = filters.percentile_filter(m, 80, size=(20, 2))
+            m = filters.percentile_filter(m, 80, size=(2, 20))
+            m = interpolation.zoom(m, 2.0)
+        bg = estimate_background(image, 0.5, 80, 20)
+        self.assertEqual(bg.shape, image.shape)
+        h, w = np.minimum(image.shape, m.shape)
+        self.assertLess(np.abs(bg[:h, :w] - m[:h, :w]).mean(), 0.01)
+
+    def test_binarize_fast_background(self):
+        """
+        Test that binarization with the fast background estimate mostly
+        agrees with the exact one.
+        """
+        with Image.open(os.path.join(resources, 'input.jpg')) as im:
+            exact = np.array(nlbin(im))
+            fast = np.array(nlbin(im, fast_background=True))
+            self.assertEqual(exact.shape, fast.shape)
+            self.assertGreater((exact == fast).mean(), 0.99)
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc not available')
+    def test_binarize_memory(self):
+        """
+        Test that binarization stays within the documented peak memory use.
+        """
+        with Image.open(os.path.join(resources, 'input.jpg')) as im:
+            im.load()
+            for fast in (False, True):
+                tracemalloc.start()
+                try:
+                    nlbin(im, fast_background=fast)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                self.assertLess(peak, 14 * im.size[0] * im.size[1])
+
+    def test_binarize_tiled(self):
+        """
+        Test that tiled binarization of an array into an output array mostly
+        agrees with binarization of the whole page.
+        """
+        with Image.open(os.path.join(resources, 'input.jpg')) as im:
+            exact = np.array(nlbin(im))
+            raw = pil2array(im)
+        out = np.zeros(raw.shape[:2], 'B')
+        res = nlbin_tiled(raw, tile=1024, samples=4, output=out)
+        self.assertIs(res, out)
+        h, w = exact.shape
+        self.assertGreater((out[:h, :w] == exact).mean(), 0.99)
+
+    @raises(KrakenInputException)
+    def test_binarize_tiled_empty(self):
+        """
+        Test that tiled binarization of an empty page raises an exception.
+        """
+        nlbin_tiled(Image.new('L', (300, 300), 255), tile=128)
+
+    def test_local_stats(self):
+        """
+        Test that integral image window statistics match a box filter.
+        """
+        im = np.random.RandomState(0).randint(0, 256, (40, 50)).astype(np.float32)
+        mean, std = binarization._local_stats(im, 7)
+        ref_mean = filters.uniform_filter(im.astype(np.float64), 7)
+        ref_std = np.sqrt(filters.uniform_filter(im.astype(np.float64)**2, 7) - ref_mean**2)
+        self.assertTrue(np.allclose(mean[3:-3, 3:-3], ref_mean[3:-3, 3:-3], atol=1e-3))
+        self.assertTrue(np.allclose(std[3:-3, 3:-3], ref_std[3:-3, 3:-3], atol=1e-2))
+
+    def test_local_stats_stripes(self):
+        """
+        Test that statistics computed in stripes match the whole image.
+        """
+        im = np.random.RandomState(0).randint(0, 256, (100, 30)).astype(np.float32)
+        mean, std = binarization._local_stats(im, 15)
+        for stripe in (1, 7, 64):
+            s_mean, s_std = binarization._local_stats(im, 15, stripe)
+            self.assertTrue(np.allclose(s_mean, mean, atol=1e-3))
+            self.assertTrue(np.allclose(s_std, std, atol=1e-2))
+
+    def test_sauvola(self):
+        """
+        Tests Sauvola binarization of a color image.
+        """
+        with Image.open(os.path.join(resources, 'input.jpg')) as im:
+            res = sauvola(im)
+            self.assertEqual(res.mode, '1')
+            self.assertEqual(res.size, im.size)
+            ink = (np.array(res.convert('L')) == 0).mean()
+            self.assertTrue(0.01 < ink < 0.2)
+
+    def test_niblack(self):
+        """
+        Tests Niblack binarization of a grayscale image.
+        """
+        with Image.open(os.path.join(resources, 'input.jpg')) as im:
+            res = niblack(im.convert('L'))
+            self.assertEqual(res.mode, '1')
+            self.assertEqual(res.size, im.size)
+
+    def test_sauvola_blank(self):
+        """
+        Test that Sauvola binarization of a blank page produces no ink.
+        """
+        res = sauvola(Image.new('L', (200, 100), 230))
+        self.assertEqual(res.getextrema(), (255, 255))
+
+    def test_estimate_thresholds_single_page(self):
+        """
+        Test that thresholds estimated from a single page reproduce nlbin.
+        """
+        with Image.open(os.path.join(resources, 'input.jpg')) as im:
+            thresholds = estimate_thresholds([im], fast_background=True)
+            self.assertEqual(len(thresholds), 2)
+            self.assertLess(thresholds[0], thresholds[1])
+            self.assertEqual(nlbin(im, fast_background=True),
+                             nlbin(im, fast_background=True,
+                                   thresholds=thresholds))
+
+    def test_binarize_batch(self):
+        """
+        Tests batch binarization of images and image files in a worker pool.
+        """
+        path = os.path.join(resources, 'input.jpg')
+        with Image.open(path) as im:
+            thresholds = estimate_thresholds([im, path], fast_background=True)
+            ref = nlbin(im, fast_background=True, thresholds=thresholds)
+            res = list(nlbin_batch([im, path], processes=2,
+                                   fast_background=True))
+        self.assertEqual(len(res), 2)
+        for r in res:
+            self.assertEqual(r, ref)
+
+    @raises(KrakenInputException)
+    def test_estimate_thresholds_bw(self):
+        """
+        Test that estimating thresholds from bi-level pages raises an
+        exception.
+        """
+        estimate_thresholds([Image.new('1', (100, 100))])
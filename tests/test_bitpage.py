@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+import unittest
+import pickle
+import os
+
+import numpy as np
+
+from PIL import Image
+
+from kraken.lib.bitpage import BitPage
+
+thisfile = os.path.abspath(os.path.dirname(__file__))
+resources = os.path.abspath(os.path.join(thisfile, 'resources'))
+
+
+class TestBitPage(unittest.TestCase):
+
+    """
+    Tests of the packed bi-level page representation
+    """
+    def setUp(self):
+        rs = np.random.RandomState(23)
+        self.binary = np.array(rs.rand(37, 61) > 0.7, 'B')
+        self.binary[20, 3:60] = 1
+        self.page = BitPage.from_array(self.binary)
+
+    def test_roundtrip_array(self):
+        """
+        Test that packing and unpacking returns the original array.
+        """
+        self.assertEqual(self.page.shape, self.binary.shape)
+        self.assertTrue(np.array_equal(self.page.to_array(), self.binary))
+
+    def test_roundtrip_pil(self):
+        """
+        Test that mode '1' images are packed with black as ink and padding
+        bits cleared.
+        """
+        im = self.page.to_pil()
+        self.assertEqual(im.mode, '1')
+        page = BitPage.from_pil(im)
+        self.assertTrue(np.array_equal(page.bits, self.page.bits))
+
+    def test_from_pil_grayscale(self):
+        """
+        Test that mode '1' and 'L' versions of a page are packed identically.
+        """
+        with Image.open(os.path.join(resources, 'bw.png')) as im:
+            p1 = BitPage.from_pil(im)
+            p2 = BitPage.from_pil(im.convert('1'))
+            self.assertTrue(np.array_equal(p1.bits, p2.bits))
+
+    def test_serialization(self):
+        """
+        Test byte and pickle serialization.
+        """
+        page = BitPage.frombytes(self.page.tobytes(), self.page.shape)
+        self.assertTrue(np.array_equal(page.to_array(), self.binary))
+        page = pickle.loads(pickle.dumps(self.page))
+        self.assertTrue(np.array_equal(page.to_array(), self.binary))
+
+    def test_projections(self):
+        """
+        Test row and column projections against unpacked sums.
+        """
+        self.assertTrue(np.array_equal(self.page.row_projection(),
+                                       self.binary.sum(axis=1)))
+        self.assertTrue(np.array_equal(self.page.column_projection(),
+                                       self.binary.sum(axis=0)))
+
+    def test_crop(self):
+        """
+        Test cropping at aligned and unaligned offsets.
+        """
+        for box in ((0, 2, 17, 30), (8, 0, 61, 37), (3, 5, 50, 6)):
+            x0, y0, x1, y1 = box
+            crop = self.page.crop(box)
+            self.assertTrue(np.array_equal(crop.to_array(),
+                                           self.binary[y0:y1, x0:x1]))
+            self.assertTrue(np.array_equal(crop.column_projection(),
+                                           self.binary[y0:y1, x0:x1].sum(axis=0)))
+
+    def test_empty(self):
+        """
+        Test emptiness check.
+        """
+        self.assertFalse(self.page.is_empty())
+        self.assertTrue(BitPage.from_array(np.zeros((5, 13))).is_empty())
+
+    def test_hline_candidates(self):
+        """
+        Test that rows with long horizontal runs are found.
+        """
+        self.assertIn(20, self.page.hline_candidates(50))
+        self.assertEqual(len(self.page.hline_candidates(100)), 0)
+
+    def test_hline_candidates_unaligned(self):
+        """
+        Test that short runs not starting at a byte boundary are found.
+        """
+        binary = np.zeros((4, 40), 'B')
+        binary[1, 1:15] = 1
+        binary[2, 5:25] = 1
+        binary[3, 3:16] = 1
+        page = BitPage.from_array(binary)
+        self.assertEqual(list(page.hline_candidates(14)), [1, 2])
+        self.assertIn(2, page.hline_candidates(20))
+
+    def test_label(self):
+        """
+        Test that connected components are labelled on the unpacked page.
+        """
+        _, n = self.page.label()
+        self.assertEqual(len(self.page.find_objects()), n)
+
+    def test_find_objects(self):
+        """
+        Test that components are found at their position on the page.
+        """
+        binary = np.zeros((30, 50), 'B')
+        binary[5:9, 17:30] = 1
+        binary[20:22, 41:44] = 1
+        page = BitPage.from_array(binary)
+        self.assertEqual(page.find_objects(),
+                         [(slice(5, 9), slice(17, 30)),
+                          (slice(20, 22), slice(41, 44))])
+        self.assertEqual(BitPage.from_array(np.zeros((5, 13))).find_objects(),
+                         [])
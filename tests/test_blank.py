@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+import unittest
+import os
+
+import numpy as np
+
+from PIL import Image, ImageDraw
+from kraken.blank import is_blank, page_statistics
+
+thisfile = os.path.abspath(os.path.dirname(__file__))
+resources = os.path.abspath(os.path.join(thisfile, 'resources'))
+
+
+class TestBlank(unittest.TestCase):
+
+    """
+    Tests of blank page detection
+    """
+    def test_text_not_blank(self):
+        """
+        Test that pages containing text aren't blank.
+        """
+        for f in ('bw.png', 'input.jpg'):
+            with Image.open(os.path.join(resources, f)) as im:
+                self.assertFalse(is_blank(im))
+
+    def test_uniform_blank(self):
+        """
+        Test that uniform pages are blank.
+        """
+        self.assertTrue(is_blank(Image.new('L', (2000, 3000), 240)))
+        self.assertTrue(is_blank(Image.new('1', (2000, 3000), 1)))
+
+    def test_noise_blank(self):
+        """
+        Test that pages containing only scanner noise are blank.
+        """
+        a = np.random.RandomState(0).normal(230, 4, (3000, 2000))
+        im = Image.fromarray(np.clip(a, 0, 255).astype('B'))
+        self.assertTrue(is_blank(im))
+
+    def test_uneven_lighting_blank(self):
+        """
+        Test that pages with a lighting gradient but without text are blank.
+        """
+        a = np.linspace(150, 250, 2000)[None, :] * np.ones((3000, 1))
+        a += np.random.RandomState(0).normal(0, 3, a.shape)
+        im = Image.fromarray(np.clip(a, 0, 255).astype('B'))
+        self.assertTrue(is_blank(im))
+
+    def test_color_target_blank(self):
+        """
+        Test that color targets are blank.
+        """
+        im = Image.new('RGB', (2000, 3000), (235, 230, 220))
+        draw = ImageDraw.Draw(im)
+        for i, c in enumerate([(255, 0, 0), (0, 255, 0), (0, 0, 255),
+                               (0, 0, 0), (128, 128, 128)]):
+            draw.rectangle((100 + i*300, 1200, 350 + i*300, 1600), fill=c)
+        self.assertTrue(is_blank(im))
+
+    def test_modes(self):
+        """
+        Test that statistics don't depend on the color mode of a page.
+        """
+        with Image.open(os.path.join(resources, 'input.jpg')) as im:
+            ref = page_statistics(im.convert('L'))
+            for mode in ('RGB', 'P'):
+                stats = page_statistics(im.convert(mode))
+                self.assertAlmostEqual(stats['contrast'], ref['contrast'],
+                                       delta=0.02)
+                self.assertAlmostEqual(stats['components'],
+                                       ref['components'],
+                                       delta=0.05 * ref['components'])
+
+    def test_thresholds(self):
+        """
+        Test that the thresholds of the detection are tunable.
+        """
+        with Image.open(os.path.join(resources, 'bw.png')) as im:
+            stats = page_statistics(im)
+            self.assertEqual(set(stats), set(['contrast', 'std', 'components']))
+            self.assertTrue(is_blank(im, min_components=stats['components'] + 1))
+            self.assertFalse(is_blank(im, min_components=stats['components']))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+from click.testing import CliRunner
+from kraken.kraken import cli, page_refs
+
+thisfile = os.path.abspath(os.path.dirname(__file__))
+resources = os.path.abspath(os.path.join(thisfile, 'resources'))
+
+
+class TestCLI(unittest.TestCase):
+
+    """
+    Tests of the command line driver
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.runner = CliRunner()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_page_refs_multi_page(self):
+        """
+        Test that every frame of a multi-page input is referenced.
+        """
+        tif = os.path.join(self.dir, 'multi.tif')
+        pages = [Image.new('L', (100, 50), 20 * i) for i in range(3)]
+        pages[0].save(tif, save_all=True, append_images=pages[1:])
+        self.assertEqual(page_refs([(tif, 'out_{}.png')]),
+                         [(tif, 0), (tif, 1), (tif, 2)])
+
+    def test_binarize_sample_pages_manifest(self):
+        """
+        Test that thresholds are sampled from pages given in a manifest.
+        """
+        out = os.path.join(self.dir, 'out.png')
+        manifest = os.path.join(self.dir, 'manifest.tsv')
+        with io.open(manifest, 'w', encoding='utf-8') as fp:
+            fp.write(u'{}\t{}\n'.format(os.path.join(resources, 'input.jpg'),
+                                        out))
+        result = self.runner.invoke(cli, ['-c', '1', '--manifest', manifest,
+                                          'binarize', '--sample-pages', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertTrue(os.path.exists(out))
+
+    def test_ocr_stage_workers(self):
+        """
+        Test that more than one ocr worker is rejected.
+        """
+        result = self.runner.invoke(cli, ['-i',
+                                          os.path.join(resources, 'input.jpg'),
+                                          os.path.join(self.dir, 'out.txt'),
+                                          '--pipeline', '--stage-workers',
+                                          '1,1,2', 'binarize', 'segment',
+                                          'ocr', '-m',
+                                          os.path.join(resources,
+                                                       'model.pronn')])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('single worker', result.output)
+
+    def test_budget_failed_page(self):
+        """
+        Test that a supervised page raising an error is recorded as failed
+        and the remaining inputs are processed.
+        """
+        bad = os.path.join(self.dir, 'bad.png')
+        with open(bad, 'wb') as fp:
+            fp.write(b'not an image')
+        out = os.path.join(self.dir, 'out.png')
+        result = self.runner.invoke(cli, ['-c', '1', '-i', bad,
+                                          os.path.join(self.dir, 'bad_out.png'),
+                                          '-i',
+                                          os.path.join(resources, 'input.jpg'),
+                                          out, '--page-timeout', '300',
+                                          'binarize'])
+        self.assertEqual(result.exit_code, 1, result.output)
+        self.assertIn('Failed', result.output)
+        self.assertTrue(os.path.exists(out))
+
+    def test_binarize_segment_in_memory(self):
+        """
+        Test that pages binarized for the segmenter are segmented like the
+        binarized image.
+        """
+        bw = os.path.join(self.dir, 'bw.png')
+        lines = os.path.join(self.dir, 'lines.txt')
+        inp = os.path.join(resources, 'input.jpg')
+        result = self.runner.invoke(cli, ['-c', '1', '-i', inp, bw,
+                                          'binarize'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        result = self.runner.invoke(cli, ['-c', '1', '-i', inp, lines,
+                                          'binarize', 'segment'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        ref = os.path.join(self.dir, 'ref.txt')
+        result = self.runner.invoke(cli, ['-c', '1', '-i', bw, ref,
+                                          'segment'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(lines) as fp, open(ref) as ref_fp:
+            self.assertEqual(fp.read(), ref_fp.read())
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from future import standard_library
+standard_library.install_aliases()
+from urllib.request import urlopen
+
+from nose.tools import raises
+
+from kraken.lib import metrics, pipeline, profiling
+
+
+class TestMetrics(unittest.TestCase):
+
+    """
+    Tests of the metrics registry and its exports
+    """
+    def tearDown(self):
+        metrics.disable()
+
+    def test_disabled(self):
+        """
+        Test that updates are ignored while metrics are disabled.
+        """
+        metrics.inc('kraken_lines_total')
+        metrics.observe('no_such_metric', 1.0)
+        self.assertIsNone(metrics.registry)
+
+    def test_counter(self):
+        """
+        Test counters with and without labels.
+        """
+        reg = metrics.Registry()
+        c = reg.counter('test_total', 'Test counter')
+        l = reg.counter('test_labeled_total', 'Labeled counter', ('stage',))
+        c.inc()
+        c.inc(2)
+        l.inc(stage='a')
+        self.assertEqual(c.value(), 3)
+        self.assertEqual(l.value(stage='a'), 1)
+        text = reg.exposition()
+        self.assertIn('# TYPE test_total counter\ntest_total 3\n', text)
+        self.assertIn('test_labeled_total{stage="a"} 1\n', text)
+
+    @raises(ValueError)
+    def test_wrong_labels(self):
+        """
+        Test that missing labels are rejected.
+        """
+        reg = metrics.Registry()
+        reg.counter('test_total', 'Test counter', ('stage',)).inc()
+
+    def test_histogram(self):
+        """
+        Test cumulative histogram buckets.
+        """
+        reg = metrics.Registry()
+        h = reg.histogram('test_seconds', 'Test histogram', buckets=(0.1, 1))
+        for v in (0.05, 0.5, 0.7, 5):
+            h.observe(v)
+        text = reg.exposition()
+        self.assertIn('test_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('test_seconds_bucket{le="1.0"} 3\n', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 4\n', text)
+        self.assertIn('test_seconds_sum 6.25\n', text)
+        self.assertIn('test_seconds_count 4\n', text)
+
+    def test_enabled(self):
+        """
+        Test that kraken metrics and profiling spans are collected.
+        """
+        reg = metrics.enable()
+        metrics.inc('kraken_lines_total', 2)
+        with profiling.span('test.span'):
+            pass
+        list(pipeline.run(range(3), [(lambda x: x, 1)], name='test'))
+        self.assertEqual(reg.get('kraken_lines_total').value(), 2)
+        text = reg.exposition()
+        self.assertIn('kraken_span_seconds_count{span="test.span"} 1\n', text)
+        self.assertIn('kraken_queue_depth{pipeline="test",stage="0"} 0\n',
+                      text)
+
+    def test_serve(self):
+        """
+        Test the HTTP endpoint.
+        """
+        metrics.enable()
+        metrics.inc('kraken_pages_total')
+        server = metrics.serve(0)
+        try:
+            port = server.server_address[1]
+            res = urlopen('http://127.0.0.1:{}/metrics'.format(port))
+            self.assertTrue(res.headers['Content-Type'].startswith('text/'))
+            self.assertIn(b'kraken_pages_total 1\n', res.read())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_dump(self):
+        """
+        Test writing metrics to a file.
+        """
+        metrics.enable()
+        metrics.inc('kraken_pages_total')
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'kraken.prom')
+            dumper = metrics.Dumper(path, 60)
+            dumper.start()
+            dumper.stop()
+            with open(path) as fp:
+                self.assertIn('kraken_pages_total 1\n', fp.read())
+            self.assertEqual(os.listdir(tmp), ['kraken.prom'])
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_dump_permissions(self):
+        """
+        Test that dumped files are created with the permissions open() uses.
+        """
+        umask = os.umask(0o022)
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'kraken.prom')
+            metrics.dump(path, metrics.Registry())
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+        finally:
+            os.umask(umask)
+            shutil.rmtree(tmp)
+
+    def test_dump_interrupted(self):
+        """
+        Test that no temporary file is left behind if writing is interrupted.
+        """
+        class Interrupted(metrics.Registry):
+            def exposition(self):
+                raise KeyboardInterrupt()
+        tmp = tempfile.mkdtemp()
+        try:
+            with self.assertRaises(KeyboardInterrupt):
+                metrics.dump(os.path.join(tmp, 'kraken.prom'), Interrupted())
+            self.assertEqual(os.listdir(tmp), [])
+        finally:
+            shutil.rmtree(tmp)
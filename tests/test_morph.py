@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+import unittest
+
+import numpy as np
+
+from scipy.ndimage import morphology
+
+from kraken.lib import morph
+
+
+class TestMorph(unittest.TestCase):
+
+    """
+    Tests of the morphology helpers used by the page segmenter
+    """
+    def setUp(self):
+        rs = np.random.RandomState(42)
+        self.binary = np.array(rs.rand(200, 300) > 0.8, 'B')
+
+    def test_rb_dilation(self):
+        """
+        Test that linear filter dilation matches binary_dilation and returns
+        a uint8 mask.
+        """
+        res = morph.rb_dilation(self.binary, (5, 3))
+        self.assertEqual(res.dtype, np.dtype('B'))
+        ref = morphology.binary_dilation(self.binary, np.ones((5, 3)))
+        self.assertTrue(np.array_equal(res, ref))
+
+    def test_rb_erosion(self):
+        """
+        Test that linear filter erosion matches binary_erosion and returns a
+        uint8 mask.
+        """
+        binary = morph.rb_dilation(self.binary, (5, 5))
+        res = morph.rb_erosion(binary, (3, 3))
+        self.assertEqual(res.dtype, np.dtype('B'))
+        ref = morphology.binary_erosion(binary, np.ones((3, 3)),
+                                        border_value=1)
+        self.assertTrue(np.array_equal(res, ref))
+
+    def test_rb_output_buffer(self):
+        """
+        Test that a preallocated float32 buffer is reused.
+        """
+        output = np.empty(self.binary.shape, 'f')
+        res = morph.rb_dilation(self.binary, (3, 3), output=output)
+        self.assertTrue(np.array_equal(res, output > 0))
+
+    def test_spread_labels_bounded(self):
+        """
+        Test that stripe-wise label spreading is identical to spreading over
+        the whole image.
+        """
+        labels, _ = morph.label(self.binary)
+        distances, features = morphology.distance_transform_edt(labels == 0,
+                                                                return_indices=1)
+        ref = labels[features[0], features[1]] * (distances < 7.5)
+        res = morph.spread_labels(labels, maxdist=7.5, stripe=16)
+        self.assertTrue(np.array_equal(res, ref))
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+import gc
+import sys
+import unittest
+import warnings
+import tempfile
+import shutil
+import os
+
+from PIL import Image
+from kraken.lib.pages import frames, frame_count, load, prefetch
+
+thisfile = os.path.abspath(os.path.dirname(__file__))
+resources = os.path.abspath(os.path.join(thisfile, 'resources'))
+
+
+class TestPages(unittest.TestCase):
+
+    """
+    Tests of lazy iteration over multi-page inputs
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.tif = os.path.join(self.dir, 'multi.tif')
+        pages = [Image.new('L', (100 + 10 * i, 50), 20 * i) for i in range(5)]
+        pages[0].save(self.tif, save_all=True, append_images=pages[1:])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_frame_count(self):
+        """
+        Test frame counts of single and multi-page images.
+        """
+        self.assertEqual(frame_count(self.tif), 5)
+        self.assertEqual(frame_count(os.path.join(resources, 'bw.png')), 1)
+
+    @unittest.skipIf(sys.version_info[0] < 3, 'requires ResourceWarning')
+    def test_frame_count_closes(self):
+        """
+        Test that files opened for counting frames are closed.
+        """
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            frame_count(os.path.join(resources, 'bw.png'))
+            gc.collect()
+        self.assertFalse([x for x in w if
+                          issubclass(x.category, ResourceWarning)])
+
+    def test_frames(self):
+        """
+        Test that all frames of a multi-page TIFF are returned in order.
+        """
+        res = list(frames(self.tif))
+        self.assertEqual([idx for _, idx, _ in res], list(range(5)))
+        for _, idx, im in res:
+            self.assertEqual(im.size, (100 + 10 * idx, 50))
+            self.assertEqual(im.getpixel((0, 0)), 20 * idx)
+
+    def test_frames_sequence(self):
+        """
+        Test iteration over a sequence of files and images.
+        """
+        bw = os.path.join(resources, 'bw.png')
+        with Image.open(bw) as im:
+            res = [(src, idx) for src, idx, _ in frames(self.tif, bw, im)]
+        self.assertEqual(len(res), 7)
+        self.assertEqual(res[5], (bw, 0))
+        self.assertEqual(res[6][1], 0)
+
+    def test_load(self):
+        """
+        Test that images are decoded completely, optionally at reduced size.
+        """
+        jpg = os.path.join(self.dir, 'page.jpg')
+        Image.new('RGB', (800, 600), (255, 255, 255)).save(jpg)
+        im = load(jpg)
+        self.assertEqual(im.size, (800, 600))
+        self.assertIsNotNone(im.im)
+        im = load(jpg, ('L', (200, 150)))
+        self.assertEqual((im.mode, im.size), ('L', (200, 150)))
+
+    def test_prefetch(self):
+        """
+        Test that prefetched images are returned loaded and in order.
+        """
+        paths = []
+        for i in range(6):
+            paths.append(os.path.join(self.dir, '{}.png'.format(i)))
+            Image.new('L', (10 + i, 10)).save(paths[-1])
+        res = list(prefetch(paths, count=3))
+        self.assertEqual([im.size[0] for im in res], list(range(10, 16)))
@@ -5,10 +5,13 @@ from __future__ import absolute_import, division, print_function
 import unittest
 import os
 
+import numpy as np
+
 from PIL import Image
 from nose.tools import raises
 
-from kraken.pageseg import segment
+from kraken.pageseg import segment, segment_projection, compute_lines
+from kraken.binarization import nlbin
 from kraken.lib.exceptions import KrakenInputException
 
 thisfile = os.path.abspath(os.path.dirname(__file__))
@@ -43,3 +46,105 @@ class TestPageSeg(unittest.TestCase):
                 self.assertLess(0, box[1], msg='Line y0 < 0')
                 self.assertGreater(im.size[0], box[2], msg='Line x1 > {}'.format(im.size[0]))
                 self.assertGreater(im.size[1], box[3], msg='Line y1 > {}'.format(im.size[1]))
+
+    def test_segment_skip_blank(self):
+        """
+        Tests that blank pages aren't segmented with skip_blank.
+        """
+        im = Image.new('1', (1000, 1400), 1)
+        im.paste(0, (100, 600, 900, 640))
+        self.assertEqual(segment(im, skip_blank=True), [])
+        with Image.open(os.path.join(resources, 'bw.png')) as im:
+            self.assertEqual(segment(im, skip_blank=True), segment(im))
+
+    def test_compute_lines_runs(self):
+        """
+        Tests that run-length encoded line masks reproduce the lazily
+        computed mask.
+        """
+        seg = np.zeros((40, 60), 'i')
+        seg[5:15, 2:50] = 1
+        seg[8:12, 20:30] = 0
+        seg[20:35, 10:58] = 2
+        lines = compute_lines(seg, 5)
+        self.assertEqual([l.label for l in lines], [1, 2])
+        for l in lines:
+            rec = np.zeros_like(seg)
+            for y, x0, x1 in l.runs():
+                rec[y, x0:x1] = 1
+            self.assertTrue(np.array_equal(rec[l.bounds] == 1, l.mask))
+
+    def test_segment_threads(self):
+        """
+        Tests that threaded segmentation returns the same lines as serial
+        segmentation.
+        """
+        with Image.open(os.path.join(resources, 'bw.png')) as im:
+            self.assertEqual(segment(im), segment(im, threads=4))
+
+    def test_segment_fast_colseps(self):
+        """
+        Tests that column separators on a decimated page give the same lines
+        as convolution on a two column page.
+        """
+        with Image.open(os.path.join(resources, 'bw.png')) as im:
+            im = im.convert('L')
+            page = Image.new('L', (2*im.size[0] + 100, im.size[1]), 255)
+            page.paste(im, (0, 0))
+            page.paste(im, (im.size[0] + 100, 0))
+            self.assertEqual(segment(page), segment(page, fast_colseps=True))
+
+    def test_segment_column_regions(self):
+        """
+        Tests that segmenting the columns of a two column page independently
+        returns the same lines as segmenting the whole page.
+        """
+        with Image.open(os.path.join(resources, 'bw.png')) as im:
+            im = im.convert('L')
+            page = Image.new('L', (2*im.size[0] + 100, im.size[1]), 255)
+            page.paste(im, (0, 0))
+            page.paste(im, (im.size[0] + 100, 0))
+            self.assertEqual(segment(page), segment(page, column_regions=2))
+
+    def test_segment_column_regions_page(self):
+        """
+        Tests that segmenting a single column page with spurious separators in
+        regions returns the same lines as segmenting the whole page.
+        """
+        with Image.open(os.path.join(resources, 'input.jpg')) as im:
+            page = nlbin(im)
+        lines = segment(page)
+        self.assertEqual(lines, segment(page, column_regions=1))
+        self.assertEqual(lines, segment(page, column_regions=2))
+
+    @raises(KrakenInputException)
+    def test_segment_projection_color(self):
+        """
+        Test correct handling of color input by the projection segmenter.
+        """
+        with Image.open(os.path.join(resources, 'input.jpg')) as im:
+            segment_projection(im)
+
+    def test_segment_projection_bw(self):
+        """
+        Tests projection profile segmentation of bi-level input.
+        """
+        with Image.open(os.path.join(resources, 'bw.png')) as im:
+            lines = segment_projection(im)
+            self.assertAlmostEqual(len(lines), 30, msg='Segmentation differs '
+                                   'wildly from true line count', delta=5)
+            for box in lines:
+                self.assertLessEqual(0, box[0], msg='Line x0 < 0')
+                self.assertLessEqual(0, box[1], msg='Line y0 < 0')
+                self.assertGreaterEqual(im.size[0], box[2], msg='Line x1 > {}'.format(im.size[0]))
+                self.assertGreaterEqual(im.size[1], box[3], msg='Line y1 > {}'.format(im.size[1]))
+            # lines are sorted top to bottom and do not overlap
+            for l1, l2 in zip(lines, lines[1:]):
+                self.assertLessEqual(l1[3], l2[1])
+
+    def test_segment_projection_empty(self):
+        """
+        Tests that empty pages contain no lines.
+        """
+        im = Image.new('1', (200, 100), 1)
+        self.assertEqual(segment_projection(im), [])
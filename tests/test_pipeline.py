@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+import time
+import random
+import threading
+import unittest
+
+from nose.tools import raises
+
+from kraken.lib import pipeline
+
+
+def sleepy(fn):
+    def wrapper(x):
+        time.sleep(random.random() * 0.01)
+        return fn(x)
+    return wrapper
+
+
+class TestPipeline(unittest.TestCase):
+
+    """
+    Tests of the pipelined stage scheduler
+    """
+    def test_order(self):
+        """
+        Test that outputs are yielded in input order with multiple workers.
+        """
+        stages = [(sleepy(lambda x: x + 1), 3), (sleepy(lambda x: x * 2), 2)]
+        self.assertEqual(list(pipeline.run(range(50), stages)),
+                         [(x + 1) * 2 for x in range(50)])
+
+    def test_empty(self):
+        """
+        Test an empty input.
+        """
+        self.assertEqual(list(pipeline.run([], [(lambda x: x, 2)])), [])
+
+    def test_overlap(self):
+        """
+        Test that stages of different items run concurrently.
+        """
+        active = set()
+        overlap = []
+        lock = threading.Lock()
+
+        def stage(name):
+            def fn(x):
+                with lock:
+                    active.add(name)
+                    if len(active) > 1:
+                        overlap.append(x)
+                time.sleep(0.01)
+                with lock:
+                    active.discard(name)
+                return x
+            return fn
+        list(pipeline.run(range(10), [(stage('a'), 1), (stage('b'), 1)]))
+        self.assertTrue(overlap)
+
+    def test_bounded(self):
+        """
+        Test that the number of items in flight is limited.
+        """
+        consumed = []
+
+        def items():
+            for x in range(100):
+                consumed.append(x)
+                yield x
+        it = pipeline.run(items(), [(lambda x: x, 1)], queue_size=1)
+        next(it)
+        time.sleep(0.2)
+        self.assertLess(len(consumed), 10)
+        it.close()
+
+    @raises(ValueError)
+    def test_stage_error(self):
+        """
+        Test that exceptions in stages are raised by the consumer.
+        """
+        def fail(x):
+            if x == 5:
+                raise ValueError()
+            return x
+        list(pipeline.run(range(10), [(lambda x: x, 1), (fail, 2)]))
+
+    @raises(ValueError)
+    def test_input_error(self):
+        """
+        Test that exceptions raised by the input are raised by the consumer.
+        """
+        def items():
+            yield 1
+            raise ValueError()
+        list(pipeline.run(items(), [(lambda x: x, 1)]))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import time
+import unittest
+
+from kraken.lib import profiling
+
+
+@profiling.timed('test.decorated')
+def decorated(x):
+    return x + 1
+
+
+class TestProfiling(unittest.TestCase):
+
+    """
+    Tests of the instrumentation spans
+    """
+    def test_disabled(self):
+        """
+        Test that spans are no-ops without collectors.
+        """
+        self.assertIs(profiling.span('a'), profiling.span('b'))
+        self.assertEqual(decorated(1), 2)
+
+    def test_profile(self):
+        """
+        Test that spans are recorded and aggregated.
+        """
+        with profiling.profile() as prof:
+            for _ in range(3):
+                with profiling.span('test.outer'):
+                    with profiling.span('test.inner'):
+                        time.sleep(0.01)
+            self.assertEqual(decorated(1), 2)
+        with profiling.span('test.outer'):
+            pass
+        summary = prof.summary()
+        self.assertEqual(set(summary), set(['test.outer', 'test.inner',
+                                            'test.decorated']))
+        self.assertEqual(summary['test.outer']['count'], 3)
+        self.assertGreaterEqual(summary['test.inner']['min'], 0.01)
+        self.assertGreaterEqual(summary['test.outer']['total'],
+                                summary['test.inner']['total'])
+
+    def test_collector(self):
+        """
+        Test registering and removing custom collectors.
+        """
+        spans = []
+
+        def collector(name, start, duration):
+            spans.append(name)
+        profiling.add_collector(collector)
+        try:
+            with profiling.span('test.span'):
+                pass
+        finally:
+            profiling.remove_collector(collector)
+        with profiling.span('test.span'):
+            pass
+        self.assertEqual(spans, ['test.span'])
+
+    def test_dump(self):
+        """
+        Test the JSON trace output.
+        """
+        with profiling.profile() as prof:
+            with profiling.span('test.span'):
+                pass
+        fp = io.StringIO()
+        prof.dump(fp)
+        res = json.loads(fp.getvalue())
+        self.assertEqual(len(res['traceEvents']), 1)
+        self.assertEqual(res['traceEvents'][0]['name'], 'test.span')
+        self.assertEqual(res['traceEvents'][0]['ph'], 'X')
+        self.assertIn('test.span', res['summary'])
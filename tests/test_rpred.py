@@ -5,17 +5,30 @@ from __future__ import absolute_import, division, print_function
 import os
 import unittest
 
-from PIL import Image
+import numpy as np
+
+from PIL import Image, ImageDraw
 from nose.tools import raises
 
 from kraken.lib import lstm
-from kraken.rpred import rpred
+from kraken.rpred import rpred, compress_whitespace
 from kraken.lib.exceptions import KrakenInputException
 
 
 thisfile = os.path.abspath(os.path.dirname(__file__))
 resources = os.path.abspath(os.path.join(thisfile, 'resources'))
 
+
+class InkNetwork(object):
+    """
+    Fake network recognizing each run of ink columns as a character.
+    """
+    def predictString(self, line):
+        ink = np.amax(line, axis=1) > 0.5
+        self.outputs = np.vstack([~ink, ink]).T.astype('f')
+        return u'x' * len(lstm.translate_back_locations(self.outputs))
+
+
 class TestRecognition(unittest.TestCase):
 
     """
@@ -34,3 +47,65 @@ class TestRecognition(unittest.TestCase):
         """
         pred = rpred(None, self.im, [(-1, -1, 10000, 10000)])
         next(pred)
+
+    def test_compress_whitespace(self):
+        """
+        Tests trimming and shortening of blank columns.
+        """
+        line = np.full((10, 100), 255, dtype='B')
+        line[2:8, 20:25] = 0
+        line[2:8, 60:65] = 0
+        out, columns = compress_whitespace(line, 6)
+        self.assertEqual(out.shape, (10, 16))
+        self.assertEqual(columns[0], 20)
+        self.assertEqual(columns[-1], 64)
+        self.assertTrue(np.all(out == line[:, columns]))
+
+    def test_rpred_max_space_cuts(self):
+        """
+        Tests that cuts of compressed lines refer to page coordinates.
+        """
+        im = Image.new('L', (400, 40), 255)
+        draw = ImageDraw.Draw(im)
+        for x in (30, 200, 350):
+            draw.rectangle((x, 10, x + 9, 30), fill=0)
+        bounds = [(0, 0, 400, 40)]
+        ref = next(rpred(InkNetwork(), im, bounds, line_normalization=False,
+                         bidi_reordering=False))
+        for max_space in (1, 8):
+            pred = next(rpred(InkNetwork(), im, bounds,
+                              line_normalization=False, bidi_reordering=False,
+                              max_space=max_space))
+            self.assertEqual(pred.prediction, u'xxx')
+            self.assertEqual(pred.cuts, ref.cuts)
+
+    def test_rpred_bucket_lines(self):
+        """
+        Tests that lines recognized by width bucket are yielded in reading
+        order with the same results.
+        """
+        np.random.seed(0)
+        im = Image.fromarray((np.random.rand(20, 600) * 255).astype('B'))
+        network = lstm.SeqRecognizer(20, 5, codec=lstm.Codec().init(u'ab~'))
+        bounds = [(0, 0, 500, 20), (0, 0, 30, 20), (0, 0, 0, 0),
+                  (100, 0, 400, 20), (10, 0, 60, 20)]
+        kwargs = {'line_normalization': False, 'bidi_reordering': False}
+        ref = list(rpred(network, im, bounds, **kwargs))
+        pred = list(rpred(network, im, bounds, bucket_lines=True, **kwargs))
+        self.assertEqual([r.prediction for r in pred],
+                         [r.prediction for r in ref])
+        self.assertEqual([r.cuts for r in pred], [r.cuts for r in ref])
+        self.assertEqual(sorted(network.lstm.nets[0].nets[0].pool),
+                         [64, 128, 512, 1024])
+
+    def test_rpred_skip_blank(self):
+        """
+        Tests that no lines of blank pages are recognized with skip_blank.
+        """
+        im = Image.new('L', (600, 20), 255)
+        network = lstm.SeqRecognizer(20, 5, codec=lstm.Codec().init(u'ab~'))
+        kwargs = {'line_normalization': False, 'bidi_reordering': False}
+        self.assertEqual(len(list(rpred(network, im, [(0, 0, 500, 20)],
+                                        **kwargs))), 1)
+        self.assertEqual(list(rpred(network, im, [(0, 0, 500, 20)],
+                                    skip_blank=True, **kwargs)), [])
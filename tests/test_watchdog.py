@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import time
+import unittest
+
+import numpy as np
+
+from nose.tools import raises
+
+from kraken.lib import metrics
+from kraken.lib import profiling
+from kraken.lib import watchdog
+from kraken.lib.exceptions import KrakenBudgetException, KrakenWorkerException
+
+
+def stages(checkpoint):
+    checkpoint('fast')
+    checkpoint('slow')
+    time.sleep(10)
+
+
+class TestWatchdog(unittest.TestCase):
+
+    """
+    Tests of supervised execution with time and memory budgets
+    """
+    def test_result(self):
+        """
+        Test that the return value of the function is returned.
+        """
+        self.assertEqual(watchdog.supervise(lambda checkpoint: [1, 2]), [1, 2])
+
+    @raises(ZeroDivisionError)
+    def test_exception(self):
+        """
+        Test that exceptions of the function are reraised.
+        """
+        watchdog.supervise(lambda checkpoint: 1 / 0)
+
+    def test_timeout(self):
+        """
+        Test that a worker exceeding its time budget is killed.
+        """
+        st_time = time.time()
+        with self.assertRaises(KrakenBudgetException):
+            watchdog.supervise(lambda checkpoint: time.sleep(10), timeout=0.2)
+        self.assertLess(time.time() - st_time, 5)
+
+    def test_stage_timeout(self):
+        """
+        Test that stage budgets only apply to the stages they are given for.
+        """
+        with self.assertRaises(KrakenBudgetException) as cm:
+            watchdog.supervise(stages, stage_timeout={'fast': 0.01,
+                                                      'slow': 0.2})
+        self.assertIn('slow', str(cm.exception))
+
+    @unittest.skipUnless(os.path.exists('/proc/self/status'),
+                         'requires /proc')
+    def test_memory(self):
+        """
+        Test that a worker exceeding its memory budget is killed.
+        """
+        def allocate(checkpoint):
+            checkpoint('allocate')
+            x = np.ones(2**27)
+            time.sleep(10)
+            return x.sum()
+        with self.assertRaises(KrakenBudgetException) as cm:
+            watchdog.supervise(allocate, memory=2**29)
+        self.assertIn('allocate', str(cm.exception))
+
+    @unittest.skipUnless(os.path.exists('/proc/self/status'),
+                         'requires /proc')
+    def test_memory_shared(self):
+        """
+        Test that memory held by the parent doesn't count against the budget
+        of a worker.
+        """
+        parent = np.ones(2**25)
+        self.assertEqual(watchdog.supervise(lambda checkpoint: (time.sleep(0.3),
+                                                                parent[0])[1],
+                                            memory=2**26, interval=0.01), 1)
+
+    @raises(KrakenWorkerException)
+    def test_worker_died(self):
+        """
+        Test that a worker terminating without a result raises an exception.
+        """
+        watchdog.supervise(lambda checkpoint: os._exit(1))
+
+    def test_spans(self):
+        """
+        Test that profiling spans of the worker are collected.
+        """
+        def work(checkpoint):
+            with profiling.span('work'):
+                time.sleep(0.01)
+        with profiling.profile() as prof:
+            watchdog.supervise(work)
+        self.assertEqual(prof.summary()['work']['count'], 1)
+
+    def test_counters(self):
+        """
+        Test that counter increments of the worker are applied to the
+        registry of the parent.
+        """
+        reg = metrics.enable()
+        try:
+            metrics.inc('kraken_lines_total', 2)
+            watchdog.supervise(lambda checkpoint:
+                               metrics.inc('kraken_lines_total', 3))
+            self.assertEqual(reg.get('kraken_lines_total').value(), 5)
+        finally:
+            metrics.disable()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import unittest
+
+from kraken import html
+from kraken import writers
+
+
+class record(object):
+    """
+    Stand-in for kraken.rpred.ocr_record.
+    """
+    def __init__(self, prediction, cuts, confidences):
+        self.prediction = prediction
+        self.cuts = cuts
+        self.confidences = confidences
+
+
+class FlushCounter(io.StringIO):
+    """
+    StringIO recording the contents at every flush.
+    """
+    def __init__(self):
+        super(FlushCounter, self).__init__()
+        self.flushed = []
+
+    def flush(self):
+        self.flushed.append(self.getvalue())
+        super(FlushCounter, self).flush()
+
+
+def records():
+    return [record('ab', [(0, 0, 10, 20), (10, 0, 20, 20)], [0.5, 1.0]),
+            record('c d', [(0, 30, 10, 50), (10, 30, 15, 50),
+                           (15, 30, 25, 50)], [0.25, 1.0, 0.75])]
+
+
+class TestWriters(unittest.TestCase):
+
+    """
+    Tests of the streaming output writers
+    """
+    def test_text(self):
+        """
+        Test plain text output.
+        """
+        fp = io.StringIO()
+        self.assertEqual(writers.write_text(records() + [record('', [], [])],
+                                            fp), 3)
+        self.assertEqual(fp.getvalue(), 'ab\nc d\n')
+
+    def test_jsonl(self):
+        """
+        Test JSON lines output.
+        """
+        fp = io.StringIO()
+        self.assertEqual(writers.write_jsonl(records() + [record('', [], [])],
+                                             fp, 'foo.png'), 3)
+        lines = [json.loads(l) for l in fp.getvalue().splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0], {'text': 'ab', 'bbox': [0, 0, 20, 20],
+                                    'cuts': [[0, 0, 10, 20], [10, 0, 20, 20]],
+                                    'confidences': [0.5, 1.0],
+                                    'image': 'foo.png'})
+        self.assertIsNone(lines[2]['bbox'])
+
+    def test_hocr(self):
+        """
+        Test that streamed hOCR is identical to html.hocr.
+        """
+        fp = io.StringIO()
+        self.assertEqual(writers.write_hocr(records(), fp, 'foo.png',
+                                            (100, 200)), 2)
+        self.assertEqual(fp.getvalue(),
+                         html.hocr(records(), 'foo.png', (100, 200)))
+
+    def test_streaming(self):
+        """
+        Test that lines are written before the next one is requested.
+        """
+        fp = io.StringIO()
+        seen = []
+
+        def gen():
+            for r in records():
+                seen.append(fp.getvalue())
+                yield r
+        writers.write_text(gen(), fp)
+        self.assertEqual(seen, ['', 'ab'])
+
+    def test_flush(self):
+        """
+        Test the flush interval.
+        """
+        fp = FlushCounter()
+        writers.write_jsonl(records() * 2, fp, flush=3)
+        self.assertEqual([len(x.splitlines()) for x in fp.flushed], [3, 4])
+        fp = FlushCounter()
+        writers.write_text(records(), fp, flush=0)
+        self.assertEqual(fp.flushed, ['ab\nc d'])